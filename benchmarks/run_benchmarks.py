@@ -0,0 +1,334 @@
+""" Times every stage of the route pipeline on synthetic routes.
+
+    Usage, from the repository root;
+
+        python -m benchmarks.run_benchmarks --output results.json
+        python -m benchmarks.run_benchmarks --compare results.json
+
+    Each benchmark is run at route sizes from 1e2 to 1e6 vertices (see
+    --sizes). A benchmark stops growing once one run takes longer than
+    --max-seconds, so the slow stages don't hold up the rest. Results
+    are saved as JSON, with the best and median time of each
+    (benchmark, size) and the fitted growth exponent of each benchmark.
+    With --compare the run is checked against an earlier results file,
+    and the exit status is 1 if any benchmark got slower by more than
+    --threshold.
+    """
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from route_dynamics import __version__
+from route_dynamics.route_elevation import base
+from route_dynamics.route_elevation.elevation import ElevationSampler
+from route_dynamics.route_energy import constant_a as ca
+from route_dynamics.route_energy import knn
+from route_dynamics.route_energy import longi_dynam_model as ldm
+
+from . import synthetic
+
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+
+
+def _route_shp(inputs):
+    return base.read_shape(inputs['shapefile'], inputs['route_num'])
+
+
+def _stop_indicies(inputs):
+    indicies, _ = knn.find_knn(1, inputs['coordinates'], inputs['stop_coords'])
+    return indicies.ravel()
+
+
+def bench_distance_measure(inputs):
+    route_shp = _route_shp(inputs)
+    return lambda: base.distance_measure(route_shp)
+
+
+def bench_gradient(inputs):
+    route_shp = _route_shp(inputs)
+    return lambda: base.gradient(route_shp, inputs['rasterfile'])
+
+
+def bench_gradient_sampler(inputs):
+    route_shp = _route_shp(inputs)
+    sampler = ElevationSampler(inputs['rasterfile'])
+    return lambda: base.gradient(route_shp, sampler)
+
+
+def bench_find_knn(inputs):
+    return lambda: knn.find_knn(1, inputs['coordinates'], inputs['stop_coords'])
+
+
+def bench_const_a_dynamics(inputs):
+    distance, _ = base.distance_measure(_route_shp(inputs))
+    is_bus_stop = np.zeros(len(inputs['coordinates']), dtype=bool)
+    is_bus_stop[_stop_indicies(inputs)] = True
+
+    route_df = pd.DataFrame({
+        'distance_from_last_point': np.append(np.nan, distance),
+        'is_bus_stop': is_bus_stop,
+        })
+
+    return lambda: ca.const_a_dynamics(route_df, 1.0, 15.0)
+
+
+def bench_calculate_mass(inputs):
+    # A RouteTrajectory with just the attributes calculate_mass reads,
+    # so nothing else is timed.
+    stop_coords = inputs['stop_coords']
+    trajectory = ldm.RouteTrajectory.__new__(ldm.RouteTrajectory)
+    trajectory._initialize_instance_args(
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        a_m=1.0,
+        v_lim=15.0,
+        stop_coords=stop_coords,
+        mass_array=np.linspace(13000, 19000, len(stop_coords)),
+        unloaded_bus_mass=12927,
+        charging_power_max=0.,
+        )
+    trajectory.route_df = pd.DataFrame(index=range(len(inputs['coordinates'])))
+    trajectory.stop_nn_indicies = _stop_indicies(inputs)
+
+    return lambda: trajectory.calculate_mass(
+        alg='list_per_stop',
+        len_check=True,
+        )
+
+
+def bench_route_trajectory(inputs):
+    stop_coords = inputs['stop_coords']
+    mass_array = np.linspace(13000, 19000, len(stop_coords))
+
+    return lambda: ldm.RouteTrajectory(
+        inputs['route_num'],
+        inputs['shapefile'],
+        inputs['rasterfile'],
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=stop_coords,
+        mass_array=mass_array,
+        )
+
+
+BENCHMARKS = OrderedDict([
+    ('distance_measure', bench_distance_measure),
+    ('gradient', bench_gradient),
+    ('gradient_sampler', bench_gradient_sampler),
+    ('find_knn', bench_find_knn),
+    ('const_a_dynamics', bench_const_a_dynamics),
+    ('calculate_mass', bench_calculate_mass),
+    ('route_trajectory', bench_route_trajectory),
+    ])
+
+
+def time_call(func, repeat):
+    """ Wall times of 'repeat' calls of 'func' [s]. """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def growth_exponent(sizes, times):
+    """ Slope of log(time) against log(size); about 1 for linear
+        stages, 2 for quadratic ones. None with fewer than two sizes.
+        """
+
+    if len(sizes) < 2:
+        return None
+
+    slope, _ = np.polyfit(np.log(sizes), np.log(times), 1)
+
+    return float(slope)
+
+
+def run(sizes=DEFAULT_SIZES, benchmarks=None, repeat=3, max_seconds=30.,
+    data_dir=None, log=print):
+    """
+        Runs the benchmarks.
+
+        Parameters
+        ----------
+        sizes: route sizes (number of vertices)
+        benchmarks: names of the benchmarks to run (DEFAULT = all)
+        repeat: timed calls per (benchmark, size), after one warm up
+        max_seconds: a benchmark is not run at larger sizes once one
+            call takes longer than this
+        data_dir: where the synthetic inputs are written (DEFAULT =
+            a temporary directory)
+        log: called with a progress line per result
+
+        Returns
+        -------
+        results: dict with 'metadata', 'results' (one record per
+            benchmark and size) and 'growth' (exponent per benchmark)
+        """
+
+    if benchmarks is None:
+        benchmarks = list(BENCHMARKS)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = data_dir or tmp_dir
+        inputs = {
+            size: synthetic.make_inputs(data_dir, size) for size in sizes
+            }
+
+        records = []
+        growth = OrderedDict()
+
+        for name in benchmarks:
+            run_sizes, best_times = [], []
+
+            for size in sorted(sizes):
+                func = BENCHMARKS[name](inputs[size])
+
+                warm_up = time_call(func, 1)[0]
+                if warm_up > max_seconds:
+                    times = [warm_up]
+                else:
+                    times = time_call(func, repeat)
+
+                record = OrderedDict([
+                    ('benchmark', name),
+                    ('size', size),
+                    ('best', min(times)),
+                    ('median', statistics.median(times)),
+                    ('repeat', len(times)),
+                    ])
+                records.append(record)
+                run_sizes.append(size)
+                best_times.append(record['best'])
+
+                log('{:<20} {:>9} {:>12.6f} s'.format(name, size, record['best']))
+
+                if max(times) > max_seconds:
+                    log('{:<20} stopping, over {} s'.format(name, max_seconds))
+                    break
+
+            growth[name] = growth_exponent(run_sizes, best_times)
+
+    return OrderedDict([
+        ('metadata', metadata(repeat, max_seconds)),
+        ('results', records),
+        ('growth', growth),
+        ])
+
+
+def metadata(repeat, max_seconds):
+    """ Where and when the results were taken. """
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return OrderedDict([
+        ('timestamp', datetime.datetime.now().isoformat(timespec='seconds')),
+        ('commit', commit),
+        ('route_dynamics', __version__),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('platform', platform.platform()),
+        ('repeat', repeat),
+        ('max_seconds', max_seconds),
+        ])
+
+
+def compare(results, baseline, threshold=1.25):
+    """
+        Compares two results dicts (as saved by this module).
+
+        Returns
+        -------
+        rows: list of (benchmark, size, baseline best, best, ratio)
+            for every (benchmark, size) in both
+        regressions: the rows with ratio above 'threshold'
+        """
+
+    baseline_best = {
+        (record['benchmark'], record['size']): record['best']
+        for record in baseline['results']
+        }
+
+    rows = []
+    for record in results['results']:
+        key = (record['benchmark'], record['size'])
+        if key in baseline_best:
+            ratio = record['best'] / baseline_best[key]
+            rows.append(key + (baseline_best[key], record['best'], ratio))
+
+    regressions = [row for row in rows if row[-1] > threshold]
+
+    return rows, regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=30.)
+    parser.add_argument('--data-dir', help='keep the synthetic inputs here')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier results JSON to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+        help='slowdown ratio counted as a regression (DEFAULT 1.25)')
+    args = parser.parse_args(argv)
+
+    results = run(
+        sizes=args.sizes,
+        benchmarks=args.benchmarks,
+        repeat=args.repeat,
+        max_seconds=args.max_seconds,
+        data_dir=args.data_dir,
+        )
+
+    print('\ngrowth exponents (time ~ size**k)')
+    for name, exponent in results['growth'].items():
+        print('{:<20} {}'.format(
+            name, 'n/a' if exponent is None else '{:.2f}'.format(exponent)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.threshold)
+
+        print('\n{:<20} {:>9} {:>12} {:>12} {:>7}'.format(
+            'benchmark', 'size', 'baseline', 'now', 'ratio'))
+        for name, size, before, now, ratio in rows:
+            flag = '  <-- slower' if ratio > args.threshold else ''
+            print('{:<20} {:>9} {:>12.6f} {:>12.6f} {:>7.2f}{}'.format(
+                name, size, before, now, ratio, flag))
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+""" Synthetic routes, bus stops and elevation rasters for benchmarking.
+
+    The real DTM ('seattle_dtm.tif') is not shipped, so the benchmarks
+    build their own inputs. Routes are Lissajous curves inside a fixed
+    box in Seattle, so the raster stays the same size however many
+    vertices the route has, and the elevation is a smooth surface so
+    gradients are realistic.
+    """
+import os
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from affine import Affine
+from shapely.geometry import LineString
+
+
+# Box the synthetic routes live in, (west, south, east, north).
+BOUNDS = (-122.40, 47.55, -122.30, 47.65)
+
+# Raster cell size [degrees], about 10 m.
+RESOLUTION = 1e-4
+
+
+def route_coordinates(num_pts, bounds=BOUNDS):
+    """ (num_pts, 2) array of (lon, lat) along a Lissajous curve that
+        fills 'bounds'.
+        """
+
+    west, south, east, north = bounds
+    t = np.linspace(0, 2*np.pi, num_pts)
+
+    lon = west + (east - west) * (0.5 + 0.45*np.sin(3*t + np.pi/2))
+    lat = south + (north - south) * (0.5 + 0.45*np.sin(4*t))
+
+    return np.column_stack([lon, lat])
+
+
+def stop_coordinates(coordinates, spacing=40, seed=0):
+    """ Bus stops every 'spacing' route points on average, at the route
+        vertices nudged by up to a metre.
+        """
+
+    rng = np.random.default_rng(seed)
+    num_pts = len(coordinates)
+
+    num_stops = max(2, num_pts // spacing)
+    stop_idx = np.sort(rng.choice(num_pts, size=num_stops, replace=False))
+
+    return coordinates[stop_idx] + rng.uniform(-1e-5, 1e-5, (num_stops, 2))
+
+
+def write_route_shapefile(filename, coordinates, route_num=1):
+    """ Writes a single route shapefile in the layout of
+        'data/six_routes.shp'.
+        """
+
+    route = gpd.GeoDataFrame(
+        {
+            'ROUTE_NUM': [route_num],
+            'SHAPE_Leng': [0.],
+            },
+        geometry=[LineString(coordinates)],
+        crs='EPSG:4326',
+        )
+    route.to_file(filename)
+
+    return filename
+
+
+def write_elevation_raster(filename, bounds=BOUNDS, resolution=RESOLUTION):
+    """ Writes a tiled float32 GeoTIFF of a smooth 'elevation' [ft]
+        surface, with a 20 cell margin around 'bounds'.
+        """
+
+    west, south, east, north = bounds
+    width = int(round((east - west) / resolution)) + 40
+    height = int(round((north - south) / resolution)) + 40
+    transform = Affine(
+        resolution, 0, west - 20*resolution,
+        0, -resolution, north + 20*resolution,
+        )
+
+    rows, cols = np.mgrid[0:height, 0:width]
+    data = (
+        300
+        + 150*np.sin(rows / 90.)
+        + 100*np.cos(cols / 60.)
+        + 5*np.sin(rows / 7.)*np.cos(cols / 5.)
+        ).astype('float32')
+
+    with rasterio.open(
+        filename, 'w', driver='GTiff', height=height, width=width,
+        count=1, dtype='float32', crs='EPSG:4326', transform=transform,
+        nodata=-9999., tiled=True, blockxsize=256, blockysize=256,
+        ) as dst:
+        dst.write(data, 1)
+
+    return filename
+
+
+def make_inputs(directory, num_pts, route_num=1, stop_spacing=40):
+    """ Writes the route shapefile and raster for a route of 'num_pts'
+        vertices to 'directory' (the raster is shared between sizes).
+
+        Returns:
+            dict with 'shapefile', 'rasterfile', 'route_num',
+            'coordinates' and 'stop_coords'
+        """
+
+    os.makedirs(directory, exist_ok=True)
+
+    coordinates = route_coordinates(num_pts)
+
+    shapefile = os.path.join(directory, 'route_{}.shp'.format(num_pts))
+    if not os.path.exists(shapefile):
+        write_route_shapefile(shapefile, coordinates, route_num)
+
+    rasterfile = os.path.join(directory, 'synthetic_dtm.tif')
+    if not os.path.exists(rasterfile):
+        write_elevation_raster(rasterfile)
+
+    return {
+        'shapefile': shapefile,
+        'rasterfile': rasterfile,
+        'route_num': route_num,
+        'coordinates': coordinates,
+        'stop_coords': stop_coordinates(coordinates, spacing=stop_spacing),
+        }
@@ -5,15 +5,17 @@ import branca.colormap as cm
 import folium
 import rasterstats
 import matplotlib.pyplot as plt
+import shapely
 
 from folium.features import GeoJson
-from shapely.geometry import mapping
-from shapely.geometry import LineString
 from shapely.geometry import Polygon
 # from rasterio.mask import mask
-from geopy.distance import geodesic
 
+from . import geodesic
+from ..timing import timed
 
+
+@timed('read_shape')
 def read_shape(shapefile, route_num):
     """
         Loads shapefile into GeoDataFrame and selects desired route by
@@ -21,7 +23,8 @@ def read_shape(shapefile, route_num):
 
         Parameters
         ----------
-        shapefile: route geospatial data (.shp file)
+        shapefile: route geospatial data (.shp file), or a
+            route_store.RouteStore, which reads only the one route.
         route_num: route number (integer)
 
         Returns
@@ -30,6 +33,9 @@ def read_shape(shapefile, route_num):
             'route_num'
         """
 
+    if hasattr(shapefile, 'load_route'):
+        return shapefile.load_route(route_num)
+
     routes_shp = gpd.read_file(shapefile)
     route_shp = routes_shp[routes_shp['ROUTE_NUM'] == route_num]
     return route_shp
@@ -51,27 +57,36 @@ def extract_point_df(route_shp):
             every point along the route.
         """
 
-    # list shapely geometries intrinsic to a GeoDataFrame,
-    # and store values only in nd.array
-    route_geometry = route_shp.geometry.values
-
-    # Convert Linestring object into dictionary with keys 'type' and
-    # 'coordinates', the second containing a tuple of 3D coordinate
-    # tuples that we use to build the route coordinate dataframe.
-    route_geometry = [mapping(route_geometry[0])]
-
-    # Return route coordinates in seperate pd.DataFrame.
-    # Coordinates are first row with name 'coordinates'
-    coordinates_route = route_geometry[0]['coordinates']
-    linestring_route = []
-    for i in range(len(coordinates_route)):
-        linestring_route.append(coordinates_route[i][:2])
-        linestring_route_df = pd.DataFrame()
-        linestring_route_df['coordinates'] = linestring_route
+    # Return route coordinates in seperate pd.DataFrame, as tuples of
+    # 2D coordinates in column 'coordinates'.
+    coordinates_route = extract_point_array(route_shp)
+    linestring_route_df = pd.DataFrame()
+    linestring_route_df['coordinates'] = list(map(tuple, coordinates_route.tolist()))
     return linestring_route_df
 
 
-def distance_measure(route_shp):
+def extract_point_array(route_shp):
+    """
+        Extracts 2D coordinates from route GeoDataFrame for all points
+        along the route as a single array.
+
+        Parameters
+        ----------
+        route_shp: GeoDataFrame for the selected route;
+            output of read_shape().
+
+        Returns
+        -------
+        coordinates: array of shape (n, 2) with the (x, y) coordinates
+            of every point along the route.
+        """
+
+    route_geometry = route_shp.geometry.values[0]
+    return np.asarray(route_geometry.coords, dtype=float)[:, :2]
+
+
+@timed('distance_measure')
+def distance_measure(route_shp, method='vincenty'):
     """
         Calculates the distance between points along the route and
         calculates the cumulative distance. ASSUMES geodesic distances
@@ -81,10 +96,13 @@ def distance_measure(route_shp):
         ----------
         route_shp: GeoDataFrame for the selected route;
         output of read_shape().
+        method: 'vincenty' (DEFAULT) matches geopy.distance.geodesic to
+            sub-millimetre accuracy, 'flat' is a faster ellipsoidal
+            approximation (see route_elevation.geodesic for error bound).
 
         Returns
         -------
-        distance: list containing the distance between each point.
+        distance: array containing the distance between each point.
          In units = [meters].
         cum_distance: array of the total route distance at each point
         along the route (e.g. the first point will have a distance
@@ -92,21 +110,12 @@ def distance_measure(route_shp):
         distance). In units = [meters]
         """
 
-    # Convert GeoDataFrame to simple pd.DataFrame containing only
-    # list of 2D coordinates along route.
-    lines_gdf = extract_point_df(route_shp)
-
-    # Calculate distance from one point to the next
-    distance = []
-    for idx in range(len(lines_gdf)-1):
-        # x and y coordinates
-        coordinate_1 = lines_gdf.loc[idx]['coordinates']
-        coordinate_2 = lines_gdf.loc[idx + 1]['coordinates']
-        # organize into tuples as: (Latatude, Longetude)
-        swap_coord_1 = (coordinate_1[1], coordinate_1[0])
-        swap_coord_2 = (coordinate_2[1], coordinate_2[0])
-        # Calculate geodesic distances in meters and add to list
-        distance.append(geodesic(swap_coord_1,swap_coord_2).m)
+    # Array of 2D coordinates along route, (longitude, latitude).
+    coordinates = extract_point_array(route_shp)
+
+    # Calculate distance from one point to the next for all points at
+    # once.
+    distance = geodesic.segment_distances(coordinates, method=method)
 
     # Calculate cumulative sum of distances along route with zero at
     # the beginning of the list for first point
@@ -115,6 +124,21 @@ def distance_measure(route_shp):
     return distance, cum_distance
 
 
+@timed('point_query')
+def _point_query(route_shp, rasterfile):
+    """
+        Samples the raster at every vertex of 'route_shp'. Elevation
+        samplers are queried directly, anything else is treated as a
+        raster file and handed to rasterstats.
+        """
+
+    if hasattr(rasterfile, 'point_query'):
+        return rasterfile.point_query(route_shp)
+
+    return rasterstats.point_query(route_shp, rasterfile)
+
+
+@timed('gradient')
 def gradient(route_shp, rasterfile):
     """
         Calculates the elevation and road grade at each point along the route.
@@ -123,7 +147,9 @@ def gradient(route_shp, rasterfile):
         ----------
         route_shp: GeoDataFrame for the selected route;
         output of read_shape().
-        rasterfile: elevation data file (.tif)
+        rasterfile: elevation data file (.tif), or an elevation sampler
+            (e.g. elevation.ElevationSampler) that stays open between
+            calls.
 
         Returns
         -------
@@ -140,7 +166,7 @@ def gradient(route_shp, rasterfile):
 
     # 'point_query' returns the values defined in the 'rasterfild'
     # at the points defined within the GeoDataFrame 'route_shp'
-    elevation = rasterstats.point_query(route_shp, rasterfile)
+    elevation = _point_query(route_shp, rasterfile)
 
     # Convert elevations to meters
     elevation_meters = np.asarray(elevation) * 0.3048
@@ -169,36 +195,34 @@ def gradient(route_shp, rasterfile):
     return elevation_meters, route_gradient, route_cum_distance, route_distance
 
 
-def _make_lines(gdf, idx, geometry = 'geometry'):
+def _segment_lines(coordinates):
     """
-        Creates a line between each point; iterative function for
-        make_multi_lines(), so it is not called directly.
+        Creates a line between each point and the next.
 
         Parameters
         ----------
-        gdf: DataFrame of coordinates; output of extract_pts_df()
-        gradient: the road grade (e.g. slope) at each point along the route; output of gradient()
-        idx: index
-        geometry: DEFAULT = 'geometry'
+        coordinates: array of shape (n, 2) of route coordinates
 
         Returns
         -------
-        df_line: DataFrame containing the line segments
+        lin_col: object array of length n, None for the first point
+            followed by shapely LineStrings connecting each point to
+            the one before it.
         """
 
-    coordinate_1 = gdf.loc[idx]['coordinates']
-    coordinate_2 = gdf.loc[idx + 1]['coordinates']
-    # Create shapely.Line object connection coordinates
-    line = LineString([coordinate_1, coordinate_2])
-    # # Organize gradient input argument with shapely.Line for insertion
-    # # into output DataFrame.
-    # data = {'gradient': gradient,
-    #         'geometry':[line]}
-    # df_line = pd.DataFrame(data, columns = ['gradient', 'geometry'])
+    coordinates = np.asarray(coordinates, dtype=float)
+
+    lin_col = np.empty(len(coordinates), dtype=object)
+    if len(coordinates) > 1:
+        # Array of shape (n-1, 2, 2), one pair of end points per line,
+        # turned into LineStrings in one call.
+        segments = np.stack([coordinates[:-1], coordinates[1:]], axis=1)
+        lin_col[1:] = shapely.linestrings(segments)
 
-    return line
+    return lin_col
 
 
+@timed('make_multi_lines')
 def make_multi_lines(linestring_route_df, elevation_gradient):
     """
         Creates a GeoDataFrame containing the road grade and linestring
@@ -206,33 +230,28 @@ def make_multi_lines(linestring_route_df, elevation_gradient):
 
         Parameters
         ----------
-        linestring_route_df: DataFrame of coordinates; output of extract_pts_df()
+        linestring_route_df: DataFrame of coordinates; output of
+            extract_pts_df(), or array of shape (n, 2) of coordinates
         elevation_gradient: the road grade (e.g. slope) at each point along the route; output of gradient()
 
         Returns
         -------
-        gdf_route: GeoDataFrame with columns ['gradient', 'geometry']
+        gdf_route: GeoDataFrame with columns ['coordinates', 'gradient', 'geometry']
         """
 
-    num_pt_connections = len(linestring_route_df) - 1
-
-    # Initialize output column to contain Lines
-    lin_col = []
-    # Add None as first element corresponding to first route point of
-    # zero gradient.
-    lin_col.append(None)
-
-    # Loop through row indicies of 'linestring_route_df' input to
-    # generate Shapely Lines.
-    for idx in range(num_pt_connections):
-        df_line = _make_lines(
-            linestring_route_df,
-            idx
-            # elevation_gradient[idx],
-            )
-        lin_col.append(df_line)
-
+    if isinstance(linestring_route_df, pd.DataFrame):
+        coordinates = np.array(
+            linestring_route_df['coordinates'].tolist(),
+            dtype=float,
+            ).reshape(-1, 2)
+    else:
+        coordinates = np.asarray(linestring_route_df, dtype=float)
+        linestring_route_df = pd.DataFrame()
+        linestring_route_df['coordinates'] = list(map(tuple, coordinates.tolist()))
 
+    # None as first element corresponding to first route point of
+    # zero gradient, then Lines connecting each point to the last.
+    lin_col = _segment_lines(coordinates)
 
     route_df = linestring_route_df.assign(
         gradient=elevation_gradient,
@@ -242,16 +261,6 @@ def make_multi_lines(linestring_route_df, elevation_gradient):
     gdf_route = gpd.GeoDataFrame(route_df)
     return gdf_route
 
-    # # Initialize output DataFrame
-    # df_route = pd.DataFrame(columns = ['gradient', 'geometry'])
-
-    # # Loop through row indicies of 'linestring_route_df' input.
-    # for idx in range(len(linestring_route_df) - 1):
-    #     df_linestring = make_lines(linestring_route_df, elevation_gradient[idx], idx)
-    #     df_route = pd.concat([df_route, df_linestring])
-    # gdf_route = gpd.GeoDataFrame(df_route)
-    # return gdf_route
-
 
 def route_map(gdf_route):
     """
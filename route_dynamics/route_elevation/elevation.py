@@ -0,0 +1,474 @@
+""" Elevation samplers that can be passed to base.gradient (and everything
+    built on it) in place of a raster filename.
+
+    'ElevationSampler' keeps the raster dataset open between calls and
+    only reads the blocks of the raster that route vertices fall in,
+    holding recently used blocks in an LRU cache. Values are sampled
+    with the same bilinear (or nearest) scheme as
+    'rasterstats.point_query', so results are interchangeable.
+
+    'convert_to_memmap' turns the raster into a raw '.npy' grid with a
+    '.json' sidecar holding the geotransform, CRS and nodata value.
+    'MemmapElevationSampler' then looks route vertices up directly in
+    the memory-mapped grid, so no tiles are decoded and worker
+    processes share the same pages through the OS page cache.
+    """
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import rasterio
+import shapely
+from affine import Affine
+from rasterio.windows import Window
+
+
+class _GridSampler(object):
+    """ Vectorized point sampling shared by the elevation samplers.
+
+        Subclasses provide the raster 'transform', 'height', 'width'
+        and a '_read_pixels(rows, cols)' method returning the pixel
+        values (as float64) and a boolean array marking valid data.
+        """
+
+    def __init__(self, interpolate='bilinear'):
+
+        if interpolate not in ['nearest', 'bilinear']:
+            raise ValueError("interpolate must be 'nearest' or 'bilinear'")
+
+        self.interpolate = interpolate
+
+    def _read_pixels_boundless(self, rows, cols):
+        """ Read pixel values, treating cells outside the raster as
+            nodata.
+            """
+        inside = (
+            (rows >= 0) & (rows < self.height)
+            &
+            (cols >= 0) & (cols < self.width)
+            )
+
+        values = np.full(rows.shape, np.nan)
+        valid = np.zeros(rows.shape, dtype=bool)
+
+        if np.any(inside):
+            values[inside], valid[inside] = self._read_pixels(
+                rows[inside],
+                cols[inside],
+                )
+
+        return values, valid
+
+    def _fractional_pixel(self, x, y):
+        """ Fractional (row, col) of map coordinates 'x' and 'y'. """
+        inv = ~self.transform
+        fcol = inv.a * x + inv.b * y + inv.c
+        frow = inv.d * x + inv.e * y + inv.f
+        return frow, fcol
+
+    def sample(self, coordinates):
+        """
+            Sample the raster at an array of map coordinates.
+
+            Parameters
+            ----------
+            coordinates: array of shape (n, 2) of (x, y) coordinates in
+                the raster CRS.
+
+            Returns
+            -------
+            values: array of length n with the raster value at each
+                coordinate, NaN where there is no data.
+            """
+
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        x = coordinates[:, 0]
+        y = coordinates[:, 1]
+
+        frow, fcol = self._fractional_pixel(x, y)
+
+        if self.interpolate == 'nearest':
+            rows = np.floor(frow).astype(np.int64)
+            cols = np.floor(fcol).astype(np.int64)
+            values, valid = self._read_pixels_boundless(rows, cols)
+            values[~valid] = np.nan
+            return values
+
+        # 2x2 window of pixel centres surrounding each point, laid out
+        # as rasterstats does,
+        #     ul | ur
+        #     ---+---
+        #     ll | lr
+        r = np.round(frow).astype(np.int64)
+        c = np.round(fcol).astype(np.int64)
+        unit_x = 0.5 - (c - fcol)
+        unit_y = 0.5 + (r - frow)
+
+        window_rows = np.stack([r - 1, r - 1, r, r], axis=-1)
+        window_cols = np.stack([c - 1, c, c - 1, c], axis=-1)
+        window, valid = self._read_pixels_boundless(
+            window_rows.ravel(),
+            window_cols.ravel(),
+            )
+        window = window.reshape(-1, 4)
+        valid = valid.reshape(-1, 4)
+
+        ulv, urv, llv, lrv = window.T
+
+        values = (
+            (llv * (1 - unit_x) * (1 - unit_y))
+            + (lrv * unit_x * (1 - unit_y))
+            + (ulv * (1 - unit_x) * unit_y)
+            + (urv * unit_x * unit_y)
+            )
+
+        # Where any of the four cells is nodata fall back to nearest
+        # neighbor within the window.
+        incomplete = ~np.all(valid, axis=1)
+        if np.any(incomplete):
+            near_row = np.round(1 - unit_y[incomplete]).astype(np.int64)
+            near_col = np.round(unit_x[incomplete]).astype(np.int64)
+            near = 2 * near_row + near_col
+            idx = np.flatnonzero(incomplete)
+            near_value = window[idx, near]
+            near_value[~valid[idx, near]] = np.nan
+            values[idx] = near_value
+
+        return values
+
+    def sample_routes(self, coordinate_arrays):
+        """
+            Sample every vertex of many routes in a single call.
+
+            Parameters
+            ----------
+            coordinate_arrays: list of arrays of shape (n_i, 2)
+
+            Returns
+            -------
+            values: list of arrays of length n_i
+            """
+
+        coordinate_arrays = [
+            np.asarray(coords, dtype=float).reshape(-1, 2)
+            for coords in coordinate_arrays
+            ]
+        if len(coordinate_arrays) == 0:
+            return []
+
+        split_at = np.cumsum([len(coords) for coords in coordinate_arrays])
+        values = self.sample(np.concatenate(coordinate_arrays))
+
+        return np.split(values, split_at[:-1])
+
+    def point_query(self, route_shp):
+        """
+            Drop-in replacement for 'rasterstats.point_query'. Returns
+            the raster value at every vertex of every geometry in the
+            GeoDataFrame 'route_shp'.
+
+            Parameters
+            ----------
+            route_shp: GeoDataFrame for the selected route(s);
+                output of read_shape().
+
+            Returns
+            -------
+            elevation: list with one array of vertex values per
+                geometry (NaN where there is no data).
+            """
+
+        geometries = route_shp.geometry.values
+        coordinate_arrays = [
+            shapely.get_coordinates(geometry) for geometry in geometries
+            ]
+
+        return self.sample_routes(coordinate_arrays)
+
+
+class ElevationSampler(_GridSampler):
+    """ Samples an elevation raster (e.g. 'seattle_dtm.tif') while keeping
+        the dataset open and caching the raster blocks that have been
+        read.
+
+        Can be used anywhere a raster filename is accepted;
+            base.gradient, RouteTrajectory, and
+            multiple_route.routes_analysis_ranking.
+        """
+
+    def __init__(self,
+        rasterfile,
+        band=1,
+        interpolate='bilinear',
+        nodata=None,
+        max_cached_blocks=256,
+        ):
+        """
+            Parameters
+            ----------
+            rasterfile: elevation data file (.tif)
+            band: raster band to sample (DEFAULT = 1)
+            interpolate: 'bilinear' (DEFAULT) or 'nearest'
+            nodata: overrides the nodata value of the raster
+            max_cached_blocks: number of raster blocks held in the LRU
+                cache
+            """
+
+        super(ElevationSampler, self).__init__(interpolate)
+
+        self.path = rasterfile
+        self.band = band
+        self.max_cached_blocks = max_cached_blocks
+        self._nodata_override = nodata
+
+        self._open()
+
+    def _open(self):
+
+        self.dataset = rasterio.open(self.path)
+
+        self.transform = self.dataset.transform
+        self.height = self.dataset.height
+        self.width = self.dataset.width
+        self.crs = self.dataset.crs
+
+        if self._nodata_override is not None:
+            self.nodata = self._nodata_override
+        else:
+            self.nodata = self.dataset.nodata
+
+        self.block_height, self.block_width = (
+            self.dataset.block_shapes[self.band - 1]
+            )
+
+        self._block_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def close(self):
+        self.dataset.close()
+        self._block_cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        # Open datasets can't be pickled; reopen from the path instead
+        # (used when the sampler is sent to worker processes).
+        return {
+            'path': self.path,
+            'band': self.band,
+            'interpolate': self.interpolate,
+            'max_cached_blocks': self.max_cached_blocks,
+            '_nodata_override': self._nodata_override,
+            }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _read_block(self, block_row, block_col):
+        """ Return one raster block (and its valid-data mask), reading
+            it from disk only if it is not in the cache.
+            """
+
+        key = (block_row, block_col)
+        if key in self._block_cache:
+            self._block_cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._block_cache[key]
+
+        self.cache_misses += 1
+
+        row_off = block_row * self.block_height
+        col_off = block_col * self.block_width
+        window = Window(
+            col_off,
+            row_off,
+            min(self.block_width, self.width - col_off),
+            min(self.block_height, self.height - row_off),
+            )
+        block = self.dataset.read(self.band, window=window).astype(float)
+
+        if self.nodata is None:
+            valid = np.ones(block.shape, dtype=bool)
+        elif np.isnan(self.nodata):
+            valid = ~np.isnan(block)
+        else:
+            valid = block != self.nodata
+
+        self._block_cache[key] = (block, valid)
+        if len(self._block_cache) > self.max_cached_blocks:
+            self._block_cache.popitem(last=False)
+
+        return block, valid
+
+    def _read_pixels(self, rows, cols):
+
+        block_rows = rows // self.block_height
+        block_cols = cols // self.block_width
+
+        values = np.empty(rows.shape)
+        valid = np.empty(rows.shape, dtype=bool)
+
+        # Group the requested pixels by block so each block is read
+        # (or fetched from the cache) once per call.
+        block_ids = block_rows * (self.width // self.block_width + 1) + block_cols
+        order = np.argsort(block_ids, kind='stable')
+        sorted_ids = block_ids[order]
+        starts = np.flatnonzero(np.diff(sorted_ids, prepend=-1))
+        ends = np.append(starts[1:], len(sorted_ids))
+
+        for start, end in zip(starts, ends):
+            idx = order[start:end]
+            block_row = block_rows[idx[0]]
+            block_col = block_cols[idx[0]]
+            block, block_valid = self._read_block(block_row, block_col)
+
+            local_rows = rows[idx] - block_row * self.block_height
+            local_cols = cols[idx] - block_col * self.block_width
+            values[idx] = block[local_rows, local_cols]
+            valid[idx] = block_valid[local_rows, local_cols]
+
+        return values, valid
+
+
+def _memmap_paths(path):
+    """ Paths of the '.npy' grid and '.json' sidecar for 'path', which may
+        be given with or without the '.npy' extension.
+        """
+    stem, ext = os.path.splitext(path)
+    if ext != '.npy':
+        stem = path
+    return stem + '.npy', stem + '.json'
+
+
+def convert_to_memmap(rasterfile, output_path, band=1, rows_per_chunk=1024):
+    """
+        One-time conversion of an elevation raster into a raw
+        memory-mappable grid.
+
+        Parameters
+        ----------
+        rasterfile: elevation data file (.tif)
+        output_path: destination of the grid, the '.npy' extension is
+            added if missing. A '.json' sidecar is written next to it.
+        band: raster band to convert (DEFAULT = 1)
+        rows_per_chunk: rows copied per read, bounds memory use while
+            converting large rasters
+
+        Returns
+        -------
+        grid_path: path of the '.npy' grid, to be passed to
+            MemmapElevationSampler
+        """
+
+    grid_path, sidecar_path = _memmap_paths(output_path)
+
+    with rasterio.open(rasterfile) as src:
+
+        grid = np.lib.format.open_memmap(
+            grid_path,
+            mode='w+',
+            dtype=src.dtypes[band - 1],
+            shape=(src.height, src.width),
+            )
+
+        for row_off in range(0, src.height, rows_per_chunk):
+            num_rows = min(rows_per_chunk, src.height - row_off)
+            window = Window(0, row_off, src.width, num_rows)
+            grid[row_off:row_off + num_rows] = src.read(band, window=window)
+
+        grid.flush()
+        del grid
+
+        sidecar = {
+            'transform': list(src.transform)[:6],
+            'crs': src.crs.to_wkt() if src.crs is not None else None,
+            'nodata': src.nodata,
+            'source': os.path.abspath(rasterfile),
+            }
+
+    with open(sidecar_path, 'w') as f:
+        json.dump(sidecar, f, indent=2)
+
+    return grid_path
+
+
+class MemmapElevationSampler(_GridSampler):
+    """ Samples a grid written by 'convert_to_memmap' directly from the
+        memory map. Interchangeable with 'ElevationSampler'.
+        """
+
+    def __init__(self, path, interpolate='bilinear', nodata=None):
+        """
+            Parameters
+            ----------
+            path: grid written by convert_to_memmap() ('.npy' optional)
+            interpolate: 'bilinear' (DEFAULT) or 'nearest'
+            nodata: overrides the nodata value stored in the sidecar
+            """
+
+        super(MemmapElevationSampler, self).__init__(interpolate)
+
+        self.path = path
+        self._nodata_override = nodata
+
+        self._open()
+
+    def _open(self):
+
+        grid_path, sidecar_path = _memmap_paths(self.path)
+
+        with open(sidecar_path) as f:
+            sidecar = json.load(f)
+
+        self.grid = np.load(grid_path, mmap_mode='r')
+        self.height, self.width = self.grid.shape
+        self.transform = Affine(*sidecar['transform'])
+        self.crs = sidecar['crs']
+
+        if self._nodata_override is not None:
+            self.nodata = self._nodata_override
+        else:
+            self.nodata = sidecar['nodata']
+
+    def close(self):
+        # Dropping the reference unmaps the file.
+        self.grid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        # Ship only the path to worker processes, each maps the same
+        # file.
+        return {
+            'path': self.path,
+            'interpolate': self.interpolate,
+            '_nodata_override': self._nodata_override,
+            }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _read_pixels(self, rows, cols):
+
+        values = self.grid[rows, cols].astype(float)
+
+        if self.nodata is None:
+            valid = np.ones(values.shape, dtype=bool)
+        elif np.isnan(self.nodata):
+            valid = ~np.isnan(values)
+        else:
+            valid = values != self.nodata
+
+        return values, valid
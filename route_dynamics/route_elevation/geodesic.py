@@ -0,0 +1,238 @@
+""" Batch geodesic distances on the WGS-84 ellipsoid.
+
+    The functions here take whole arrays of coordinates and return the
+    distance between consecutive points in a single NumPy pass, rather
+    than building one 'geopy.distance.geodesic' object per pair of
+    points.
+
+    Two methods are available;
+        - 'vincenty' : iterative solution of the inverse geodesic
+            problem (Vincenty 1975). Agrees with geopy's
+            Karney algorithm to well below a millimetre for every
+            pair it converges on. The few nearly antipodal pairs that
+            do not converge are handed back to geopy.
+        - 'flat' : ellipsoidal flat-earth approximation using the
+            meridional and prime-vertical radii of curvature at the
+            mid-latitude of each segment. The error grows like
+            (d/R)^2 and, toward the poles, like tan(latitude)^2. Up to
+            70 degrees of latitude it is below 0.1 mm for segments
+            shorter than 1 km and below 1 cm for segments shorter than
+            10 km; at 80 (85) degrees a 10 km segment is off by 4 (15)
+            cm.
+    """
+import numpy as np
+
+from geopy.distance import geodesic
+
+
+# WGS-84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1/298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+
+def vincenty_inverse(lat1, lon1, lat2, lon2, tol=1e-12, max_iter=200):
+    """
+        Vectorized Vincenty inverse formula on the WGS-84 ellipsoid.
+
+        Parameters
+        ----------
+        lat1, lon1: arrays of latitude and longitude of the first
+            points [degrees]
+        lat2, lon2: arrays of latitude and longitude of the second
+            points [degrees]
+        tol: convergence tolerance on the auxiliary longitude [radians]
+        max_iter: maximum number of iterations
+
+        Returns
+        -------
+        distance: array of geodesic distances [meters]. Pairs that
+            did not converge (nearly antipodal points) are NaN.
+        """
+
+    a, b, f = WGS84_A, WGS84_B, WGS84_F
+
+    phi1 = np.radians(np.asarray(lat1, dtype=float))
+    phi2 = np.radians(np.asarray(lat2, dtype=float))
+    L = np.radians(np.asarray(lon2, dtype=float) - np.asarray(lon1, dtype=float))
+
+    # Reduced latitudes
+    U1 = np.arctan((1 - f) * np.tan(phi1))
+    U2 = np.arctan((1 - f) * np.tan(phi2))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+
+    # Values carried out of the iteration, filled as pairs converge.
+    sin_sigma = np.zeros(L.shape)
+    cos_sigma = np.ones(L.shape)
+    sigma = np.zeros(L.shape)
+    cos_sq_alpha = np.ones(L.shape)
+    cos_2sigma_m = np.zeros(L.shape)
+
+    for _ in range(max_iter):
+        active = ~converged
+        if not np.any(active):
+            break
+
+        lam_a = lam[active]
+        sin_lam, cos_lam = np.sin(lam_a), np.cos(lam_a)
+        s_U1, c_U1 = sin_U1[active], cos_U1[active]
+        s_U2, c_U2 = sin_U2[active], cos_U2[active]
+
+        s_sig = np.sqrt(
+            (c_U2 * sin_lam)**2
+            +
+            (c_U1 * s_U2 - s_U1 * c_U2 * cos_lam)**2
+            )
+        c_sig = s_U1 * s_U2 + c_U1 * c_U2 * cos_lam
+        sig = np.arctan2(s_sig, c_sig)
+
+        # Coincident points have 'sin_sigma = 0'; guard the divisions
+        # and let them fall out with zero distance.
+        coincident = s_sig == 0
+        safe_s_sig = np.where(coincident, 1., s_sig)
+
+        sin_alpha = np.where(coincident, 0., c_U1 * c_U2 * sin_lam / safe_s_sig)
+        c_sq_alpha = 1 - sin_alpha**2
+        # Equatorial lines have 'cos^2 alpha = 0'.
+        safe_c_sq_alpha = np.where(c_sq_alpha == 0, 1., c_sq_alpha)
+        c_2sig_m = np.where(
+            c_sq_alpha == 0,
+            0.,
+            c_sig - 2 * s_U1 * s_U2 / safe_c_sq_alpha
+            )
+
+        C = f / 16 * c_sq_alpha * (4 + f * (4 - 3 * c_sq_alpha))
+        lam_new = L[active] + (1 - C) * f * sin_alpha * (
+            sig + C * s_sig * (
+                c_2sig_m + C * c_sig * (-1 + 2 * c_2sig_m**2)
+                )
+            )
+
+        done = (np.abs(lam_new - lam_a) < tol) | coincident
+
+        lam[active] = lam_new
+        sin_sigma[active] = s_sig
+        cos_sigma[active] = c_sig
+        sigma[active] = sig
+        cos_sq_alpha[active] = c_sq_alpha
+        cos_2sigma_m[active] = c_2sig_m
+
+        active_idx = np.flatnonzero(active)
+        converged[active_idx[done]] = True
+
+    u_sq = cos_sq_alpha * (a**2 - b**2) / b**2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (
+        cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+            -
+            B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2)
+            * (-3 + 4 * cos_2sigma_m**2)
+            )
+        )
+
+    distance = b * A * (sigma - delta_sigma)
+    distance[~converged] = np.nan
+
+    return distance
+
+
+def flat_ellipsoid(lat1, lon1, lat2, lon2):
+    """
+        Ellipsoidal flat-earth approximation of the distance between
+        pairs of points. Uses the radii of curvature of the WGS-84
+        ellipsoid at the mid-latitude of each pair.
+
+        The error is of order (d/R)^2 for segment length d, growing
+        like tan(latitude)^2 toward the poles. At mid-latitudes (up to
+        70 degrees) it is below 0.1 mm for segments shorter than 1 km
+        and below 1 cm for segments shorter than 10 km; a 10 km segment
+        is off by 4 cm at 80 degrees and 15 cm at 85 degrees.
+
+        Parameters
+        ----------
+        lat1, lon1: arrays of latitude and longitude of the first
+            points [degrees]
+        lat2, lon2: arrays of latitude and longitude of the second
+            points [degrees]
+
+        Returns
+        -------
+        distance: array of approximate distances [meters]
+        """
+
+    lat1 = np.radians(np.asarray(lat1, dtype=float))
+    lat2 = np.radians(np.asarray(lat2, dtype=float))
+    lon1 = np.radians(np.asarray(lon1, dtype=float))
+    lon2 = np.radians(np.asarray(lon2, dtype=float))
+
+    e_sq = WGS84_F * (2 - WGS84_F)
+    mid_lat = (lat1 + lat2) / 2
+    w_sq = 1 - e_sq * np.sin(mid_lat)**2
+
+    # Meridional and prime vertical radii of curvature
+    meridional_radius = WGS84_A * (1 - e_sq) / w_sq**1.5
+    prime_vertical_radius = WGS84_A / np.sqrt(w_sq)
+
+    # Wrap longitude difference into [-pi, pi)
+    d_lon = (lon2 - lon1 + np.pi) % (2 * np.pi) - np.pi
+
+    north = meridional_radius * (lat2 - lat1)
+    east = prime_vertical_radius * np.cos(mid_lat) * d_lon
+
+    return np.hypot(north, east)
+
+
+def segment_distances(coordinates, method='vincenty'):
+    """
+        Calculates the distance between consecutive points of a route
+        given as an array of (longitude, latitude) coordinates.
+
+        Parameters
+        ----------
+        coordinates: array of shape (n, 2) (or (n, 3), extra columns
+            are ignored) with longitude in the first column and
+            latitude in the second.
+        method: 'vincenty' (DEFAULT, matches geopy.distance.geodesic)
+            or 'flat' (faster ellipsoidal approximation).
+
+        Returns
+        -------
+        distance: array of length n-1 with the distance between each
+            point and the next [meters].
+        """
+
+    coordinates = np.asarray(coordinates, dtype=float)
+    if coordinates.ndim != 2 or coordinates.shape[1] < 2:
+        raise ValueError(
+            "'coordinates' must be an array of shape (n, 2)"
+            )
+
+    lon = coordinates[:, 0]
+    lat = coordinates[:, 1]
+
+    if method == 'vincenty':
+        distance = vincenty_inverse(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+        # Fall back to geopy for the (rare) pairs where Vincenty did
+        # not converge.
+        for idx in np.flatnonzero(np.isnan(distance)):
+            distance[idx] = geodesic(
+                (lat[idx], lon[idx]),
+                (lat[idx + 1], lon[idx + 1]),
+                ).m
+
+    elif method == 'flat':
+        distance = flat_ellipsoid(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+    else:
+        raise ValueError(
+            "'method' must be 'vincenty' or 'flat'"
+            )
+
+    return distance
@@ -0,0 +1,320 @@
+""" Persistent cache of built route geometry.
+
+    The coordinates, elevation, gradient and distances of a route only
+    depend on the shapefile, the elevation raster and the route number,
+    yet every new process parses the shapefile, samples the raster and
+    solves the geodesics again. A 'GeometryCache' stores those arrays as
+    compressed '.npz' files in a directory, keyed by a hash of the input
+    file contents, the route number and the library version, so a cache
+    hit reads one small file and skips all three steps.
+
+    The directory is bounded in size; the least recently used entries
+    are removed once it grows past 'max_bytes'.
+    """
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from .. import __version__
+from . import base
+from .elevation import _memmap_paths
+
+
+# Directory used when none is given.
+CACHE_DIR_ENV = 'ROUTE_DYNAMICS_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'route_dynamics')
+
+# Files making up a shapefile, hashed along with the '.shp'.
+SHAPEFILE_SIDECARS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+# Arrays stored per route, as returned by GeometryCache.route_arrays().
+ARRAY_NAMES = [
+    'coordinates',
+    'elevation',
+    'gradient',
+    'cum_distance',
+    'back_diff_distance',
+    ]
+
+# Content digests of the files hashed by this process, keyed by
+# (path, size, mtime) so a file is only read once while it is unchanged.
+_file_digests = {}
+
+
+def file_digest(path, chunk_size=2**20):
+    """
+        SHA-256 of the contents of 'path'.
+
+        Parameters
+        ----------
+        path: file to hash
+        chunk_size: bytes read at a time
+
+        Returns
+        -------
+        digest: hex digest string
+        """
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    signature = (path, stat.st_size, stat.st_mtime_ns)
+
+    if signature not in _file_digests:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha.update(chunk)
+        _file_digests[signature] = sha.hexdigest()
+
+    return _file_digests[signature]
+
+
+def shapefile_digest(shapefile):
+    """
+        Digest of a shapefile and its sidecar files (or of the shapefile
+        a route_store.RouteStore was built from).
+        """
+
+    if hasattr(shapefile, 'load_route'):
+        if shapefile.source is None:
+            raise ValueError('Route store has no source shapefile to hash')
+        shapefile = shapefile.source
+
+    stem, _ = os.path.splitext(shapefile)
+
+    parts = []
+    for ext in SHAPEFILE_SIDECARS:
+        if os.path.exists(stem + ext):
+            parts.append(ext + ':' + file_digest(stem + ext))
+
+    return ';'.join(parts)
+
+
+def raster_digest(rasterfile):
+    """
+        Digest of an elevation raster, or of the file behind an
+        elevation sampler together with the sampler settings that change
+        its values.
+        """
+
+    if not hasattr(rasterfile, 'point_query'):
+        # rasterstats.point_query defaults to bilinear interpolation.
+        return 'file:{}:bilinear'.format(file_digest(rasterfile))
+
+    path = getattr(rasterfile, 'path', None)
+    if path is None:
+        raise ValueError(
+            '{} has no file to hash'.format(type(rasterfile).__name__)
+            )
+
+    grid_path, sidecar_path = _sampler_files(rasterfile)
+    parts = [
+        type(rasterfile).__name__,
+        file_digest(grid_path),
+        rasterfile.interpolate,
+        str(getattr(rasterfile, 'band', 1)),
+        str(rasterfile.nodata),
+        ]
+    if sidecar_path is not None:
+        parts.append(file_digest(sidecar_path))
+
+    return ':'.join(parts)
+
+
+def _sampler_files(sampler):
+    """ Files holding the grid of a sampler; the grid and, for
+        elevation.MemmapElevationSampler, its '.json' sidecar.
+        """
+
+    if hasattr(sampler, 'grid'):
+        return _memmap_paths(sampler.path)
+
+    return sampler.path, None
+
+
+class GeometryCache(object):
+    """ Directory of per-route geometry arrays keyed by content hash.
+        """
+
+    def __init__(self, cache_dir=None, max_bytes=2**30):
+        """
+            Parameters
+            ----------
+            cache_dir: directory of the cache (DEFAULT = None, the
+                ROUTE_DYNAMICS_CACHE_DIR environment variable or
+                '~/.cache/route_dynamics')
+            max_bytes: size the directory is kept under (DEFAULT = 1 GiB)
+            """
+
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, route_num, shapefile, rasterfile):
+        """
+            Cache key of a route; changes if the shapefile or raster
+            contents, the route number or the library version change.
+            """
+
+        sha = hashlib.sha256()
+        for part in [
+            __version__,
+            shapefile_digest(shapefile),
+            raster_digest(rasterfile),
+            repr(route_num),
+            ]:
+            sha.update(part.encode())
+            sha.update(b'\0')
+
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def load(self, key):
+        """
+            Arrays stored under 'key', or None if there are none.
+            """
+
+        path = self._path(key)
+
+        try:
+            with np.load(path) as npz:
+                arrays = {name: npz[name] for name in ARRAY_NAMES}
+        except (OSError, KeyError, ValueError):
+            # Missing, partly evicted or unreadable entries are misses.
+            return None
+
+        # Mark as recently used for eviction.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return arrays
+
+    def save(self, key, arrays):
+        """
+            Stores 'arrays' (dict with the ARRAY_NAMES keys) under 'key',
+            then evicts old entries if the cache is over 'max_bytes'.
+            """
+
+        # Write to a temporary file and rename, so other processes never
+        # see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    **{name: arrays[name] for name in ARRAY_NAMES}
+                    )
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def entries(self):
+        """ (path, size, last use time) of each entry, oldest first. """
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    @property
+    def nbytes(self):
+        """ Total size of the entries, in bytes. """
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """ Removes least recently used entries until the cache is no
+            larger than 'max_bytes'.
+            """
+
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """ Removes every entry. """
+
+        for path, _, _ in self.entries():
+            os.remove(path)
+
+    def route_arrays(self, route_num, shapefile, rasterfile):
+        """
+            Geometry arrays of a route, read from the cache or built and
+            stored on a miss.
+
+            Parameters
+            ----------
+            route_num: route number (integer)
+            shapefile: route geospatial data (.shp file) or
+                route_store.RouteStore
+            rasterfile: elevation data file (.tif) or elevation sampler
+
+            Returns
+            -------
+            arrays: dict of
+                'coordinates': (n, 2) route coordinates
+                'elevation', 'gradient', 'cum_distance',
+                'back_diff_distance': the outputs of base.gradient()
+            """
+
+        key = self.key(route_num, shapefile, rasterfile)
+
+        arrays = self.load(key)
+        if arrays is not None:
+            self.hits += 1
+            return arrays
+
+        self.misses += 1
+
+        route_shp = base.read_shape(shapefile, route_num)
+
+        (
+            elevation,
+            elevation_gradient,
+            route_cum_distance,
+            back_diff_distance
+            ) = base.gradient(route_shp, rasterfile)
+
+        arrays = {
+            'coordinates': base.extract_point_array(route_shp),
+            'elevation': np.asarray(elevation, dtype=float),
+            'gradient': np.asarray(elevation_gradient, dtype=float),
+            'cum_distance': np.asarray(route_cum_distance, dtype=float),
+            'back_diff_distance': np.asarray(back_diff_distance, dtype=float),
+            }
+
+        self.save(key, arrays)
+
+        return arrays
@@ -1,9 +1,152 @@
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
 from . import base
+from .elevation import ElevationSampler
+from .route_store import RouteStore
+
+
+# Route store and elevation sampler of a pool worker process, set once
+# by '_init_worker'. The serial path keeps its own in local variables.
+_worker_routes = None
+_worker_sampler = None
+
+
+def _open_sampler(rasterfile):
+    """
+        Elevation sampler for 'rasterfile', or the sampler the caller
+        passed in.
+        """
+    if hasattr(rasterfile, 'point_query'):
+        return rasterfile
+
+    return ElevationSampler(rasterfile)
+
+
+def _init_worker(store, rasterfile):
+    """
+        Opens the route store and raster once per worker process, so
+        every route handled by the process reuses them. 'store' is the
+        directory of a store the parent wrote (only its index is read
+        here), or a RouteStore held in memory.
+        """
+    global _worker_routes, _worker_sampler
+
+    if isinstance(store, str):
+        store = RouteStore(store_dir=store)
+
+    _worker_routes = store
+    _worker_sampler = _open_sampler(rasterfile)
+
+
+def _route_metrics(route_num, routes, sampler):
+    """
+        Computes the four metrics for one route with the given route
+        store and sampler. Errors are returned rather than raised so one
+        bad route does not stop the batch.
+        """
+    try:
+        route_shp = base.read_shape(routes, route_num)
+
+        elevation, elevation_gradient, route_cum_distance, distance = base.gradient(route_shp, sampler)
+
+        _ , metrics = base.route_metrics(elevation, elevation_gradient, route_cum_distance, distance, route_num)
+
+        return metrics, None
+
+    except Exception as err:
+        return None, '{}: {}'.format(type(err).__name__, err)
+
+
+def _route_metrics_task(route_num):
+    """
+        _route_metrics in a pool worker, with the worker's store and
+        sampler.
+        """
+    return _route_metrics(route_num, _worker_routes, _worker_sampler)
 
 
-def routes_analysis_ranking(route_list, shapefile, rasterfile):
+def routes_metrics(route_list, shapefile, rasterfile, n_workers=None):
+    """
+    Computes the four chosen metrics values for each bus route in route_list.
+
+    The shapefile is parsed once, in this process. With worker processes
+    it is written to a temporary route store whose directory is handed
+    to the workers, so they only read the routes they are given.
+
+    Parameters
+    ----------
+    route_list: A list of bus routes to be compared (Integers)
+    shapefile: route geospatial data (.shp file) or route_store.RouteStore
+    rasterfile: elevation data file (.tif) or elevation sampler
+    n_workers: number of worker processes, DEFAULT = None runs the routes
+        one after another in this process
+
+    Returns
+    -------
+    data: DataFrame with columns ['Bus Num', 'M1', 'M2', 'M3', 'M4', 'Error']
+        in the order of route_list. Whether run serially or with worker
+        processes, a route that fails has NaN metrics and its error
+        message in 'Error' (and a warning is issued); the other routes
+        are still computed.
+    """
+    if n_workers is None or n_workers <= 1:
+        if hasattr(shapefile, 'load_route'):
+            routes = shapefile
+        else:
+            routes = RouteStore.from_shapefile(shapefile)
+
+        sampler = _open_sampler(rasterfile)
+        try:
+            results = [
+                _route_metrics(route_num, routes, sampler)
+                for route_num in route_list
+                ]
+        finally:
+            if sampler is not rasterfile:
+                sampler.close()
+
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if not hasattr(shapefile, 'load_route'):
+                shapefile = RouteStore.from_shapefile(shapefile, tmp_dir)
+            store = shapefile.store_dir or shapefile
+
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_worker,
+                initargs=(store, rasterfile),
+                ) as executor:
+                # 'map' returns results in the order of route_list
+                results = list(executor.map(_route_metrics_task, route_list))
+
+    metrics = np.array([
+        result if result is not None else (np.nan,)*4
+        for result, _ in results
+        ]).reshape(-1, 4)
+    errors = [error for _, error in results]
+
+    for route_num, error in zip(route_list, errors):
+        if error is not None:
+            warnings.warn('Route {} failed; {}'.format(route_num, error))
+
+    data = pd.DataFrame({
+        'Bus Num': route_list,
+        'M1': metrics[:, 0],
+        'M2': metrics[:, 1],
+        'M3': metrics[:, 2],
+        'M4': metrics[:, 3],
+        'Error': errors,
+        })
+
+    return data
+
+
+def routes_analysis_ranking(route_list, shapefile, rasterfile, n_workers=None):
     """
     Computes the four chosen metrics values for each bus routes in route_list and display them on a bar plot for
     ease of comparison
@@ -11,28 +154,20 @@ def routes_analysis_ranking(route_list, shapefile, rasterfile):
     Parameters
     ----------
     route_list: A list of bus routes to be compared (Integers)
-    shapefile: route geospatial data (.shp file)
-    rasterfile: elevation data file (.tif)
+    shapefile: route geospatial data (.shp file) or route_store.RouteStore
+    rasterfile: elevation data file (.tif) or elevation.ElevationSampler
+    n_workers: number of worker processes, DEFAULT = None computes the
+        routes serially
 
     Returns
     -------
     bar plot: showing results comparison between bus routes according to the four metrics chosen
     """
-    num_route = len(route_list)
-    metrics_1 = [0] * num_route
-    metrics_2 = [0] * num_route
-    metrics_3 = [0] * num_route
-    metrics_4 = [0] * num_route
-    for idx, route_num in enumerate(route_list):
-        route_shp = base.read_shape(shapefile, route_num)
-
-        elevation, elevation_gradient, route_cum_distance, distance = base.gradient(route_shp, rasterfile)
-
-        _ , metrics = base.route_metrics(elevation, elevation_gradient, route_cum_distance, distance, route_num)
+    data = routes_metrics(route_list, shapefile, rasterfile, n_workers=n_workers)
 
-        metrics_1[idx], metrics_2[idx], metrics_3[idx], metrics_4[idx] = metrics
+    # Routes that failed are left off the plot.
+    data = data[data['Error'].isnull()].drop(columns='Error')
 
-    data = pd.DataFrame({'Bus Num': route_list, 'M1': metrics_1, 'M2': metrics_2, 'M3': metrics_3, 'M4': metrics_4})
     ax = data.plot.bar('Bus Num', figsize= [14, 5], fontsize= 20)
     ax.set_ylabel('Metrics', size= 20)
     ax.set_xlabel('Bus Number', size= 20)
@@ -0,0 +1,232 @@
+""" Route store partitioned by ROUTE_NUM.
+
+    Reading a route with 'base.read_shape' parses the whole shapefile
+    and then throws away every route but one. A 'RouteStore' parses the
+    shapefile once, splits it into one partition per ROUTE_NUM and keeps
+    an index from route number to partition, so loading a route only
+    reads that route's bytes.
+
+    A store can live in memory (one parse per process) or be written to
+    a directory (one parse ever, until the shapefile changes). It can be
+    passed to base.read_shape, and so to everything built on it, in
+    place of the shapefile name.
+    """
+import json
+import os
+from collections import OrderedDict
+
+import geopandas as gpd
+import pandas as pd
+
+
+INDEX_FILENAME = 'index.json'
+
+
+# Files of a shapefile that the routes are read from; ROUTE_NUM and the
+# other attributes live in the .dbf.
+SHAPEFILE_PARTS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+
+def _source_signature(shapefile):
+    """ Size and modification time of each file of the shapefile, used
+        to tell if a store on disk is stale.
+        """
+    stem, _ = os.path.splitext(shapefile)
+    signature = {}
+    for ext in SHAPEFILE_PARTS:
+        if os.path.exists(stem + ext):
+            stat = os.stat(stem + ext)
+            signature[ext] = [stat.st_size, stat.st_mtime]
+    return signature
+
+
+class RouteStore(object):
+    """ Indexed, per-route partitions of a routes shapefile.
+        """
+
+    def __init__(self, store_dir=None, partitions=None, source=None,
+        max_cached_routes=64):
+        """ Use RouteStore.build() or RouteStore.from_shapefile() rather
+            than calling directly.
+
+            Parameters
+            ----------
+            store_dir: directory holding a store written by build()
+            partitions: dict of route number to GeoDataFrame, for a
+                store held in memory
+            source: path of the shapefile the store was made from
+            max_cached_routes: number of routes read from disk that are
+                kept in memory
+            """
+
+        self.store_dir = store_dir
+        self.max_cached_routes = max_cached_routes
+        self._cache = OrderedDict()
+
+        if partitions is not None:
+            self.source = source
+            self._partitions = dict(partitions)
+            self._index = {
+                route_num: None for route_num in self._partitions
+                }
+
+        elif store_dir is not None:
+            with open(os.path.join(store_dir, INDEX_FILENAME)) as f:
+                index = json.load(f)
+            self.source = index['source']
+            self.source_signature = index['source_signature']
+            self._partitions = None
+            self._index = {
+                route_num: filename for route_num, filename in index['routes']
+                }
+
+        else:
+            raise ValueError("RouteStore needs 'store_dir' or 'partitions'")
+
+    @staticmethod
+    def _split(shapefile):
+        """ Parse the shapefile once and split it by ROUTE_NUM. """
+        routes_shp = gpd.read_file(shapefile)
+        return {
+            route_num: routes_shp.loc[idx]
+            for route_num, idx in routes_shp.groupby('ROUTE_NUM').groups.items()
+            }
+
+    @classmethod
+    def build(cls, shapefile, store_dir):
+        """
+            Writes the partitioned store for 'shapefile' to 'store_dir'.
+
+            Parameters
+            ----------
+            shapefile: route geospatial data (.shp file)
+            store_dir: directory to write the store to
+
+            Returns
+            -------
+            store: RouteStore reading from 'store_dir'
+            """
+
+        os.makedirs(store_dir, exist_ok=True)
+
+        partitions = cls._split(shapefile)
+
+        routes = []
+        for route_num, route_shp in partitions.items():
+            filename = 'route_{}.pkl'.format(route_num)
+            route_shp.to_pickle(os.path.join(store_dir, filename))
+            # json has no numpy ints
+            routes.append([getattr(route_num, 'item', lambda: route_num)(), filename])
+
+        index = {
+            'source': os.path.abspath(shapefile),
+            'source_signature': _source_signature(shapefile),
+            'routes': routes,
+            }
+        with open(os.path.join(store_dir, INDEX_FILENAME), 'w') as f:
+            json.dump(index, f, indent=2)
+
+        return cls(store_dir=store_dir)
+
+    @classmethod
+    def from_shapefile(cls, shapefile, store_dir=None):
+        """
+            Store for 'shapefile'. Held in memory if 'store_dir' is None,
+            otherwise opened from 'store_dir', (re)building it first if
+            it is missing or older than the shapefile.
+
+            Parameters
+            ----------
+            shapefile: route geospatial data (.shp file)
+            store_dir: directory for a persistent store (DEFAULT = None)
+
+            Returns
+            -------
+            store: RouteStore
+            """
+
+        if store_dir is None:
+            return cls(
+                partitions=cls._split(shapefile),
+                source=os.path.abspath(shapefile),
+                )
+
+        if os.path.exists(os.path.join(store_dir, INDEX_FILENAME)):
+            store = cls(store_dir=store_dir)
+            if (
+                store.source == os.path.abspath(shapefile)
+                and
+                store.source_signature == _source_signature(shapefile)
+                ):
+                return store
+
+        return cls.build(shapefile, store_dir)
+
+    @property
+    def route_nums(self):
+        """ Route numbers held in the store. """
+        return list(self._index)
+
+    def __contains__(self, route_num):
+        return route_num in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def load_route(self, route_num):
+        """
+            Loads the GeoDataFrame for a single route, equivalent to
+            base.read_shape(shapefile, route_num).
+
+            Parameters
+            ----------
+            route_num: route number (integer)
+
+            Returns
+            -------
+            route_shp: gdf containing just route 'route_num'
+            """
+
+        if route_num not in self._index:
+            raise KeyError(
+                "Route {} is not in the route store".format(route_num)
+                )
+
+        if self._partitions is not None:
+            return self._partitions[route_num].copy()
+
+        if route_num in self._cache:
+            self._cache.move_to_end(route_num)
+            return self._cache[route_num].copy()
+
+        route_shp = pd.read_pickle(
+            os.path.join(self.store_dir, self._index[route_num])
+            )
+
+        self._cache[route_num] = route_shp
+        if len(self._cache) > self.max_cached_routes:
+            self._cache.popitem(last=False)
+
+        return route_shp.copy()
+
+    def load_routes(self, route_nums=None):
+        """
+            Bulk loader for many routes in one pass.
+
+            Parameters
+            ----------
+            route_nums: list of route numbers (DEFAULT = None, all
+                routes in the store)
+
+            Returns
+            -------
+            routes: dict of route number to route GeoDataFrame, in the
+                order requested
+            """
+
+        if route_nums is None:
+            route_nums = self.route_nums
+
+        return OrderedDict(
+            (route_num, self.load_route(route_num)) for route_num in route_nums
+            )
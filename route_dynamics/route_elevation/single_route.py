@@ -1,4 +1,149 @@
+import os
+from collections import OrderedDict
+
 from . import base
+from . import route_store
+
+
+# Most recently used route contexts, keyed by
+# (shapefile, rasterfile, route_num) and the signatures of the two files.
+_route_contexts = OrderedDict()
+MAX_ROUTE_CONTEXTS = 32
+
+
+def _input_signature(source, parts=None):
+    """
+    Size and modification time of each file of an input (the file
+    itself, or 'parts': its extensions), so an edited file gets a new
+    context. None for a route store or sampler passed in place of a file.
+    """
+    if not isinstance(source, str):
+        return None
+
+    stem, ext = os.path.splitext(source)
+    signature = []
+    for part in parts or [ext]:
+        if os.path.exists(stem + part):
+            stat = os.stat(stem + part)
+            signature.append((part, stat.st_size, stat.st_mtime))
+    return tuple(signature)
+
+
+class RouteContext(object):
+    """
+    Intermediate results for one (shapefile, rasterfile, route_num),
+    each computed lazily the first time it is needed and at most once;
+        read_shape -> extract_point_df -> gradient -> make_multi_lines
+    The route_analysis_* functions are views over a shared context, so
+    asking for the map, profile and metrics of a route builds it once.
+
+    Use RouteContext.get() to share contexts between calls.
+    """
+
+    def __init__(self, route_num, shapefile, rasterfile):
+        """
+        Parameters
+        ----------
+        route_num: route number (integer)
+        shapefile: route geospatial data (.shp file) or route store
+        rasterfile: elevation data file (.tif) or elevation sampler
+        """
+        self.route_num = route_num
+        self.shapefile = shapefile
+        self.rasterfile = rasterfile
+        self._cache = {}
+
+    @classmethod
+    def get(cls, route_num, shapefile, rasterfile):
+        """
+        Returns the memoized context for (shapefile, rasterfile,
+        route_num), creating it if needed or if either file changed since.
+        Only the most recently used MAX_ROUTE_CONTEXTS contexts are kept.
+        """
+        key = (
+            shapefile,
+            rasterfile,
+            route_num,
+            _input_signature(shapefile, route_store.SHAPEFILE_PARTS),
+            _input_signature(rasterfile),
+            )
+
+        if key in _route_contexts:
+            _route_contexts.move_to_end(key)
+            return _route_contexts[key]
+
+        context = cls(route_num, shapefile, rasterfile)
+        _route_contexts[key] = context
+        if len(_route_contexts) > MAX_ROUTE_CONTEXTS:
+            _route_contexts.popitem(last=False)
+
+        return context
+
+    def _lazy(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def route_shp(self):
+        """ GeoDataFrame of the route; output of read_shape() """
+        return self._lazy(
+            'route_shp',
+            lambda: base.read_shape(self.shapefile, self.route_num),
+            )
+
+    @property
+    def linestring_route_df(self):
+        """ DataFrame of route coordinates; output of extract_point_df() """
+        return self._lazy(
+            'linestring_route_df',
+            lambda: base.extract_point_df(self.route_shp),
+            )
+
+    @property
+    def gradient(self):
+        """
+        (elevation, elevation_gradient, route_cum_distance, distance);
+        output of gradient()
+        """
+        return self._lazy(
+            'gradient',
+            lambda: base.gradient(self.route_shp, self.rasterfile),
+            )
+
+    @property
+    def gdf_route(self):
+        """ GeoDataFrame with columns ['gradient', 'geometry'] """
+        return self._lazy(
+            'gdf_route',
+            lambda: base.make_multi_lines(
+                self.linestring_route_df,
+                self.gradient[1],
+                ),
+            )
+
+    @property
+    def metrics(self):
+        """ (display_metrics, metrics_values); output of route_metrics() """
+        def build():
+            elevation, elevation_gradient, route_cum_distance, distance = self.gradient
+            return base.route_metrics(elevation, elevation_gradient, route_cum_distance, distance, self.route_num)
+
+        return self._lazy('metrics', build)
+
+    def route_map(self):
+        """ Interactive map of the route; output of route_map() """
+        return base.route_map(self.gdf_route)
+
+    def profile_plot(self):
+        """ Elevation and grade profiles; output of profile_plot() """
+        elevation, elevation_gradient, route_cum_distance, _ = self.gradient
+        return base.profile_plot(elevation, elevation_gradient, route_cum_distance, self.route_num)
+
+
+def clear_route_contexts():
+    """ Forget all memoized route contexts, e.g. after the input files change. """
+    _route_contexts.clear()
 
 
 def route_analysis_all(route_num, shapefile, rasterfile):
@@ -21,45 +166,15 @@ def route_analysis_all(route_num, shapefile, rasterfile):
     route_plot: elevation and grade profiles for desired route
     display_metrics: results of metrics calculations
     """
-
-    # Load shape file into GeoDataFrame
-    # with extra column ROUTE_NUM = (last argument)
-    route_shp = base.read_shape(shapefile, route_num)
-
-    # Use 2D coordinates and elevation rasterfile to generate
-    # elevations and elevation gradiant at each point.
-    (
-        elevation,
-        elevation_gradient,
-        route_cum_distance,
-        distance
-        ) = base.gradient(route_shp, rasterfile)
-
-    # Build dataframe of 2D coordinates making up bus route
-    linestring_route_df = base.extract_point_df(route_shp)
-
-    # From dataframe containing route coordinates and list of gradients
-    # at each point on route, combine into route GeoDataFrame with rows
-    # corresponsing to points on route and columns;
-    #   'gradient'
-    #       - value of gratent per rout point
-    #   'geometry'
-    #       - contains shapely.Line objects conneting each point on
-    # route
-    gdf_route = base.make_multi_lines(linestring_route_df, elevation_gradient)
+    context = RouteContext.get(route_num, shapefile, rasterfile)
 
     # Use package folium to create an interactive map for the desired
     # route.
-    map_display = base.route_map(gdf_route)
+    map_display = context.route_map()
 
-    route_plot = base.profile_plot(
-        elevation,
-        elevation_gradient,
-        route_cum_distance,
-        route_num,
-        )
+    route_plot = context.profile_plot()
 
-    display_metrics, _ = base.route_metrics(elevation, elevation_gradient, route_cum_distance, distance, route_num)
+    display_metrics, _ = context.metrics
 
     return map_display, route_plot, display_metrics
 
@@ -79,15 +194,9 @@ def route_analysis_profile(route_num, shapefile, rasterfile):
     -------
     route_plot: elevation and grade profiles for desired route
     """
-    route_shp = base.read_shape(shapefile, route_num)
-
-    linestring_route_df = base.extract_point_df(route_shp)
-
-    elevation, elevation_gradient, route_cum_distance, distance = base.gradient(route_shp, rasterfile)
+    context = RouteContext.get(route_num, shapefile, rasterfile)
 
-    gdf_route = base.make_multi_lines( linestring_route_df, elevation_gradient)
-
-    route_plot = base.profile_plot(elevation, elevation_gradient, route_cum_distance, route_num)
+    route_plot = context.profile_plot()
 
     return route_plot
 
@@ -107,15 +216,9 @@ def route_analysis_map(route_num, shapefile, rasterfile):
     -------
     map_display: interactive map for desired route
     """
-    route_shp = base.read_shape(shapefile, route_num)
-
-    linestring_route_df = base.extract_point_df(route_shp)
-
-    elevation, elevation_gradient, route_cum_distance, distance = base.gradient(route_shp, rasterfile)
+    context = RouteContext.get(route_num, shapefile, rasterfile)
 
-    gdf_route = base.make_multi_lines( linestring_route_df, elevation_gradient)
-
-    map_display = base.route_map(gdf_route)
+    map_display = context.route_map()
 
     return map_display
 
@@ -136,13 +239,10 @@ def route_analysis_df(route_num, shapefile, rasterfile):
     gdf_route: geodataframe with columns ['gradient', 'geometry']
 
     """
-    route_shp = base.read_shape(shapefile, route_num)
-
-    linestring_route_df = base.extract_point_df(route_shp)
-
-    elevation, elevation_gradient, route_cum_distance, distance = base.gradient(route_shp, rasterfile)
+    context = RouteContext.get(route_num, shapefile, rasterfile)
 
-    gdf_route = base.make_multi_lines( linestring_route_df, elevation_gradient)
+    # Copy so changes by the caller don't leak into the shared context.
+    gdf_route = context.gdf_route.copy()
 
     return gdf_route
 
@@ -162,13 +262,8 @@ def route_analysis_metrics(route_num, shapefile, rasterfile):
     -------
     display_metrics: results of metrics calculations
     """
-    route_shp = base.read_shape(shapefile, route_num)
+    context = RouteContext.get(route_num, shapefile, rasterfile)
 
-    linestring_route_df = base.extract_point_df(route_shp)
-
-    elevation, elevation_gradient, route_cum_distance, distance = base.gradient(route_shp, rasterfile)
-
-    display_metrics, _ = base.route_metrics(elevation, elevation_gradient, route_cum_distance, distance, route_num)
+    display_metrics, _ = context.metrics
 
     return display_metrics
-
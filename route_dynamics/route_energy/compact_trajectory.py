@@ -0,0 +1,402 @@
+""" Compact, array backed version of RouteTrajectory.
+
+    A RouteTrajectory keeps its results in a GeoDataFrame with a shapely
+    LineString per route point, and copies the frame every time a column
+    is added. 'CompactRouteTrajectory' holds the same columns as
+    contiguous arrays in '__slots__' (no per-instance dict and no Python
+    object per point), so thousands of trajectories fit in memory at
+    once. The GeoDataFrame is only built on demand, for plotting or
+    export, by 'to_geodataframe()'.
+    """
+from ..route_elevation import base as re_base
+from . import constant_a as ca
+from . import longi_dynam_model as ldm
+from .route_geometry import RouteGeometry
+
+import numpy as np
+
+
+def mass_profile(geometry, mass_array, unloaded_bus_mass):
+    """ Bus mass at every route point from a list of masses per stop, the
+        same way RouteTrajectory.calculate_mass(alg='list_per_stop')
+        does; each stop's mass holds until the next stop and the route
+        starts and ends unloaded.
+
+        Args:
+            geometry: RouteGeometry with 'stop_nn_indicies'
+            mass_array: mass at each stop, (num_trips, num_stops) for
+                many trips, or None for an unloaded bus
+            unloaded_bus_mass: mass of the empty bus [kg]
+
+        Returns:
+            mass: array of length geometry.num_pts, (num_trips,
+                num_pts) for many trips
+        """
+
+    if mass_array is None:
+        return unloaded_bus_mass * np.ones(geometry.num_pts)
+
+    return ldm.mass_from_stops(
+        geometry.num_pts,
+        geometry.stop_nn_indicies,
+        mass_array,
+        unloaded_bus_mass,
+        )
+
+
+def route_kinematics(geometry, bus_speed_model, a_m=1.0, v_lim=15.0):
+    """ Velocity, acceleration and time steps along the route for the
+        bus speed models of RouteTrajectory;
+            - 'stopped_at_stops__15mph_between'
+            - 'constant_15mph'
+            - 'const_accel_between_stops_and_speed_lim'
+
+        For the constant acceleration model 'a_m' and 'v_lim' may be
+        arrays of shape (..., 1), giving arrays of shape (...,
+        num_pts).
+
+        Returns:
+            velocity, acceleration, delta_time: arrays of length
+                geometry.num_pts, the same as the RouteTrajectory
+                'velocity', 'acceleration' and 'delta_time' columns.
+            route_time: time along the route.
+        """
+
+    if bus_speed_model in [
+        'constant_15mph',
+        'stopped_at_stops__15mph_between'
+        ]:
+
+        velocity = ldm.simple_model_velocity(
+            geometry.is_bus_stop,
+            bus_speed_model,
+            )
+
+        # Backward difference time steps and accelerations, as in
+        # RouteTrajectory's 'finite_diff' algorithm.
+        delta_time = ldm.finite_diff_delta_time(
+            velocity,
+            geometry.distance_from_last_point,
+            )
+        route_time = np.append(0, np.cumsum(delta_time[1:]))
+        acceleration = ldm.finite_diff_acceleration(velocity, delta_time)
+
+    elif bus_speed_model == 'const_accel_between_stops_and_speed_lim':
+
+        x_ls, x_ns = geometry.stop_distances()
+        acceleration, velocity, route_time = ca.const_a_kinematics(
+            x_ls,
+            x_ns,
+            geometry.is_bus_stop,
+            a_m,
+            v_lim,
+            )
+        delta_time = np.diff(route_time, axis=-1, prepend=route_time[..., :1])
+
+    else:
+        raise ldm.IllegalArgumentError(
+            "'bus_speed_model' must be 'stopped_at_stops__15mph_between', "
+            "'constant_15mph' or 'const_accel_between_stops_and_speed_lim'"
+            )
+
+    return velocity, acceleration, delta_time, route_time
+
+
+def batch_energy(
+    geometry,
+    mass,
+    bus_speed_model='const_accel_between_stops_and_speed_lim',
+    a_m=1.0,
+    v_lim=15.0,
+    charging_power_max=0.,
+    gradient=None,
+    integration='rectangle',
+    **force_params
+    ):
+    """ Route energy for many scenarios (e.g. one bus mass profile per
+        trip) over one geometry, the forces, power and energy of all of
+        them evaluated as (num_scenarios, num_pts) arrays.
+
+        Args:
+            geometry: RouteGeometry with bus stops assigned
+            mass: bus mass [kg], scalar or broadcastable to
+                (num_scenarios, num_pts), e.g. from
+                longi_dynam_model.mass_from_stops
+            a_m, v_lim: constant acceleration model parameters, scalars
+                or (num_scenarios, 1)
+            charging_power_max: regen limit [W], scalar or
+                (num_scenarios, 1)
+            gradient: road grade, DEFAULT geometry.gradient, or an
+                array broadcastable to (num_scenarios, num_pts)
+            integration: 'rectangle' or 'trapezoid', see
+                longi_dynam_model.energy_increments
+
+            Other keyword arguments are passed to
+            longi_dynam_model.longitudinal_forces (and so may be
+            (num_scenarios, 1) arrays too).
+
+        Returns:
+            energy: array of shape (num_scenarios,), the same quantity
+                as RouteTrajectory.energy_from_route() [J]
+        """
+
+    velocity, acceleration, delta_time, _ = route_kinematics(
+        geometry,
+        bus_speed_model,
+        a_m=a_m,
+        v_lim=v_lim,
+        )
+
+    if gradient is None:
+        gradient = geometry.gradient
+
+    grav_force, roll_fric, aero_drag, inertia = ldm.longitudinal_forces(
+        velocity,
+        acceleration,
+        gradient,
+        np.asarray(mass, dtype=float),
+        **force_params
+        )
+
+    power_output = ldm.battery_power(
+        grav_force,
+        roll_fric,
+        aero_drag,
+        inertia,
+        velocity,
+        charging_power_max,
+        )
+
+    increments = ldm.energy_increments(power_output, delta_time, integration)
+
+    return np.sum(increments[..., 1:], axis=-1)
+
+
+class CompactRouteTrajectory(object):
+    """ Structure-of-arrays route trajectory. Has the columns of
+        RouteTrajectory.route_df as attributes, minus the shapely
+        geometry.
+        """
+
+    # Per-point columns, in RouteTrajectory.route_df order.
+    columns = (
+        'gradient',
+        'distance_from_last_point',
+        'elevation',
+        'cum_distance',
+        'is_bus_stop',
+        'velocity',
+        'delta_time',
+        'acceleration',
+        'mass',
+        'grav_force',
+        'roll_fric',
+        'aero_drag',
+        'inertia',
+        'power_output',
+        'cum_energy',
+        )
+
+    __slots__ = columns + (
+        'coordinates',
+        'route_time',
+        'stop_nn_indicies',
+        'bus_speed_model',
+        'a_m',
+        'v_lim',
+        'unloaded_bus_mass',
+        'charging_power_max',
+        'energy_integration',
+        )
+
+    def __init__(self,
+        geometry,
+        bus_speed_model='stopped_at_stops__15mph_between',
+        mass_array=None,
+        unloaded_bus_mass=12927,
+        charging_power_max=0.,
+        a_m=1.0,
+        v_lim=15.0,
+        energy_integration='rectangle',
+        dtype=np.float64,
+        mass=None,
+        ):
+        """ Run the longitudinal dynamics model on a RouteGeometry.
+
+            Args:
+                geometry: RouteGeometry with bus stops assigned
+                mass: bus mass at every route point [kg], to use
+                    instead of building it from 'mass_array' per stop
+                dtype: float type of the stored columns, np.float32
+                    halves the memory. The model is always evaluated
+                    in float64.
+
+                The other arguments are those of RouteTrajectory.
+            """
+
+        self.bus_speed_model = bus_speed_model
+        self.a_m = a_m
+        self.v_lim = v_lim
+        self.unloaded_bus_mass = unloaded_bus_mass
+        self.charging_power_max = charging_power_max
+        self.energy_integration = energy_integration
+
+        velocity, acceleration, delta_time, route_time = route_kinematics(
+            geometry,
+            bus_speed_model,
+            a_m=a_m,
+            v_lim=v_lim,
+            )
+
+        if mass is None:
+            mass = mass_profile(geometry, mass_array, unloaded_bus_mass)
+        else:
+            mass = np.asarray(mass, dtype=float)
+
+        forces = ldm.longitudinal_forces(
+            velocity,
+            acceleration,
+            geometry.gradient,
+            mass,
+            )
+        grav_force, roll_fric, aero_drag, inertia = forces
+
+        power_output = ldm.battery_power(*forces, velocity, charging_power_max)
+
+        def store(values):
+            return np.ascontiguousarray(values, dtype=dtype)
+
+        self.coordinates = store(geometry.coordinates)
+        self.gradient = store(geometry.gradient)
+        self.distance_from_last_point = store(geometry.distance_from_last_point)
+        if geometry.elevation is None:
+            self.elevation = None
+        else:
+            self.elevation = store(geometry.elevation)
+        self.cum_distance = store(geometry.cum_distance)
+        self.is_bus_stop = np.ascontiguousarray(geometry.is_bus_stop, dtype=bool)
+        self.stop_nn_indicies = geometry.stop_nn_indicies
+
+        self.velocity = store(velocity)
+        self.delta_time = store(delta_time)
+        self.acceleration = store(acceleration)
+        self.route_time = store(route_time)
+        self.mass = store(mass)
+        self.grav_force = store(grav_force)
+        self.roll_fric = store(roll_fric)
+        self.aero_drag = store(aero_drag)
+        self.inertia = store(inertia)
+        self.power_output = store(power_output)
+        self.cum_energy = store(np.cumsum(ldm.energy_increments(
+            power_output,
+            delta_time,
+            energy_integration,
+            )))
+
+    @classmethod
+    def from_files(cls,
+        route_num,
+        shp_filename,
+        elv_raster_filename,
+        stop_coords=None,
+        geometry_cache=None,
+        **kwargs
+        ):
+        """ Build straight from the route shapefile (or RouteStore) and
+            elevation raster (or sampler), without a GeoDataFrame.
+            Keyword arguments are passed to CompactRouteTrajectory().
+            """
+
+        geometry = RouteGeometry.from_files(
+            route_num,
+            shp_filename,
+            elv_raster_filename,
+            stop_coords=stop_coords,
+            geometry_cache=geometry_cache,
+            )
+
+        return cls(geometry, **kwargs)
+
+    @classmethod
+    def from_trajectory(cls, trajectory, dtype=np.float64):
+        """ Compact copy of an existing RouteTrajectory. The mass is
+            copied point by point, so any 'mass_alg' carries over.
+            """
+
+        return cls(
+            RouteGeometry.from_trajectory(trajectory),
+            bus_speed_model=trajectory.bus_speed_model,
+            mass_array=trajectory.mass_array,
+            mass=trajectory.route_df.mass.values,
+            unloaded_bus_mass=trajectory.unloaded_bus_mass,
+            charging_power_max=trajectory.charging_power_max,
+            a_m=trajectory.a_m,
+            v_lim=trajectory.v_lim,
+            energy_integration=trajectory.energy_integration,
+            dtype=dtype,
+            )
+
+    @property
+    def num_pts(self):
+        return len(self.gradient)
+
+    @property
+    def nbytes(self):
+        """ Memory held by the per-point arrays, in bytes. """
+        arrays = [getattr(self, name) for name in self.columns]
+        arrays += [self.coordinates, self.route_time]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def energy_from_route(self, integration=None):
+        """ Same as RouteTrajectory.energy_from_route() """
+
+        if integration is None:
+            integration = self.energy_integration
+
+        increments = ldm.energy_increments(
+            self.power_output.astype(float),
+            self.delta_time.astype(float),
+            integration,
+            )
+
+        energy = np.sum(increments[1:])
+
+        return energy
+
+    def resampled_trace(self, dt=1.0, columns=ldm.TRACE_COLUMNS):
+        """ Same as RouteTrajectory.resampled_trace() """
+
+        return ldm.resample_trace(
+            self.route_time,
+            {name: getattr(self, name) for name in columns},
+            dt=dt,
+            )
+
+    def iter_resampled_trace(self, dt=1.0, chunk_size=3600,
+        columns=ldm.TRACE_COLUMNS):
+        """ Same as RouteTrajectory.iter_resampled_trace() """
+
+        return ldm.iter_resampled_trace(
+            self.route_time,
+            {name: getattr(self, name) for name in columns},
+            dt=dt,
+            chunk_size=chunk_size,
+            )
+
+    def to_geodataframe(self):
+        """ Build the RouteTrajectory style GeoDataFrame, with a shapely
+            LineString per route point, for plotting or export.
+            """
+
+        route_df = re_base.make_multi_lines(
+            self.coordinates.astype(float),
+            self.gradient,
+            )
+
+        route_df = route_df.assign(**{
+            name: getattr(self, name)
+            for name in self.columns[1:]
+            if getattr(self, name) is not None
+            })
+
+        return route_df
@@ -50,153 +50,167 @@ def const_a_dynamics(route_df, a_m, v_lim):
     #         = a_m sqrt(2 x_1 / a_m)
     #         = sqrt(2 x_1 a_m)
 
-    # Calculate distances to next and last bus stop.
-    x_ns = np.zeros(len(route_df.index))
-    x_ls = np.zeros(len(route_df.index))
-
-    for i in range(len(x_ns)):
-        # set values to Nan if bus stop
-        if route_df.at[i, 'is_bus_stop']:
-            x_ns[i] = 0.
-            x_ls[i] = 0.
-            # move to next point
-            continue
-        else:
-            # Calculate 'x_ns';
-            # Iterate through remaining indicies to count distance to
-            # next stop.
-            for j in range(i+1, len(x_ns)):
-                # add distance to next point to 'x_ns'
-                x_ns[i] += route_df.at[j, 'distance_from_last_point']
-                if route_df.at[j, 'is_bus_stop']:
-                    break # done calulating 'x_ns' at this point
-                # elif not bus stop: move to nest point, add distance
-
-            # Calculate 'x_ls';
-            # Iterate through previous indicies to cout distance to
-            # last stop.
-            for j in range(i, 0, -1):
-                # Inclusive start to range because distances are
-                # backward difference. Dont need to include 'j=0'
-                # because the first point has no backward difference.
-                if route_df.at[j, 'is_bus_stop']:
-                    break # done calulating x_ls at this point
-                x_ls[i] += route_df.at[j, 'distance_from_last_point']
+    #
+    # The distances 'x_ls' and 'x_ns' follow from the cumulative
+    # distance along the route and the indicies of the last and next
+    # stop of every point, so the whole calculation is done with
+    # arrays in linear time.
 
+    distance_from_last_point = route_df.distance_from_last_point.values
+    is_bus_stop = route_df.is_bus_stop.values
 
-    # Define cutoff distance for acceleration and deceleration
-    x_a = v_lim**2. / (2*a_m)
+    x_ls, x_ns = stop_distances(distance_from_last_point, is_bus_stop)
 
-    x = route_df.cum_distance.values
-    v = np.zeros(len(route_df.index))
-    a = np.zeros(len(route_df.index))
-
-    t = np.zeros(len(route_df.index))
-
-    for i in range(len(x_ns)):
-        # If close to last bus stop but far from next
-        if (
-            x_ls[i] <= x_a
-            and
-            x_ns[i] > x_a
-            and
-            not route_df.at[i, 'is_bus_stop']
-            ):
-
-            a[i] = a_m
-            v[i] = np.sqrt(2*x_ls[i]*a_m)
-
-            if i > 0:
-                # add time to clock
-                t[i] += t[i-1]
-
-                delta_t = np.sqrt(2/a_m)*(
-                    np.sqrt(x_ls[i]) - np.sqrt(x_ls[i-1])
-                    )
-                t[i] += delta_t
-
-
-        # or if close to next stop and far from last
-        elif (
-            x_ls[i] > x_a
-            and
-            x_ns[i] <= x_a
-            and
-            not route_df.at[i, 'is_bus_stop']
-            ):
-
-            a[i] = -a_m
-            v[i] = np.sqrt(2*x_ns[i]*a_m)
-
-            # add time to clock
-            t[i] += t[i-1]
-
-            delta_t = np.sqrt(2/a_m)*(
-                - np.sqrt(x_ns[i]) + np.sqrt(x_ns[i-1])
-                )
-            t[i] += delta_t
-
-        # or far from both last and next stop, go speed limit
-        elif (
-            x_ls[i] > x_a
-            and
-            x_ns[i] > x_a
-            and
-            not route_df.at[i, 'is_bus_stop']
-            ):
-            a[i] = 0
-            v[i] = v_lim
-
-            # add time to clock
-            t[i] += t[i-1]
-
-            delta_t = (x_ls[i] - x_ls[i-1])/v_lim
-            t[i] += delta_t
-
-        # But if too close to both last and next bus stops,
-        elif (
-            x_ls[i] <= x_a
-            and
-            x_ns[i] <= x_a
-            and
-            not route_df.at[i, 'is_bus_stop']
-            ):
-
-            # add time to clock
-            t[i] += t[i-1]
-
-            if x_ls[i] < x_ns[i]:
-
-                a[i] = a_m
-                v[i] = np.sqrt(2*x_ls[i]*a_m)
-
-                delta_t = np.sqrt(2/a_m)*(
-                    np.sqrt(x_ls[i]) - np.sqrt(x_ls[i-1])
-                    )
-
-            elif x_ls[i] >= x_ns[i]:
-
-                a[i] = -a_m
-                v[i] = np.sqrt(2*x_ns[i]*a_m)
-
-                delta_t = np.sqrt(2/a_m)*(
-                    - np.sqrt(x_ns[i]) + np.sqrt(x_ns[i-1])
-                    )
-
-            # tick tock
-            t[i] += delta_t
-
-        elif route_df.at[i, 'is_bus_stop']:
-            # still want to progress time as if decellerating
-            t[i] += t[i-1]
-
-            delta_t = np.sqrt(2/a_m)*(
-                - np.sqrt(x_ns[i]) + np.sqrt(x_ns[i-1])
-                )
-            t[i] += delta_t
+    a, v, t = const_a_kinematics(x_ls, x_ns, is_bus_stop, a_m, v_lim)
 
     return a, v, x_ls, x_ns, t
 
 
+def stop_distances(distance_from_last_point, is_bus_stop):
+    """ Distance from each route point to the last and to the next bus
+        stop.
+
+        Args:
+            distance_from_last_point: backward difference distances
+                between route points, the first element is ignored.
+            is_bus_stop: boolean array marking bus stops.
+
+        Returns:
+            x_ls: distance since the last bus stop, or since the start
+                of the route before the first stop. Zero at stops.
+            x_ns: distance to the next bus stop, or to the end of the
+                route after the last stop. Zero at stops.
+        """
+
+    is_bus_stop = np.asarray(is_bus_stop, dtype=bool)
+    num_pts = len(is_bus_stop)
+    idx = np.arange(num_pts)
+
+    # Cumulative distance from the backward differences, the first
+    # point has no backward difference.
+    back_diff = np.array(distance_from_last_point, dtype=float)
+    back_diff[0] = 0.
+    cum_distance = np.cumsum(back_diff)
+
+    # Index of the last stop at or before each point (start of route
+    # if there is none) and of the next stop at or after each point
+    # (end of route if there is none).
+    last_stop_idx = np.maximum.accumulate(np.where(is_bus_stop, idx, 0))
+    next_stop_idx = np.minimum.accumulate(
+        np.where(is_bus_stop, idx, num_pts - 1)[::-1]
+        )[::-1]
+
+    x_ls = np.where(
+        is_bus_stop,
+        0.,
+        cum_distance - cum_distance[last_stop_idx],
+        )
+    x_ns = np.where(
+        is_bus_stop,
+        0.,
+        cum_distance[next_stop_idx] - cum_distance,
+        )
+
+    return x_ls, x_ns
+
+
+def const_a_kinematics(x_ls, x_ns, is_bus_stop, a_m, v_lim):
+    """ Acceleration, velocity and time at each route point for the
+        constant acceleration model, given the distances to the last and
+        next stops.
+
+        'a_m' and 'v_lim' may be arrays, in which case they broadcast
+        against the route points (last axis), e.g. shape (k, 1) gives
+        outputs of shape (k, num_pts).
+
+        Returns:
+            a, v, t
+        """
+
+    a_m = np.asarray(a_m, dtype=float)
+    v_lim = np.asarray(v_lim, dtype=float)
+    is_bus_stop = np.asarray(is_bus_stop, dtype=bool)
+    not_stop = np.logical_not(is_bus_stop)
 
+    # Define cutoff distance for acceleration and deceleration
+    x_a = v_lim**2. / (2*a_m)
 
+    near_last = x_ls <= x_a
+    far_last = x_ls > x_a
+    near_next = x_ns <= x_a
+    far_next = x_ns > x_a
+
+    # The four regimes away from stops;
+    #     close to last bus stop but far from next : accelerate
+    #     close to next stop and far from last : decelerate
+    #     far from both last and next stop : speed limit
+    #     too close to both : accelerate or decelerate depending on
+    #         which stop is closer
+    accel_away = near_last & far_next & not_stop
+    decel_toward = far_last & near_next & not_stop
+    at_speed_lim = far_last & far_next & not_stop
+    near_both = near_last & near_next & not_stop
+
+    accelerating = accel_away | (near_both & (x_ls < x_ns))
+    decelerating = decel_toward | (near_both & (x_ls >= x_ns))
+
+    # Distances at the previous point. A stop is its own next stop
+    # (x_ns = 0), so a point just after a stop looks back to the stop's
+    # distance to the following stop instead, x_ns + x_ls. The first
+    # point looks back to the last point, but adds no time (below).
+    x_ls_prev = np.roll(x_ls, 1)
+    x_ns_prev = np.where(
+        np.roll(is_bus_stop, 1),
+        x_ns + x_ls,
+        np.roll(x_ns, 1),
+        )
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta_t_accel = np.sqrt(2/a_m)*(np.sqrt(x_ls) - np.sqrt(x_ls_prev))
+        delta_t_decel = np.sqrt(2/a_m)*(- np.sqrt(x_ns) + np.sqrt(x_ns_prev))
+        delta_t_lim = (x_ls - x_ls_prev)/v_lim
+
+        v_accel = np.sqrt(2*x_ls*a_m)
+        v_decel = np.sqrt(2*x_ns*a_m)
+
+    shape = np.broadcast(x_ls, a_m, v_lim).shape
+
+    a = np.zeros(shape)
+    a = np.where(accelerating, a_m, a)
+    a = np.where(decelerating, -a_m, a)
+
+    v = np.zeros(shape)
+    v = np.where(accelerating, v_accel, v)
+    v = np.where(decelerating, v_decel, v)
+    v = np.where(at_speed_lim, v_lim, v)
+
+    # Time still progresses at stops as if decelerating.
+    delta_t = np.zeros(shape)
+    delta_t = np.where(accelerating, delta_t_accel, delta_t)
+    delta_t = np.where(decelerating | is_bus_stop, delta_t_decel, delta_t)
+    delta_t = np.where(at_speed_lim, delta_t_lim, delta_t)
+    # The clock starts at the first point.
+    delta_t[..., 0] = 0.
+
+    t = np.cumsum(delta_t, axis=-1)
+
+    # Points that fall in no regime (only possible with NaN distances)
+    # reset the clock to zero.
+    in_no_regime = np.broadcast_to(
+        np.logical_not(accelerating | decelerating | at_speed_lim | is_bus_stop),
+        shape,
+        )
+    if np.any(in_no_regime):
+        idx = np.broadcast_to(np.arange(shape[-1]), shape)
+        last_reset = np.maximum.accumulate(
+            np.where(in_no_regime, idx, -1),
+            axis=-1,
+            )
+        offset = np.where(
+            last_reset >= 0,
+            np.take_along_axis(t, np.maximum(last_reset, 0), axis=-1),
+            0.,
+            )
+        t = t - offset
+
+    return a, v, t
@@ -1,61 +1,110 @@
 """ Knn Classifier for SEDS hw 4 """
 import numpy as np
 import pandas as pd
+from scipy.spatial import cKDTree
+
+
+# Mean Earth radius in meters, used by the 'haversine' metric.
+EARTH_RADIUS = 6371008.8
+
+
+def _as_point_array(pts):
+    """ Convert a list/array of points (tuples, rows or scalars) to a
+        float array of shape (num_pts, dim).
+        """
+    pts = np.array(list(pts), dtype=float)
+    if pts.ndim == 1:
+        pts = pts.reshape(-1, 1)
+    return pts
+
+
+def _lonlat_to_unit_xyz(pts):
+    """ Map (longitude, latitude) in degrees onto the unit sphere. """
+    lon = np.radians(pts[:, 0])
+    lat = np.radians(pts[:, 1])
+    return np.column_stack([
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+        ])
+
+
+class NeighborIndex(object):
+    """ Spatial index (KD-tree) over a set of candidate points, built
+        once and queried for the nearest neighbors of many test points.
+
+        metric:
+            - 'euclidean' : straight line distance in the coordinate
+                units.
+            - 'haversine' : great circle distance in meters, points
+                given as (longitude, latitude) in degrees. The tree is
+                built on the unit sphere, where chord length orders
+                points the same way as great circle distance.
+        """
+
+    def __init__(self, candidate_pts, metric='euclidean'):
+
+        if metric not in ['euclidean', 'haversine']:
+            raise ValueError("metric must be 'euclidean' or 'haversine'")
+
+        self.metric = metric
+        self.candidate_pts = candidate_pts
+        self.num_pts = len(candidate_pts)
+
+        self.tree = cKDTree(self._transform(_as_point_array(candidate_pts)))
+
+    def _transform(self, pts):
+        if self.metric == 'haversine':
+            return _lonlat_to_unit_xyz(pts)
+        return pts
+
+    def query(self, test_pts, k=1):
+        """ Returns the indicies of the 'k' nearest candidate points to
+            each test point and the distances to them, both arrays of
+            shape (num_test_pts, k).
+            """
+        k = min(k, self.num_pts)
+
+        distances, indicies = self.tree.query(
+            self._transform(_as_point_array(test_pts)),
+            k=list(range(1, k+1)),
+            )
+
+        if self.metric == 'haversine':
+            # chord length on unit sphere -> great circle distance
+            distances = 2 * EARTH_RADIUS * np.arcsin(
+                np.clip(distances / 2, 0., 1.)
+                )
+
+        return indicies, distances
 
 
 def find_knn(
     k,
     candidate_pts,
     test_pts,
-    weight=None
+    weight=None,
+    metric='euclidean',
+    index=None,
     ):
     """ Takes list of points as candidate neighbors (route points) and
         returns one for reach test point (stops) which is the nearest
         route point to the stop.
+
+        A prebuilt 'NeighborIndex' over 'candidate_pts' can be passed
+        as 'index' to skip building the KD-tree again, in which case
+        'metric' is taken from the index.
         """
 
-    num_train_pts = len(candidate_pts)
-    num_test_pts = len(test_pts)
     # Find the k nearest neighbors.
+    if index is None:
+        index = NeighborIndex(candidate_pts, metric=metric)
 
-    # Initialize array to store distances between data points
-    distance_array = np.zeros((num_test_pts, num_train_pts))
-
-    # Loop through rows in test data
-    for test_idx in range(num_test_pts):
-        test_coord = test_pts[test_idx]
-
-        # Loop through rows in training data
-        for train_idx in range(num_train_pts):
-            train_coord = candidate_pts[train_idx]
-
-            # Calc distance between training_data and data
-            dist = euclidean_distance(
-                train_coord,
-                test_coord
-                )
+    # Indicies of the k nearest neighbors for each unclassified data
+    # point, nearest first.
+    k_nearest_indicies, k_nearest_distances = index.query(test_pts, k)
 
-            # Store distance in array
-            distance_array[test_idx, train_idx] = dist
-
-    # print('distance_array = ',distance_array)
-    # sort rows corresponding to each unclassified data point
-    sorting_idicies = np.argsort(distance_array)
-
-    # Keep only first k columns, corresponding to k nearest neighbors
-    # for each unclassified data point
-    k_nearest_indicies = sorting_idicies[:,:k]
-    # print(k_nearest_indicies.shape)
-    # print('k_nearest_indicies = ',k_nearest_indicies)
-    k_nearest_distances = distance_array[
-        np.arange(num_test_pts)[:,None], k_nearest_indicies
-        ]
-
-    # Build array to hold class of each training data point
-    points_array = np.asarray([candidate_pts]*num_test_pts)
-    k_nearest_neighbors = points_array[
-        np.arange(num_test_pts)[:,None], k_nearest_indicies
-        ]
+    k_nearest_neighbors = np.asarray(candidate_pts)[k_nearest_indicies]
 
     return k_nearest_indicies, k_nearest_neighbors
 
@@ -15,8 +15,10 @@
 from ..route_elevation import base as re_base
 from . import knn
 from . import constant_a as ca
+from .. import timing
 
 import numpy as np
+import pandas as pd
 import geopandas as gpd
 
 
@@ -25,6 +27,428 @@ class IllegalArgumentError(ValueError):
     pass
 
 
+def longitudinal_forces(
+    velocity,
+    acceleration,
+    gradient,
+    mass,
+    fric_coeff=0.01,
+    air_density=1.225,
+    v_wind=0.0,
+    drag_coeff=0.34,
+    bus_front_area=2.6*3.3,
+    gravi_accel=9.81,
+    ):
+    """ Forces on the bus in the longitudinal dynamics model.
+
+        All array arguments broadcast against each other, so a route's
+        arrays of shape (num_pts,) can be evaluated for many scenarios
+        at once by passing parameters of shape (num_scenarios, 1).
+
+        Args:
+            velocity, acceleration, gradient: route arrays
+            mass: loaded bus mass [kg], scalar or array
+            fric_coeff: rolling friction coefficient
+            air_density: air density in kg/m3; consant for now,
+                eventaully input from weather API
+            v_wind: wind speed; figure out component, and also will
+                come from weather API
+            drag_coeff: drag coefficient estimate from paper (???)
+            bus_front_area: frontal area of 40 foot bus in m^2
+                (2.6 m wide, 3.3 m high)
+            gravi_accel: gravitational acceleration in m/s^2
+
+        Returns:
+            (grav_force, roll_fric, aero_drag, inertia)
+        """
+
+    grad_angle = np.arctan(gradient)
+
+    # Calculate the gravitational force
+    grav_force = -(
+        mass * gravi_accel * np.sin(grad_angle)
+        )
+
+    # Calculate the rolling friction
+    roll_fric = -(
+        fric_coeff * mass * gravi_accel * np.cos(grad_angle)
+        )
+
+    # Calculate the aerodynamic drag
+    aero_drag = -(
+        drag_coeff
+        *
+        bus_front_area
+        *
+        (air_density/2)
+        *
+        (velocity-v_wind)
+        )
+
+    # Calculate the inertial force
+    inertia = mass * acceleration
+
+    return (grav_force, roll_fric, aero_drag, inertia)
+
+
+def battery_power(
+    grav_force,
+    roll_fric,
+    aero_drag,
+    inertia,
+    velocity,
+    charging_power_max=0.,
+    ):
+    """ Battery power from the longitudinal forces, with regen capped
+        at 'charging_power_max' [W] (np.inf for the raw power). Arrays
+        broadcast as for longitudinal_forces.
+        """
+
+    f_resist = grav_force + roll_fric + aero_drag
+
+    f_traction = inertia - f_resist
+
+    return np.maximum(
+        f_traction * velocity,
+        -np.asarray(charging_power_max, dtype=float),
+        )
+
+
+# 6.7056 m/s (= 15 mph), the speed of the simple bus speed models.
+LAZY_CHOICE_FOR_SPEED = 6.7056
+
+
+def simple_model_velocity(is_bus_stop, bus_speed_model):
+    """ Velocity at each route point for the bus speed models that
+        don't depend on the route geometry;
+            - 'constant_15mph' : 15 mph everywhere
+            - 'stopped_at_stops__15mph_between' : 0 at stops and at
+                both ends of the route, 15 mph elsewhere
+        """
+
+    if bus_speed_model == 'constant_15mph':
+        return LAZY_CHOICE_FOR_SPEED * np.ones(len(is_bus_stop))
+
+    # Zero velocity at stops and at both ends of the route.
+    moving = np.logical_not(is_bus_stop)*1
+    moving[0] = 0
+    moving[-1] = 0
+
+    return moving * LAZY_CHOICE_FOR_SPEED
+
+
+def finite_diff_delta_time(velocity, distance_from_last_point):
+    """ Backward difference time steps, each segment driven at the mean
+        of the velocities at its ends; NaN at the first point. A segment
+        between two stops (no speed at either end) is not driven and
+        takes no time.
+        """
+
+    segment_avg_velocities = (velocity + np.append(0, velocity[:-1]))/2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta_time = np.where(
+            segment_avg_velocities > 0,
+            distance_from_last_point / segment_avg_velocities,
+            0.,
+            )
+    delta_time[0] = np.nan
+
+    return delta_time
+
+
+def finite_diff_acceleration(velocity, delta_time):
+    """ Backward difference accelerations, NaN at the first point and 0
+        over segments that take no time.
+        """
+
+    delta_v = np.append(0, np.diff(velocity))
+
+    return np.append(np.nan, np.divide(
+        delta_v[1:],
+        delta_time[1:],
+        out=np.zeros(len(delta_time) - 1),
+        where=delta_time[1:] > 0,
+        ))
+
+
+def energy_increments(power, delta_time, integration='rectangle'):
+    """ Energy used over each route segment, from the power at the
+        route points and the backward difference time steps.
+
+        Args:
+            power: battery power at each point [W], shape (..., num_pts)
+            delta_time: time step ending at each point [s]
+            integration:
+                - 'rectangle' : power at the end of the segment times
+                    its time step, the sum energy_from_route() has
+                    always used
+                - 'trapezoid' : mean of the power at both ends times
+                    the time step, more accurate on coarse spacing. The
+                    first point's power is taken as 0 where it is
+                    undefined (NaN).
+
+        Returns:
+            increments: array of shape (..., num_pts), 0 at the first
+                point [J]
+        """
+
+    power = np.asarray(power, dtype=float)
+    delta_time = np.asarray(delta_time, dtype=float)
+
+    increments = np.zeros(np.broadcast(power, delta_time).shape)
+
+    if integration == 'rectangle':
+        increments[..., 1:] = power[..., 1:] * delta_time[..., 1:]
+
+    elif integration == 'trapezoid':
+        start_power = power[..., :-1].copy()
+        start_power[..., 0] = np.nan_to_num(start_power[..., 0])
+        increments[..., 1:] = (
+            (start_power + power[..., 1:]) / 2 * delta_time[..., 1:]
+            )
+
+    else:
+        raise IllegalArgumentError(
+            "'integration' must be 'rectangle' or 'trapezoid'"
+            )
+
+    return increments
+
+
+def energy_totals(power, delta_time, integration='rectangle'):
+    """ Net, traction and regen energy of a route from a single set of
+        energy_increments; traction sums the segments that draw energy
+        and regen those that return it, so net = traction + regen.
+
+        Returns:
+            (net, traction, regen) [J], regen is negative
+        """
+
+    return _split_increments(energy_increments(power, delta_time, integration))
+
+
+def _split_increments(increments):
+    """ (net, traction, regen) sums of the output of energy_increments. """
+
+    increments = increments[..., 1:]
+
+    net = np.sum(increments, axis=-1)
+    traction = np.sum(np.where(increments > 0, increments, 0.), axis=-1)
+    regen = np.sum(np.where(increments < 0, increments, 0.), axis=-1)
+
+    return net, traction, regen
+
+
+# Columns of the resampled power trace; 'mass' is held (piecewise
+# constant between stops), the others are interpolated linearly.
+TRACE_COLUMNS = ('power_output', 'velocity', 'gradient', 'mass')
+HELD_TRACE_COLUMNS = ('mass',)
+
+
+def iter_resampled_trace(
+    route_time,
+    columns,
+    dt=1.0,
+    chunk_size=3600,
+    held=HELD_TRACE_COLUMNS,
+    ):
+    """ Route point values resampled on a uniform time grid, yielded in
+        chunks so day-long traces never have to be held at once.
+
+        Args:
+            route_time: time the bus reaches each route point [s],
+                non-decreasing
+            columns: dict of column name to array of values at the
+                route points; NaN values (undefined at the first point)
+                are taken as 0
+            dt: time step of the grid [s], e.g. 1. for 1 Hz
+            chunk_size: grid samples per chunk
+            held: columns that keep the value of the last route point
+                reached instead of being interpolated
+
+        Yields:
+            DataFrame with a 'time' column (from the first route point)
+            and one column per entry of 'columns', 'chunk_size' rows
+            (fewer in the last chunk). At route points sharing a time
+            the later point's value is taken.
+        """
+
+    route_time = np.asarray(route_time, dtype=float)
+
+    if np.any(np.diff(route_time) < 0):
+        raise IllegalArgumentError(
+            "'route_time' must be non-decreasing to resample the trace"
+            )
+    if dt <= 0 or chunk_size < 1:
+        raise IllegalArgumentError("'dt' and 'chunk_size' must be positive")
+
+    values = {
+        name: np.nan_to_num(np.asarray(value, dtype=float))
+        for name, value in columns.items()
+        }
+
+    num_samples = int(np.floor((route_time[-1] - route_time[0]) / dt)) + 1
+
+    for start in range(0, num_samples, chunk_size):
+        time = dt * np.arange(start, min(start + chunk_size, num_samples))
+        grid_time = route_time[0] + time
+
+        last_point = np.searchsorted(route_time, grid_time, side='right') - 1
+
+        chunk = {'time': time}
+        for name, value in values.items():
+            if name in held:
+                chunk[name] = value[last_point]
+            else:
+                chunk[name] = np.interp(grid_time, route_time, value)
+
+        yield pd.DataFrame(chunk, columns=['time'] + list(values))
+
+
+def resample_trace(route_time, columns, dt=1.0, held=HELD_TRACE_COLUMNS):
+    """ The whole trace of iter_resampled_trace as one DataFrame. """
+
+    chunks = list(iter_resampled_trace(
+        route_time, columns, dt=dt, chunk_size=2**20, held=held))
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Average passenger mass [kg], used to turn passenger counts into bus
+# mass (the same 80 kg route_riders uses for the KCM loads).
+PASSENGER_MASS = 80.
+
+
+def _check_unloaded_mass(mass, unloaded_bus_mass):
+
+    if np.any(mass < unloaded_bus_mass):
+        raise IllegalArgumentError("Class arg 'unloaded_bus_mass' "
+            "is heavier than values in arg 'mass_array'")
+
+    return mass
+
+
+def mass_from_stops(num_pts, stop_nn_indicies, mass_array, unloaded_bus_mass):
+    """ Bus mass at every route point from the mass leaving each stop;
+        each stop's mass holds until the next stop and the route starts
+        and ends unloaded.
+
+        Args:
+            num_pts: number of route points
+            stop_nn_indicies: route point of each stop
+            mass_array: mass at each stop [kg], shape (num_stops,) or
+                (num_trips, num_stops) for many trips at once
+            unloaded_bus_mass: mass of the empty bus [kg]
+
+        Returns:
+            mass: array of shape (num_pts,) or (num_trips, num_pts)
+        """
+
+    mass_array = np.asarray(mass_array, dtype=float)
+
+    if stop_nn_indicies is None or (
+        mass_array.ndim == 0
+        or
+        mass_array.shape[-1] != np.size(stop_nn_indicies)
+        ):
+        raise IllegalArgumentError(
+            "'stop_coords' and 'mass_array' must be same length"
+            )
+
+    mass = np.full(mass_array.shape[:-1] + (num_pts,), np.nan)
+    mass[..., np.ravel(stop_nn_indicies)] = mass_array
+    mass[..., 0] = unloaded_bus_mass
+    mass[..., -1] = unloaded_bus_mass
+
+    # Forward fill, each point takes the mass of the last point that
+    # has one.
+    last_set = np.maximum.accumulate(
+        np.where(np.isnan(mass), 0, np.arange(num_pts)),
+        axis=-1,
+        )
+    mass = np.take_along_axis(mass, last_set, axis=-1)
+
+    return _check_unloaded_mass(mass, unloaded_bus_mass)
+
+
+def mass_from_segments(num_pts, mass_array, unloaded_bus_mass):
+    """ Bus mass at every route point from the mass on each segment
+        between consecutive points. Each point carries the mass of the
+        segment ending there (the backward difference convention of
+        'distance_from_last_point'); the first point is unloaded.
+
+        Args:
+            num_pts: number of route points
+            mass_array: mass on each segment [kg], shape
+                (num_pts - 1,) or (num_trips, num_pts - 1)
+            unloaded_bus_mass: mass of the empty bus [kg]
+
+        Returns:
+            mass: array of shape (num_pts,) or (num_trips, num_pts)
+        """
+
+    mass_array = np.asarray(mass_array, dtype=float)
+
+    if mass_array.ndim == 0 or mass_array.shape[-1] != num_pts - 1:
+        raise IllegalArgumentError(
+            "'mass_array' per segment must have one value less than "
+            "the number of route points"
+            )
+
+    first = np.full(mass_array.shape[:-1] + (1,), float(unloaded_bus_mass))
+    mass = np.concatenate([first, mass_array], axis=-1)
+
+    return _check_unloaded_mass(mass, unloaded_bus_mass)
+
+
+def mass_from_passenger_series(
+    route_time,
+    times,
+    passengers,
+    unloaded_bus_mass,
+    passenger_mass=PASSENGER_MASS,
+    ):
+    """ Bus mass at every route point from passenger counts recorded
+        over time. Each count holds until the next one; points before
+        the first record take the first count.
+
+        Args:
+            route_time: time the bus reaches each route point [s]
+            times: times of the passenger counts [s], increasing
+            passengers: passenger counts, shape (len(times),) or
+                (num_trips, len(times))
+            unloaded_bus_mass: mass of the empty bus [kg]
+            passenger_mass: mass per passenger [kg]
+
+        Returns:
+            mass: array of shape (num_pts,) or (num_trips, num_pts)
+        """
+
+    times = np.asarray(times, dtype=float)
+    passengers = np.asarray(passengers, dtype=float)
+
+    if times.ndim != 1 or passengers.ndim == 0 or (
+        passengers.shape[-1] != len(times)
+        ):
+        raise IllegalArgumentError(
+            "passenger series needs one count per time"
+            )
+    if len(times) == 0 or np.any(np.diff(times) <= 0):
+        raise IllegalArgumentError(
+            "passenger series times must be increasing"
+            )
+    if np.any(passengers < 0):
+        raise IllegalArgumentError("passenger counts can't be negative")
+
+    record = np.searchsorted(times, route_time, side='right') - 1
+    record = np.maximum(record, 0)
+
+    mass = unloaded_bus_mass + passenger_mass * passengers[..., record]
+
+    return mass
+
+
 class PlottingTools(object):
     """ Place holder for now, but eventually this will wrap up the
         plotting tools written by last quarter's RouteDynamics team.
@@ -54,6 +478,11 @@ class RouteTrajectory(PlottingTools):
         # charging_power_max=50000 # should be kW
         a_m=1.0,
         v_lim=15.0,
+        mass_alg='list_per_stop',
+        energy_integration='rectangle',
+        geometry_cache=None,
+        trace_memory=False,
+        timing_callback=None,
         ):
         """ Build DataFrame with bus trajectory and shapely connections
             for plotting. This object is mostly a wrapper object to
@@ -65,11 +494,50 @@ class RouteTrajectory(PlottingTools):
 
                 route_num: needs to be one that Erica made work.
 
+                elv_raster_filename: elevation raster (.tif), or an
+                    elevation sampler (route_elevation.elevation
+                    .ElevationSampler) kept open across trajectories.
+
                 bus_speed_model: has options;
                     - 'stopped_at_stops__15mph_between'
                     - 'constant_15mph'
                     - 'const_accel_between_stops_and_speed_lim'
 
+                mass_array: bus mass, read according to 'mass_alg';
+                    - 'list_per_stop' : mass leaving each of
+                        'stop_coords' [kg]
+                    - 'list_per_segment' : mass on each segment
+                        between route points [kg]
+                    - 'passenger_series' : pandas Series of
+                        passenger counts indexed by time along the
+                        route [s], or a (times, counts) pair
+
+                energy_integration: 'rectangle' or 'trapezoid', how
+                    power is integrated into the 'cum_energy' column
+                    and the energy totals (see energy_increments).
+
+                geometry_cache: route_elevation.geometry_cache
+                    .GeometryCache to read the route geometry from
+                    (and store it in), or None to always build it.
+
+                trace_memory: also record the tracemalloc peak memory
+                    of each stage of the build in 'timings'.
+
+                timing_callback: called as callback(stage, wall_time,
+                    peak_memory) as each stage of the build finishes.
+
+            Attributes:
+
+                traction_energy, regen_energy: energy drawn from and
+                    returned to the battery along the route [J], regen
+                    is negative.
+
+                timings: dict of build stage ('read_shape',
+                    'point_query', 'distance_measure', 'knn',
+                    'const_a_dynamics', 'calculate_mass', 'forces', ...)
+                    to {'calls', 'wall_time', 'peak_memory'}, see
+                    route_dynamics.timing.StageTimer.
+
             Methods:
 
                 ...
@@ -84,23 +552,37 @@ class RouteTrajectory(PlottingTools):
             mass_array,
             unloaded_bus_mass,
             charging_power_max,
+            mass_alg,
+            energy_integration,
             )
 
-        # Build Route DataFrame, starting with columns:
-        #     - 'elevation'
-        #     - 'cum_distance'
-        #     - 'is_bus_stop
-        self.route_df = self.build_route_coordinate_df(
-            route_num = route_num,
-            shp_filename = shp_filename,
-            elv_raster_filename = elv_raster_filename,
+        timer = timing.StageTimer(
+            trace_memory=trace_memory,
+            callback=timing_callback,
             )
 
-        self.route_df = self._add_dynamics_to_df(
-            route_df=self.route_df,
-            stop_coords=stop_coords,
-            bus_speed_model=self.bus_speed_model,
-            )
+        with timer.activate(), timer.stage('total'):
+
+            # Build Route DataFrame, starting with columns:
+            #     - 'elevation'
+            #     - 'cum_distance'
+            #     - 'is_bus_stop
+            with timer.stage('build_route_coordinate_df'):
+                self.route_df = self.build_route_coordinate_df(
+                    route_num = route_num,
+                    shp_filename = shp_filename,
+                    elv_raster_filename = elv_raster_filename,
+                    geometry_cache = geometry_cache,
+                    )
+
+            with timer.stage('dynamics'):
+                self.route_df = self._add_dynamics_to_df(
+                    route_df=self.route_df,
+                    stop_coords=stop_coords,
+                    bus_speed_model=self.bus_speed_model,
+                    )
+
+        self.timings = timer.timings
 
 
     def _initialize_instance_args(self,
@@ -111,6 +593,8 @@ class RouteTrajectory(PlottingTools):
         mass_array,
         unloaded_bus_mass,
         charging_power_max,
+        mass_alg='list_per_stop',
+        energy_integration='rectangle',
         ):
 
         # Store algorithm name for future reference.
@@ -126,6 +610,7 @@ class RouteTrajectory(PlottingTools):
         # Mass stuff
         self.mass_array = mass_array
         self.unloaded_bus_mass = unloaded_bus_mass
+        self.mass_alg = mass_alg
 
         # Boolean check for instance argument 'mass_array'
         self.mass_arg_is_list = (
@@ -138,6 +623,8 @@ class RouteTrajectory(PlottingTools):
         # Store chargeing ability as instance attribute
         self.charging_power_max = charging_power_max
 
+        self.energy_integration = energy_integration
+
 
     def _add_dynamics_to_df(self,
         route_df,
@@ -210,6 +697,7 @@ class RouteTrajectory(PlottingTools):
         route_num,
         shp_filename,
         elv_raster_filename,
+        geometry_cache=None,
         ):
         """ Builds GeoDataFrame with rows cooresponding to points on
             route with columns corresponding to elevation, elevation
@@ -223,9 +711,35 @@ class RouteTrajectory(PlottingTools):
                 'stop_coords': list of coordinates of bus stops. Will
                     assign points along bus route based on these values
                     .
+                'geometry_cache': GeometryCache, if given the route
+                    coordinates, elevation and distances are read from
+                    it instead of the shapefile and raster.
 
             """
 
+        if geometry_cache is not None:
+            arrays = geometry_cache.route_arrays(
+                route_num,
+                shp_filename,
+                elv_raster_filename,
+                )
+
+            route_df = re_base.make_multi_lines(
+                arrays['coordinates'],
+                arrays['gradient'],
+                )
+
+            route_df = self._add_distance_to_df(
+                arrays['back_diff_distance'],
+                route_df,
+                )
+
+            route_df = self._add_elevation_to_df(arrays['elevation'], route_df)
+
+            route_df = self._add_cum_dist_to_df(arrays['cum_distance'], route_df)
+
+            return route_df
+
         # Build the df of 2D route coordinates and
         route_shp = re_base.read_shape(shp_filename, route_num)
 
@@ -296,11 +810,13 @@ class RouteTrajectory(PlottingTools):
         elif (type(stop_coords) is list) or (type(stop_coords) is np.ndarray):
 
             # Calculate indicies of 'stop_coords' that match bus_stops
-            self.stop_nn_indicies, self.stop_coord_nn = knn.find_knn(
-                1,
-                route_df.coordinates.values,
-                stop_coords
-                )
+            with timing.stage('knn'):
+                self.stop_nn_indicies, self.stop_coord_nn = knn.find_knn(
+                    1,
+                    route_df.coordinates.values,
+                    stop_coords,
+                    index=self._route_point_index(route_df),
+                    )
             # the 'jth' element of stop_nn_indicies also selects the
 
             route_df = route_df.assign(
@@ -323,6 +839,22 @@ class RouteTrajectory(PlottingTools):
         return route_df
 
 
+    def _route_point_index(self, route_df):
+        """ Spatial index over the route points, built the first time
+            stops are assigned and reused while the route points are
+            the same.
+            """
+
+        coordinates = np.array(list(route_df.coordinates.values), dtype=float)
+        index = getattr(self, 'route_point_index', None)
+
+        if index is None or not np.array_equal(index.candidate_pts, coordinates):
+            index = knn.NeighborIndex(coordinates)
+            self.route_point_index = index
+
+        return index
+
+
     def _add_elevation_to_df(self, elevation, route_df):
 
         # print(len(elevation), len(route_df.index))
@@ -350,37 +882,15 @@ class RouteTrajectory(PlottingTools):
         """ For now just adds a constant velocity as a placeholder.
             """
 
-        lazy_choise_for_speed = 6.7056  # 6.7056 m/s (= 15 mph)
-
-        # 'test' algorithm set by default for now.
-        if bus_speed_model == 'constant_15mph':
-            # Assign constant velocity
-            bus_speed_array = (
-                lazy_choise_for_speed * np.ones(len(route_df.index))
-                )
-
-        elif bus_speed_model == 'stopped_at_stops__15mph_between':
-            # Really I want something here to use the stop array to calcularte bus speed.
-            # Step !: Calculate distance to next stop, which should determine the strajectory (speed at point)
-                # can use difference of 'cum_dist's
-            # 2) Assign trajectory as function of distance
-            # 3) plug in each route point between stops intor trajectory function.
-            # ... This is all UNDER CONSTRUCTION ...
-
-            # Right now, this will just make stop points have zero velocity.
-            zero_if_stop__one_if_not = (
-                np.logical_not(route_df.is_bus_stop.values)*1
+        if bus_speed_model in [
+            'constant_15mph',
+            'stopped_at_stops__15mph_between'
+            ]:
+            bus_speed_array = simple_model_velocity(
+                route_df.is_bus_stop.values,
+                bus_speed_model,
                 )
 
-            # Mark endpoints of route as well
-            zero_if_stop_start_end__one_if_not = zero_if_stop__one_if_not
-            zero_if_stop_start_end__one_if_not[0] = 0
-            zero_if_stop_start_end__one_if_not[-1] = 0
-
-            # if not stop, set velocity to 15 mph
-            bus_speed_array = zero_if_stop__one_if_not * lazy_choise_for_speed
-
-
         elif bus_speed_model is 'const_accel_between_stops_and_speed_lim':
             bus_speed_array = self.const_a_velocities
 
@@ -423,14 +933,10 @@ class RouteTrajectory(PlottingTools):
             print("Does 'route_df' have 'velocity' column? ")
 
         if alg is 'finite_diff':
-            # Calcule average velocities along segment but backward difference
-            segment_avg_velocities = (
-                velocities
-                +
-                np.append(0,velocities[:-1])
-                )/2
-
-            self.delta_times = back_diff_delta_x * segment_avg_velocities
+            self.delta_times = finite_diff_delta_time(
+                velocities,
+                back_diff_delta_x,
+                )
 
         else:
             raise IllegalArgumentError("time calculation only equiped to "
@@ -510,27 +1016,25 @@ class RouteTrajectory(PlottingTools):
 
             dt = route_df.delta_time.values
 
-            accelerations = np.append(
-                np.nan,
-                self.delta_v[1:] / dt[1:]
-                )
+            accelerations = finite_diff_acceleration(velocity_array, dt)
 
         elif alg=='const_accel_between_stops_and_speed_lim':
 
             if v_lim is None: v_lim=self.v_lim
             if a_m is None: a_m=self.a_m
 
-            (
-                accelerations,
-                self.const_a_velocities,
-                self.x_ls,
-                self.x_ns,
-                self.route_time
-                ) = ca.const_a_dynamics(
-                route_df,
-                a_m,
-                v_lim,
-                )
+            with timing.stage('const_a_dynamics'):
+                (
+                    accelerations,
+                    self.const_a_velocities,
+                    self.x_ls,
+                    self.x_ns,
+                    self.route_time
+                    ) = ca.const_a_dynamics(
+                    route_df,
+                    a_m,
+                    v_lim,
+                    )
 
         else:
             raise IllegalArgumentError((
@@ -553,18 +1057,11 @@ class RouteTrajectory(PlottingTools):
             Eventually this will use Ryan's ridership module, which
             determines the ridership at each bus stop.
             """
-        if self.mass_arg_is_list:
-
-            lengths_equiv = len(self.mass_array)==len(
-                self.stop_coords)
-            # Does mass array check out for calculation?
-            mass_array_correct_length = (
-                lengths_equiv and self.mass_arg_is_list
-                )
+        if self.mass_array is not None:
 
             full_mass_column = self.calculate_mass(
-                alg='list_per_stop',
-                len_check=mass_array_correct_length
+                alg=self.mass_alg,
+                route_df=route_df,
                 )
 
         else: # Add default mass to every row
@@ -579,66 +1076,93 @@ class RouteTrajectory(PlottingTools):
         return route_df
 
 
+    @timing.timed('calculate_mass')
     def calculate_mass(self,
         alg='list_per_stop',
         len_check=None,
+        route_df=None,
         ):
-        """ Take mass array that is length of bus stop array and store
-            as df column with interpolated values in between stops
-            (value from last stop). If no mass array was input as class
-            arg, then default bus mass is stored in every df row.
-            """
-
+        """ Bus mass at every route point from the class arg
+            'mass_array'.
 
-        if alg=='list_per_stop' and len_check:
+            Args:
+                alg: how 'mass_array' is read;
+                    - 'list_per_stop' : mass leaving each bus stop,
+                        held until the next stop (see mass_from_stops)
+                    - 'list_per_segment' : mass on each segment between
+                        route points (see mass_from_segments)
+                    - 'passenger_series' : passenger counts over time
+                        along the route (see mass_from_passenger_series)
+                len_check: kept for compatibility; the length of
+                    'mass_array' is always checked.
+                route_df: route DataFrame to compute the mass for,
+                    DEFAULT is self.route_df. 'passenger_series' needs
+                    its 'delta_time' column.
+
+            Returns:
+                full_mass_column: mass at every route point [kg]
+            """
 
-            if not hasattr(self, 'stop_nn_indicies'):
-                raise AttributeError('Cant calculate from list')
+        if route_df is None:
+            route_df = self.route_df
 
+        num_pts = len(route_df.index)
 
-            # Initialize array of Nan's for mass column of rdf
-            full_mass_column = np.zeros(len(self.route_df.index))
-            full_mass_column[:] = np.nan
+        if alg == 'list_per_stop':
 
-            # Iterate through the length of the given mass_array
-            # (already determined equal length to 'stop_coords').
-            for i in range(len(self.mass_array)):
-                # Set values of mass at bus_stops
-                full_mass_column[
-                    self.stop_nn_indicies[i]
-                    ] = self.mass_array[i]
+            if not self.mass_arg_is_list or len_check is False:
+                raise IllegalArgumentError(
+                    "'stop_coords' and 'mass_array' must be same length"
+                    )
 
-            # Set initial and value to unloaded bus mass.
-            full_mass_column[0] = self.unloaded_bus_mass
-            full_mass_column[-1] = self.unloaded_bus_mass
+            full_mass_column = mass_from_stops(
+                num_pts,
+                getattr(self, 'stop_nn_indicies', None),
+                self.mass_array,
+                self.unloaded_bus_mass,
+                )
 
-            # Iterate through the half constructed rdf mass column
-            # ('full_mass_column') and fill in sapce between stops with previous value
-            for i in range(len(full_mass_column)-1):
-                j = 1
-                try:
-                    while np.isnan(full_mass_column[i+j]):
-                        full_mass_column[i+j] = full_mass_column[i]
-                        # print(full_mass_column[i+j] )
-                        j+=1
-                except: IndexError
+        elif alg == 'list_per_segment':
 
-            if np.any(full_mass_column < self.unloaded_bus_mass):
-                raise IllegalArgumentError("Class arg 'unloaded_bus_mass' "
-                    "is heavier than values in arg 'mass_array'")
+            full_mass_column = mass_from_segments(
+                num_pts,
+                self.mass_array,
+                self.unloaded_bus_mass,
+                )
 
-        elif alg=='list_per_stop' and (
-            self.mass_arg_is_list and not len_check
-            ):
-            raise IllegalArgumentError(
-                "'stop_coords' and 'mass_array' must be same length"
+        elif alg == 'passenger_series':
+
+            if isinstance(self.mass_array, pd.Series):
+                times = self.mass_array.index.values
+                passengers = self.mass_array.values
+            else:
+                times, passengers = self.mass_array
+
+            if 'delta_time' not in route_df:
+                raise IllegalArgumentError(
+                    "'passenger_series' mass needs the route 'delta_time'"
+                    )
+            delta_time = np.nan_to_num(route_df.delta_time.values.astype(float))
+            route_time = np.append(0, np.cumsum(delta_time[1:]))
+
+            full_mass_column = mass_from_passenger_series(
+                route_time,
+                times,
+                passengers,
+                self.unloaded_bus_mass,
                 )
 
         else:
             raise IllegalArgumentError(
-                "Algorithm for mass calculation must be 'list_per_stop'"
+                "Algorithm for mass calculation must be 'list_per_stop', "
+                "'list_per_segment' or 'passenger_series'"
                 )
 
+        if np.ndim(full_mass_column) != 1:
+            raise IllegalArgumentError(
+                "'mass_array' must describe a single trip; use "
+                "mass_from_stops() directly for many trips"
+                )
 
         return full_mass_column
 
@@ -665,22 +1189,13 @@ class RouteTrajectory(PlottingTools):
         return route_df
 
 
+    @timing.timed('forces')
     def calculate_forces(self, rdf):
         """ Requires GeoDataFrame input with mass column """
 
         vels = rdf.velocity.values
         acce = rdf.acceleration.values
         grad = rdf.gradient.values
-        grad_angle = np.arctan(grad)
-
-
-        # Physical parameters
-        gravi_accel = 9.81
-        air_density = 1.225 # air density in kg/m3; consant for now,
-            # eventaully input from weather API
-        v_wind = 0.0 # wind speed in km per hour; figure out component,
-            # and also will come from weather API
-        fric_coeff = 0.01
 
         # List of Bus Parameters for 40 foot bus
         if self.mass_array is None:
@@ -688,84 +1203,106 @@ class RouteTrajectory(PlottingTools):
         else:
             loaded_bus_mass = rdf.mass.values
 
-        width = 2.6 # in m
-        height = 3.3 # in m
-        bus_front_area = width * height
-        drag_coeff = 0.34 # drag coefficient estimate from paper (???)
-        rw = 0.28575 # radius of wheel in m
+        return longitudinal_forces(vels, acce, grad, loaded_bus_mass)
 
 
-        # Calculate the gravitational force
-        grav_force = -(
-            loaded_bus_mass * gravi_accel * np.sin(grad_angle)
+    @timing.timed('power')
+    def _calculate_batt_power_exert(self, rdf):
+
+        forces = (
+            rdf.grav_force.values,
+            rdf.roll_fric.values,
+            rdf.aero_drag.values,
+            rdf.inertia.values,
             )
+        velocity = rdf.velocity.values
+
+        # calculate raw power before capping charging ability of bus
+        self.raw_batt_power_exert = battery_power(*forces, velocity, np.inf)
+
+        # Regen is capped at the charging ability of the bus
+        return battery_power(*forces, velocity, self.charging_power_max)
+
+
+    def _add_power_to_df(self, rdf):
 
-        # Calculate the rolling friction
-        roll_fric = -(
-            fric_coeff * loaded_bus_mass * gravi_accel * np.cos(grad_angle)
+        batt_power_exert = self._calculate_batt_power_exert(rdf)
+
+        delta_t = rdf.delta_time.values
+
+        increments = energy_increments(
+            batt_power_exert,
+            delta_t,
+            self.energy_integration,
             )
 
-        # Calculate the aerodynamic drag
-        aero_drag = -(
-            drag_coeff
-            *
-            bus_front_area
-            *
-            (air_density/2)
-            *
-            (vels-v_wind)
+        cum_energy = np.cumsum(increments)
+
+        (
+            _,
+            self.traction_energy,
+            self.regen_energy
+            ) = _split_increments(increments)
+
+        new_df = rdf.assign(
+            power_output = batt_power_exert,
+            cum_energy = cum_energy,
             )
 
-        # Calculate the inertial force
-        inertia = loaded_bus_mass * acce
+        return new_df
 
-        return (grav_force, roll_fric, aero_drag, inertia)
 
+    def _trace_columns(self, columns):
+        """ Time along the route and the route_df 'columns' to resample. """
 
-    def _calculate_batt_power_exert(self, rdf):
+        rdf = self.route_df
+        delta_time = np.nan_to_num(rdf.delta_time.values.astype(float))
+        route_time = np.append(0, np.cumsum(delta_time[1:]))
 
-        f_resist = (
-            rdf.grav_force.values
-            +
-            rdf.roll_fric.values
-            +
-            rdf.aero_drag.values
-            )
+        return route_time, {name: rdf[name].values for name in columns}
 
-        f_traction = rdf.inertia.values - f_resist
 
-        velocity = rdf.velocity.values
+    def resampled_trace(self, dt=1.0, columns=TRACE_COLUMNS):
+        """ Power, speed, grade and mass (or other route_df 'columns') on
+            a uniform time grid of step 'dt' [s]; see resample_trace.
+            """
 
-        # calculate raw power before capping charging ability of bus
-        batt_power_exert = f_traction * velocity
-        self.raw_batt_power_exert = np.copy(batt_power_exert)
+        route_time, values = self._trace_columns(columns)
 
-        for i in range(len(batt_power_exert)):
-            if batt_power_exert[i] < -self.charging_power_max:
-                batt_power_exert[i] = -self.charging_power_max
+        return resample_trace(route_time, values, dt=dt)
 
-        return batt_power_exert
 
+    def iter_resampled_trace(self, dt=1.0, chunk_size=3600,
+        columns=TRACE_COLUMNS):
+        """ resampled_trace in chunks of 'chunk_size' rows, from a
+            generator; see iter_resampled_trace.
+            """
 
-    def _add_power_to_df(self, rdf):
+        route_time, values = self._trace_columns(columns)
 
-        batt_power_exert = self._calculate_batt_power_exert(rdf)
+        return iter_resampled_trace(
+            route_time, values, dt=dt, chunk_size=chunk_size)
 
-        new_df = rdf.assign(
-            power_output = batt_power_exert
-            )
 
-        return new_df
+    def energy_from_route(self, integration=None):
+        """ Net energy used on the route [J].
 
+            Args:
+                integration: 'rectangle' or 'trapezoid', DEFAULT is
+                    the class arg 'energy_integration'
+            """
 
-    def energy_from_route(self):
+        if integration is None:
+            integration = self.energy_integration
 
         rdf = self.route_df
 
-        delta_t = rdf.delta_time.values[1:]
-
-        power = rdf.power_output.values[1:]
+        increments = energy_increments(
+            rdf.power_output.values,
+            rdf.delta_time.values,
+            integration,
+            )
 
-        energy = np.sum(power * delta_t)
+        energy = np.sum(increments[1:])
 
         return energy
@@ -0,0 +1,210 @@
+""" Monte Carlo uncertainty of the route energy.
+
+    The inputs of the longitudinal dynamics model that are only known on
+    average (passenger load, rolling friction, air density, wind and the
+    acceleration 'a_m' of the constant acceleration bus speed model) are
+    drawn from distributions, and the route energy is computed for every
+    sample as (samples x route points) arrays over one RouteGeometry,
+    with 'compact_trajectory.batch_energy'.
+
+    Samples are evaluated in chunks that keep the temporary arrays below
+    'max_chunk_elements'. Each chunk draws its samples from its own
+    random stream, spawned from one seed with numpy's SeedSequence, so a
+    run gives the same energies whether the chunks are evaluated in this
+    process or spread over a process pool.
+    """
+from . import longi_dynam_model as ldm
+from .compact_trajectory import batch_energy
+from .route_geometry import RouteGeometry
+
+import collections
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+
+# Distribution of each uncertain input, as the name of a
+# numpy.random.Generator method and its parameters.
+#     - 'load_factor' : multiplies the passenger mass, lognormal with
+#         mean 1 (AveLd is an average load)
+#     - 'fric_coeff', 'air_density', 'v_wind' : longitudinal_forces args
+#     - 'a_m' : bus acceleration [m/s^2]
+DEFAULT_DISTRIBUTIONS = collections.OrderedDict([
+    ('load_factor', ('lognormal', -0.3**2/2, 0.3)),
+    ('fric_coeff', ('uniform', 0.006, 0.014)),
+    ('air_density', ('normal', 1.225, 0.03)),
+    ('v_wind', ('normal', 0.0, 2.0)),
+    ('a_m', ('uniform', 0.7, 1.3)),
+    ])
+
+# Inputs passed on to longi_dynam_model.longitudinal_forces.
+FORCE_PARAMS = ['fric_coeff', 'air_density', 'v_wind']
+
+MonteCarloResult = collections.namedtuple(
+    'MonteCarloResult',
+    ['energy', 'samples', 'percentiles'],
+    )
+
+
+def draw_samples(rng, num_samples, distributions=DEFAULT_DISTRIBUTIONS):
+    """ DataFrame of 'num_samples' draws of each input in
+        'distributions', from the numpy Generator 'rng'.
+        """
+
+    return pd.DataFrame(collections.OrderedDict([
+        (name, getattr(rng, spec[0])(*spec[1:], size=num_samples))
+        for name, spec in distributions.items()
+        ]), index=range(num_samples))
+
+
+def sample_energy(
+    geometry,
+    samples,
+    unloaded_bus_mass,
+    payload=None,
+    v_lim=15.0,
+    charging_power_max=0.,
+    energy_integration='rectangle',
+    ):
+    """ Route energy of each row of 'samples', all rows as one
+        (samples x route points) array computation.
+
+        Args:
+            geometry: RouteGeometry with bus stops assigned
+            samples: DataFrame with a column per uncertain input; inputs
+                it doesn't have take their model defaults ('a_m' 1.0,
+                'load_factor' 1)
+            unloaded_bus_mass: empty bus mass [kg]
+            payload: None, or passenger mass leaving each stop [kg]
+            v_lim, charging_power_max, energy_integration: as for
+                RouteTrajectory
+
+        Returns:
+            energy: array of shape (len(samples),) [J]
+        """
+
+    def column(name, default):
+        if name in samples:
+            return samples[name].values[:, np.newaxis]
+        return default
+
+    mass = unloaded_bus_mass
+    if payload is not None:
+        payload_profile = ldm.mass_from_stops(
+            geometry.num_pts,
+            geometry.stop_nn_indicies,
+            np.asarray(payload, dtype=float),
+            0.,
+            )
+        mass = mass + column('load_factor', 1.) * payload_profile
+
+    return batch_energy(
+        geometry,
+        np.broadcast_to(mass, (len(samples), geometry.num_pts)),
+        a_m=column('a_m', 1.0),
+        v_lim=v_lim,
+        charging_power_max=charging_power_max,
+        integration=energy_integration,
+        **{
+            name: samples[name].values[:, np.newaxis]
+            for name in FORCE_PARAMS if name in samples
+            }
+        )
+
+
+def _run_chunk(seed, num_samples, distributions, geometry, model_args):
+    """ Draws and evaluates one chunk; module level so a process pool
+        can run it.
+        """
+
+    samples = draw_samples(np.random.default_rng(seed), num_samples, distributions)
+
+    return samples, sample_energy(geometry, samples, **model_args)
+
+
+def monte_carlo_energy(
+    geometry,
+    num_samples,
+    unloaded_bus_mass=12927,
+    payload=None,
+    v_lim=15.0,
+    charging_power_max=0.,
+    energy_integration='rectangle',
+    distributions=DEFAULT_DISTRIBUTIONS,
+    seed=None,
+    percentiles=(5, 25, 50, 75, 95),
+    max_chunk_elements=2**21,
+    processes=1,
+    ):
+    """ Distribution of the route energy under uncertain inputs.
+
+        Args:
+            geometry: RouteGeometry with bus stops assigned, or a
+                RouteTrajectory to take it from
+            num_samples: number of Monte Carlo samples
+            unloaded_bus_mass: empty bus mass [kg]
+            payload: None, or passenger mass leaving each stop [kg]
+                (scaled by the sampled 'load_factor')
+            v_lim, charging_power_max, energy_integration: as for
+                RouteTrajectory
+            distributions: dict like DEFAULT_DISTRIBUTIONS
+            seed: seed of the run (int or SeedSequence), None for fresh
+                entropy
+            percentiles: energy percentiles to report
+            max_chunk_elements: bound on the size of the temporary
+                (samples x route points) arrays
+            processes: number of worker processes, 1 to evaluate the
+                chunks in this process
+
+        Returns:
+            MonteCarloResult with 'energy' (num_samples,) [J], 'samples'
+            (DataFrame of the drawn inputs) and 'percentiles' (Series of
+            energy indexed by percentile)
+        """
+
+    if num_samples < 1:
+        raise ldm.IllegalArgumentError("'num_samples' must be at least 1")
+
+    if isinstance(geometry, ldm.RouteTrajectory):
+        geometry = RouteGeometry.from_trajectory(geometry)
+
+    chunk_size = max(1, max_chunk_elements // geometry.num_pts)
+    chunk_sizes = [
+        min(chunk_size, num_samples - start)
+        for start in range(0, num_samples, chunk_size)
+        ]
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    chunk_seeds = seed.spawn(len(chunk_sizes))
+
+    model_args = dict(
+        unloaded_bus_mass=unloaded_bus_mass,
+        payload=payload,
+        v_lim=v_lim,
+        charging_power_max=charging_power_max,
+        energy_integration=energy_integration,
+        )
+    chunk_args = [
+        (chunk_seed, size, distributions, geometry, model_args)
+        for chunk_seed, size in zip(chunk_seeds, chunk_sizes)
+        ]
+
+    if processes == 1:
+        chunks = [_run_chunk(*args) for args in chunk_args]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            chunks = list(pool.map(_run_chunk, *zip(*chunk_args)))
+
+    samples = pd.concat([chunk[0] for chunk in chunks], ignore_index=True)
+    energy = np.concatenate([chunk[1] for chunk in chunks])
+
+    return MonteCarloResult(
+        energy=energy,
+        samples=samples,
+        percentiles=pd.Series(
+            np.percentile(energy, percentiles),
+            index=pd.Index(percentiles, name='percentile'),
+            ),
+        )
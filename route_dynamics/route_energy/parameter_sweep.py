@@ -0,0 +1,95 @@
+""" Parameter sweeps of the longitudinal dynamics model over one route.
+
+    The route geometry (elevation, gradient, distances and stop flags)
+    is built once as a RouteGeometry. The constant acceleration bus
+    speed model ('const_accel_between_stops_and_speed_lim'), the forces
+    of 'longi_dynam_model.longitudinal_forces' and the regen capped
+    battery power are then evaluated for a whole grid of
+    (a_m, v_lim, unloaded_bus_mass, mass_array, charging_power_max)
+    values as array operations with 'compact_trajectory.batch_energy',
+    with no RouteTrajectory or GeoDataFrame per scenario.
+    """
+from .compact_trajectory import batch_energy, mass_profile
+
+import itertools
+
+import numpy as np
+
+
+def parameter_sweep(
+    geometry,
+    a_m=1.0,
+    v_lim=15.0,
+    unloaded_bus_mass=12927,
+    mass_arrays=None,
+    charging_power_max=0.,
+    max_chunk_elements=2**21,
+    energy_integration='rectangle',
+    ):
+    """ Route energy for every combination of the model parameters.
+
+        Args:
+            geometry: RouteGeometry, e.g. RouteGeometry.from_files(...)
+                or RouteGeometry.from_trajectory(...)
+            a_m: acceleration(s) [m/s^2]
+            v_lim: speed limit(s) [m/s]
+            unloaded_bus_mass: empty bus mass(es) [kg]
+            mass_arrays: None (unloaded bus), or a list of per-stop
+                mass arrays (each the 'mass_array' RouteTrajectory
+                argument)
+            charging_power_max: regen limit(s) [W]
+            max_chunk_elements: bound on the size of the temporary
+                (scenarios x route points) arrays; the grid is
+                evaluated in chunks of scenarios below this size.
+            energy_integration: 'rectangle' or 'trapezoid', as for
+                RouteTrajectory
+
+        Returns:
+            energy: array of shape
+                (len(a_m), len(v_lim), len(unloaded_bus_mass),
+                 len(mass_arrays), len(charging_power_max))
+                where scalar arguments count as length 1. [J]
+        """
+
+    a_m = np.atleast_1d(np.asarray(a_m, dtype=float))
+    v_lim = np.atleast_1d(np.asarray(v_lim, dtype=float))
+    unloaded_bus_mass = np.atleast_1d(np.asarray(unloaded_bus_mass, dtype=float))
+    charging_power_max = np.atleast_1d(np.asarray(charging_power_max, dtype=float))
+
+    if mass_arrays is None:
+        mass_arrays = [None]
+
+    # Mass profiles only depend on the (unloaded mass, mass array) pair.
+    profiles = np.array([
+        [
+            mass_profile(geometry, mass_array, empty_mass)
+            for mass_array in mass_arrays
+            ]
+        for empty_mass in unloaded_bus_mass
+        ])
+
+    grid_shape = (
+        len(a_m),
+        len(v_lim),
+        len(unloaded_bus_mass),
+        len(mass_arrays),
+        len(charging_power_max),
+        )
+    grid_idx = np.array(list(itertools.product(*[range(n) for n in grid_shape])))
+
+    chunk_size = max(1, max_chunk_elements // geometry.num_pts)
+
+    energy = np.empty(len(grid_idx))
+    for start in range(0, len(grid_idx), chunk_size):
+        i_a, i_v, i_u, i_m, i_c = grid_idx[start:start + chunk_size].T
+
+        energy[start:start + chunk_size] = batch_energy(
+            geometry,
+            profiles[i_u, i_m],
+            a_m=a_m[i_a, None],
+            v_lim=v_lim[i_v, None],
+            charging_power_max=charging_power_max[i_c, None],
+            integration=energy_integration,
+            )
+
+    return energy.reshape(grid_shape)
@@ -0,0 +1,253 @@
+""" Route geometry as plain arrays.
+
+    Everything about a route that does not depend on the bus or on how
+    it is driven (coordinates, elevation, gradient, distances and which
+    points are bus stops) is built once here and reused by the batch
+    energy calculations, without a GeoDataFrame per scenario.
+    """
+from ..route_elevation import base as re_base
+from . import knn
+from . import constant_a as ca
+from . import longi_dynam_model as ldm
+
+import numpy as np
+
+
+class _ReversedIndex(object):
+    """ NeighborIndex of a route, answering for the same points in the
+        reverse order, so a reversed route reuses its KD-tree.
+        """
+
+    def __init__(self, index):
+        self.index = index
+        self.metric = index.metric
+        self.num_pts = index.num_pts
+
+    def query(self, test_pts, k=1):
+        indicies, distances = self.index.query(test_pts, k)
+        return self.num_pts - 1 - indicies, distances
+
+
+class RouteGeometry(object):
+    """ Arrays describing a route, one element per route point;
+
+            - 'coordinates' : (num_pts, 2) route coordinates
+            - 'elevation' : elevation [m] (None if not known)
+            - 'gradient' : road grade
+            - 'distance_from_last_point' : backward difference
+                distance [m], NaN at the first point
+            - 'cum_distance' : distance along route [m]
+            - 'is_bus_stop' : boolean stop flags
+            - 'stop_nn_indicies' : route point matched to each stop
+                coordinate, in the order the stops were given
+        """
+
+    def __init__(self,
+        coordinates,
+        gradient,
+        distance_from_last_point,
+        cum_distance,
+        elevation=None,
+        is_bus_stop=None,
+        stop_nn_indicies=None,
+        ):
+
+        self.coordinates = np.asarray(coordinates, dtype=float)
+        self.gradient = np.asarray(gradient, dtype=float)
+        self.distance_from_last_point = np.asarray(
+            distance_from_last_point, dtype=float)
+        self.cum_distance = np.asarray(cum_distance, dtype=float)
+
+        if elevation is not None:
+            elevation = np.asarray(elevation, dtype=float).ravel()
+        self.elevation = elevation
+
+        if is_bus_stop is None:
+            is_bus_stop = np.zeros(len(self.gradient), dtype=bool)
+        self.is_bus_stop = np.asarray(is_bus_stop, dtype=bool)
+
+        self.stop_nn_indicies = stop_nn_indicies
+
+        self._point_index = None
+        self._stop_distances = None
+
+    @property
+    def num_pts(self):
+        return len(self.gradient)
+
+    @classmethod
+    def from_files(cls,
+        route_num,
+        shp_filename,
+        elv_raster_filename,
+        stop_coords=None,
+        geometry_cache=None,
+        ):
+        """ Build the geometry from the route shapefile (or RouteStore)
+            and elevation raster (or sampler), the same way
+            RouteTrajectory.build_route_coordinate_df does, or read it
+            from 'geometry_cache' (a GeometryCache) if given.
+            """
+
+        if geometry_cache is not None:
+            arrays = geometry_cache.route_arrays(
+                route_num,
+                shp_filename,
+                elv_raster_filename,
+                )
+            coordinates = arrays['coordinates']
+            elevation = arrays['elevation']
+            elevation_gradient = arrays['gradient']
+            route_cum_distance = arrays['cum_distance']
+            back_diff_distance = arrays['back_diff_distance']
+
+        else:
+            route_shp = re_base.read_shape(shp_filename, route_num)
+
+            coordinates = re_base.extract_point_array(route_shp)
+
+            (
+                elevation,
+                elevation_gradient,
+                route_cum_distance,
+                back_diff_distance
+                ) = re_base.gradient(route_shp, elv_raster_filename)
+
+        geometry = cls(
+            coordinates=coordinates,
+            gradient=elevation_gradient,
+            distance_from_last_point=np.append(np.nan, back_diff_distance),
+            cum_distance=route_cum_distance,
+            elevation=elevation,
+            )
+
+        return geometry.with_stops(stop_coords)
+
+    @classmethod
+    def from_route_df(cls, route_df, stop_nn_indicies=None):
+        """ Take the geometry from a RouteTrajectory 'route_df'. """
+
+        if 'elevation' in route_df:
+            elevation = route_df.elevation.values
+        else:
+            elevation = None
+
+        return cls(
+            coordinates=np.array(list(route_df.coordinates.values), dtype=float),
+            gradient=route_df.gradient.values,
+            distance_from_last_point=route_df.distance_from_last_point.values,
+            cum_distance=route_df.cum_distance.values,
+            elevation=elevation,
+            is_bus_stop=route_df.is_bus_stop.values,
+            stop_nn_indicies=stop_nn_indicies,
+            )
+
+    @classmethod
+    def from_trajectory(cls, trajectory):
+        """ Take the geometry from an existing RouteTrajectory. """
+
+        return cls.from_route_df(
+            trajectory.route_df,
+            stop_nn_indicies=getattr(trajectory, 'stop_nn_indicies', None),
+            )
+
+    def point_index(self):
+        """ Spatial index over the route points, built once. """
+
+        if self._point_index is None:
+            self._point_index = knn.NeighborIndex(self.coordinates)
+
+        return self._point_index
+
+    def with_stops(self, stop_coords):
+        """ Copy of the geometry with bus stops assigned from
+            'stop_coords' ('random', None, or list/array of
+            coordinates), as RouteTrajectory does.
+            """
+
+        stop_nn_indicies = None
+
+        if type(stop_coords) is str and stop_coords == 'random':
+            # Fix seed for reproducability
+            np.random.seed(5615423)
+            is_bus_stop = np.random.random(self.num_pts) < .15
+
+        elif stop_coords is None:
+            is_bus_stop = np.zeros(self.num_pts, dtype=bool)
+
+        elif (type(stop_coords) is list) or (type(stop_coords) is np.ndarray):
+            stop_nn_indicies, _ = knn.find_knn(
+                1,
+                self.coordinates,
+                stop_coords,
+                index=self.point_index(),
+                )
+            is_bus_stop = np.zeros(self.num_pts, dtype=bool)
+            is_bus_stop[stop_nn_indicies.ravel()] = True
+
+        else:
+            raise ldm.IllegalArgumentError(
+                "'stop_coords' must be 'random', None, "
+                "or type(list)/type(ndarray)"
+                )
+
+        geometry = RouteGeometry(
+            coordinates=self.coordinates,
+            gradient=self.gradient,
+            distance_from_last_point=self.distance_from_last_point,
+            cum_distance=self.cum_distance,
+            elevation=self.elevation,
+            is_bus_stop=is_bus_stop,
+            stop_nn_indicies=stop_nn_indicies,
+            )
+        # The route points are the same, so is their index.
+        geometry._point_index = self._point_index
+
+        return geometry
+
+    def reversed(self):
+        """ The route driven the other way (e.g. inbound from outbound),
+            from the arrays already computed; nothing is re-read or
+            re-sampled. Point i of the result is point num_pts-1-i of
+            this route. Bus stops are not carried over, assign the
+            other direction's stops with with_stops().
+            """
+
+        n = self.num_pts
+
+        # Backward differences turn into forward differences, so a
+        # segment's grade changes sign and it is stored at the other end.
+        gradient = np.zeros(n)
+        gradient[1:] = -self.gradient[1:][::-1]
+
+        distance_from_last_point = np.full(n, np.nan)
+        distance_from_last_point[1:] = self.distance_from_last_point[1:][::-1]
+
+        if self.elevation is None:
+            elevation = None
+        else:
+            elevation = self.elevation[::-1]
+
+        geometry = RouteGeometry(
+            coordinates=self.coordinates[::-1],
+            gradient=gradient,
+            distance_from_last_point=distance_from_last_point,
+            cum_distance=self.cum_distance[-1] - self.cum_distance[::-1],
+            elevation=elevation,
+            )
+        geometry._point_index = _ReversedIndex(self.point_index())
+
+        return geometry
+
+    def stop_distances(self):
+        """ (x_ls, x_ns) distances to the last and next stop, computed
+            once per geometry.
+            """
+
+        if self._stop_distances is None:
+            self._stop_distances = ca.stop_distances(
+                self.distance_from_last_point,
+                self.is_bus_stop,
+                )
+
+        return self._stop_distances
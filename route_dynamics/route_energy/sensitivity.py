@@ -0,0 +1,283 @@
+""" Variance based (Sobol) sensitivity of the route energy.
+
+    Which inputs drive a route's energy; the road grade, bus mass, speed
+    limit, acceleration, drag, rolling friction or regen limit? Each
+    input is given a range, and the first order index 'S1' (share of the
+    energy variance due to the input alone) and total index 'ST' (share
+    due to the input and all its interactions) are estimated with the
+    Saltelli scheme: two Sobol sequence sample matrices A and B, plus a
+    matrix AB_i per input with column i of A taken from B, for
+    num_base * (num_inputs + 2) model runs.
+
+    All runs over one route are evaluated as (runs x route points) arrays
+    over a single RouteGeometry with 'compact_trajectory.batch_energy',
+    in chunks bounded by 'max_chunk_elements'. Routes are independent, so
+    'network_sensitivity' can spread them over a process pool.
+    """
+from . import longi_dynam_model as ldm
+from .compact_trajectory import batch_energy
+from .route_geometry import RouteGeometry
+
+import collections
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+
+# Range (low, high) of each input, sampled uniformly.
+#     - 'grade_scale' : multiplies the route gradient
+#     - 'mass' : loaded bus mass [kg]
+#     - 'v_lim', 'a_m' : constant acceleration bus speed model
+#     - 'drag_coeff', 'fric_coeff' : longitudinal_forces args
+#     - 'charging_power_max' : regen limit [W]
+DEFAULT_BOUNDS = collections.OrderedDict([
+    ('grade_scale', (0.8, 1.2)),
+    ('mass', (11000., 25000.)),
+    ('v_lim', (10., 20.)),
+    ('a_m', (0.5, 1.5)),
+    ('drag_coeff', (0.3, 0.7)),
+    ('fric_coeff', (0.006, 0.014)),
+    ('charging_power_max', (0., 2e5)),
+    ])
+
+# Inputs passed on to longi_dynam_model.longitudinal_forces.
+FORCE_PARAMS = ['drag_coeff', 'fric_coeff', 'air_density', 'v_wind',
+    'bus_front_area']
+
+# Model value of the inputs left out of 'bounds'.
+NOMINAL = {
+    'grade_scale': 1.,
+    'mass': 12927.,
+    'v_lim': 15.,
+    'a_m': 1.,
+    'charging_power_max': 0.,
+    }
+
+
+def saltelli_samples(bounds, num_base, seed=None):
+    """ Saltelli sample matrices from a scrambled Sobol sequence.
+
+        Args:
+            bounds: dict of input name to (low, high)
+            num_base: rows of A and B, a power of 2 keeps the Sobol
+                sequence balanced
+            seed: seed of the scrambling
+
+        Returns:
+            A, B: arrays of shape (num_base, num_inputs)
+            AB: array of shape (num_inputs, num_base, num_inputs), AB[i]
+                is A with column i from B
+        """
+
+    num_inputs = len(bounds)
+    low, high = np.array(list(bounds.values()), dtype=float).T
+
+    sobol = qmc.Sobol(d=2*num_inputs, scramble=True, seed=seed)
+    if num_base & (num_base - 1) == 0:
+        base = sobol.random_base2(int(np.log2(num_base)))
+    else:
+        base = sobol.random(num_base)
+
+    A = qmc.scale(base[:, :num_inputs], low, high)
+    B = qmc.scale(base[:, num_inputs:], low, high)
+
+    AB = np.repeat(A[np.newaxis], num_inputs, axis=0)
+    idx = np.arange(num_inputs)
+    AB[idx, :, idx] = B.T
+
+    return A, B, AB
+
+
+def sobol_indices(f_A, f_B, f_AB):
+    """ First order (Saltelli 2010) and total (Jansen) Sobol indices.
+
+        Args:
+            f_A, f_B: model output for A and B, shape (num_base,)
+            f_AB: model output for each AB[i], shape
+                (num_inputs, num_base)
+
+        Returns:
+            S1, ST: arrays of shape (num_inputs,)
+        """
+
+    variance = np.var(np.concatenate([f_A, f_B]))
+
+    S1 = np.mean(f_B * (f_AB - f_A), axis=-1) / variance
+    ST = 0.5 * np.mean((f_A - f_AB)**2, axis=-1) / variance
+
+    return S1, ST
+
+
+def input_energy(geometry, inputs, max_chunk_elements=2**21,
+    energy_integration='rectangle'):
+    """ Route energy of the constant acceleration model for each row of
+        'inputs', a DataFrame with a column per input (as named in
+        DEFAULT_BOUNDS or FORCE_PARAMS); inputs it doesn't have take
+        their NOMINAL or longitudinal_forces default values.
+        'energy_integration' is as for RouteTrajectory.
+
+        Returns:
+            energy: array of shape (len(inputs),) [J]
+        """
+
+    chunk_size = max(1, max_chunk_elements // geometry.num_pts)
+
+    energy = np.empty(len(inputs))
+    for start in range(0, len(inputs), chunk_size):
+        chunk = inputs.iloc[start:start + chunk_size]
+
+        def column(name):
+            if name in chunk:
+                return chunk[name].values[:, np.newaxis]
+            return NOMINAL[name]
+
+        energy[start:start + chunk_size] = batch_energy(
+            geometry,
+            column('mass'),
+            a_m=column('a_m'),
+            v_lim=column('v_lim'),
+            charging_power_max=column('charging_power_max'),
+            gradient=column('grade_scale') * geometry.gradient,
+            integration=energy_integration,
+            **{
+                name: chunk[name].values[:, np.newaxis]
+                for name in FORCE_PARAMS if name in chunk
+                }
+            )
+
+    return energy
+
+
+def route_sensitivity(
+    geometry,
+    num_base=1024,
+    bounds=DEFAULT_BOUNDS,
+    seed=None,
+    max_chunk_elements=2**21,
+    energy_integration='rectangle',
+    ):
+    """ Sobol indices of the route energy.
+
+        Args:
+            geometry: RouteGeometry with bus stops assigned, or a
+                RouteTrajectory to take it from
+            num_base: Saltelli base sample size, the model is run
+                num_base * (len(bounds) + 2) times
+            bounds: dict like DEFAULT_BOUNDS
+            seed: seed of the Sobol scrambling
+            energy_integration: as for RouteTrajectory
+
+        Returns:
+            indices: DataFrame indexed by input with columns 'S1' and
+                'ST'
+        """
+
+    if isinstance(geometry, ldm.RouteTrajectory):
+        geometry = RouteGeometry.from_trajectory(geometry)
+
+    num_inputs = len(bounds)
+    A, B, AB = saltelli_samples(bounds, num_base, seed=seed)
+
+    inputs = pd.DataFrame(
+        np.concatenate([A, B, AB.reshape(-1, num_inputs)]),
+        columns=list(bounds),
+        )
+    energy = input_energy(
+        geometry, inputs, max_chunk_elements, energy_integration)
+
+    S1, ST = sobol_indices(
+        energy[:num_base],
+        energy[num_base:2*num_base],
+        energy[2*num_base:].reshape(num_inputs, num_base),
+        )
+
+    return pd.DataFrame(
+        {'S1': S1, 'ST': ST},
+        index=pd.Index(list(bounds), name='input'),
+        )
+
+
+def _route_sensitivity_from_files(
+    route_num, shp_filename, elv_raster_filename, stop_coords, geometry_cache,
+    kwargs):
+    """ route_sensitivity of one route read from files; module level so
+        a process pool can run it.
+        """
+
+    geometry = RouteGeometry.from_files(
+        route_num,
+        shp_filename,
+        elv_raster_filename,
+        stop_coords=stop_coords,
+        geometry_cache=geometry_cache,
+        )
+
+    return route_sensitivity(geometry, **kwargs)
+
+
+def network_sensitivity(
+    route_nums,
+    shp_filename,
+    elv_raster_filename,
+    stop_coords=None,
+    num_base=1024,
+    bounds=DEFAULT_BOUNDS,
+    seed=None,
+    max_chunk_elements=2**21,
+    energy_integration='rectangle',
+    processes=1,
+    geometry_cache=None,
+    ):
+    """ Sobol indices of the energy of every route.
+
+        Args:
+            route_nums: routes to evaluate
+            shp_filename: route shapefile (or RouteStore)
+            elv_raster_filename: elevation raster (or sampler)
+            stop_coords: None, or dict of route to the stop coordinates
+                of that route
+            processes: number of worker processes, 1 to run the routes
+                in this process
+            geometry_cache: GeometryCache for the route geometry
+
+            The other arguments are those of route_sensitivity; every
+            route uses the same samples.
+
+        Returns:
+            indices: DataFrame with columns 'Route', 'input', 'S1' and
+                'ST', one row per route and input
+        """
+
+    stop_coords = stop_coords or {}
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    kwargs = dict(
+        num_base=num_base,
+        bounds=bounds,
+        seed=seed,
+        max_chunk_elements=max_chunk_elements,
+        energy_integration=energy_integration,
+        )
+    route_args = [
+        (
+            route_num,
+            shp_filename,
+            elv_raster_filename,
+            stop_coords.get(route_num),
+            geometry_cache,
+            kwargs,
+            )
+        for route_num in route_nums
+        ]
+
+    if processes == 1:
+        tables = [_route_sensitivity_from_files(*args) for args in route_args]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            tables = list(pool.map(_route_sensitivity_from_files, *zip(*route_args)))
+
+    indices = pd.concat(tables, keys=list(route_nums), names=['Route'])
+
+    return indices.reset_index()
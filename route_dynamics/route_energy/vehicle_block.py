@@ -0,0 +1,329 @@
+""" Battery state of charge over a vehicle block.
+
+    A vehicle block is the day's work of one bus: an ordered list of
+    trips, on any routes and directions, with a layover at the end of
+    each trip where the bus may charge. 'simulate_block' runs the battery
+    through the block; each trip draws its route energy (regen is
+    returned to the battery, which can't charge past full) and each
+    layover charges at the charger power.
+
+    Trips repeat a lot across a schedule, so the energy trace of each
+    (route, direction, period, bus type) is computed once by a
+    'TripLibrary' and shared by every block that runs it. The route
+    geometry is built once per route (and can come from a GeometryCache),
+    the other direction being the same geometry reversed.
+    """
+from .compact_trajectory import CompactRouteTrajectory
+from .route_geometry import RouteGeometry
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+
+# Joules per kWh
+KWH = 3.6e6
+
+# One leg of a block; the trip, then the layover after it [s] at a
+# charger of 'charger_power' [W] (0 for no charger).
+BlockLeg = collections.namedtuple(
+    'BlockLeg',
+    ['route', 'direction', 'period', 'bus_type', 'layover', 'charger_power'],
+    )
+
+# Energy use along one trip; time since the start of the trip [s] and
+# the battery energy used up to each point [J].
+TripTrace = collections.namedtuple('TripTrace', ['time', 'cum_energy'])
+
+# State of charge over one block. 'time', 'soc' and 'leg' (index of the
+# leg each point belongs to) are the curve, the rest are totals.
+BlockResult = collections.namedtuple(
+    'BlockResult',
+    [
+        'time',
+        'soc',
+        'leg',
+        'min_soc',
+        'final_soc',
+        'trip_energy',
+        'charged_energy',
+        ],
+    )
+
+
+class TripLibrary(object):
+    """ Memoized energy traces of trips. """
+
+    def __init__(self,
+        shp_filename,
+        elv_raster_filename,
+        bus_mass=None,
+        trip_loads=None,
+        shapefile_direction='O',
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        a_m=1.0,
+        v_lim=15.0,
+        charging_power_max=0.,
+        energy_integration='rectangle',
+        geometry_cache=None,
+        ):
+        """
+            Args:
+                shp_filename: route shapefile (or RouteStore)
+                elv_raster_filename: elevation raster (or sampler)
+                bus_mass: dict of bus type to unloaded mass [kg],
+                    DEFAULT is route_riders.bus_mass (KCM bus types)
+                trip_loads: None for an empty bus with no stops, or a
+                    function (period, direction, route) -> (stop_coords,
+                    payload) giving the stops of the trip and the
+                    passenger mass leaving each [kg], e.g.
+                    route_riders.mean_trip_loads
+                shapefile_direction: direction the routes are drawn in
+                    the shapefile, the other one is reversed
+                geometry_cache: GeometryCache for the route geometry
+
+                The other arguments are those of RouteTrajectory.
+            """
+
+        if bus_mass is None:
+            from ..route_riders import route_riders
+            bus_mass = route_riders.bus_mass
+
+        self.shp_filename = shp_filename
+        self.elv_raster_filename = elv_raster_filename
+        self.bus_mass = bus_mass
+        self.trip_loads = trip_loads
+        self.shapefile_direction = shapefile_direction
+        self.bus_speed_model = bus_speed_model
+        self.a_m = a_m
+        self.v_lim = v_lim
+        self.charging_power_max = charging_power_max
+        self.energy_integration = energy_integration
+        self.geometry_cache = geometry_cache
+
+        self._geometries = {}
+        self._traces = {}
+
+    def geometry(self, route, direction):
+        """ RouteGeometry of a route driven in 'direction', without
+            stops, built once per route.
+            """
+
+        if (route, direction) not in self._geometries:
+
+            drawn = self._geometries.get((route, self.shapefile_direction))
+            if drawn is None:
+                drawn = RouteGeometry.from_files(
+                    route,
+                    self.shp_filename,
+                    self.elv_raster_filename,
+                    geometry_cache=self.geometry_cache,
+                    )
+                self._geometries[(route, self.shapefile_direction)] = drawn
+
+            if direction != self.shapefile_direction:
+                self._geometries[(route, direction)] = drawn.reversed()
+
+        return self._geometries[(route, direction)]
+
+    def trace(self, route, direction, period, bus_type):
+        """ TripTrace of a trip, computed the first time it is asked
+            for.
+            """
+
+        key = (route, direction, period, bus_type)
+
+        if key not in self._traces:
+
+            unloaded_bus_mass = self.bus_mass[bus_type]
+
+            if self.trip_loads is None:
+                stop_coords, mass_array = None, None
+            else:
+                stop_coords, payload = self.trip_loads(period, direction, route)
+                mass_array = unloaded_bus_mass + np.asarray(payload, dtype=float)
+
+            trajectory = CompactRouteTrajectory(
+                self.geometry(route, direction).with_stops(stop_coords),
+                bus_speed_model=self.bus_speed_model,
+                mass_array=mass_array,
+                unloaded_bus_mass=unloaded_bus_mass,
+                charging_power_max=self.charging_power_max,
+                a_m=self.a_m,
+                v_lim=self.v_lim,
+                energy_integration=self.energy_integration,
+                )
+
+            self._traces[key] = TripTrace(
+                time=trajectory.route_time - trajectory.route_time[0],
+                cum_energy=trajectory.cum_energy,
+                )
+
+        return self._traces[key]
+
+    def __len__(self):
+        return len(self._traces)
+
+
+def soc_trace(soc_start, cum_energy, battery_capacity):
+    """ State of charge along a trip.
+
+        Energy returned by regen can't charge the battery past full, so
+        the state of charge is the unconstrained one (soc_start minus
+        the energy used) pushed down by the most it has gone over 1 so
+        far.
+
+        Args:
+            soc_start: state of charge at the start of the trip
+            cum_energy: battery energy used up to each point [J]
+            battery_capacity: [J]
+
+        Returns:
+            soc: array like cum_energy
+        """
+
+    unclamped = soc_start - np.asarray(cum_energy, dtype=float) / battery_capacity
+
+    overshoot = np.maximum.accumulate(np.maximum(unclamped - 1., 0.))
+
+    return unclamped - overshoot
+
+
+def simulate_block(
+    legs,
+    library,
+    battery_capacity,
+    initial_soc=1.0,
+    charging_efficiency=1.0,
+    ):
+    """ Run the battery through one vehicle block.
+
+        Args:
+            legs: list of BlockLeg (or tuples in the same order)
+            library: TripLibrary the trip traces come from
+            battery_capacity: usable battery energy [kWh]
+            initial_soc: state of charge at the start of the block
+            charging_efficiency: fraction of the charger power that
+                reaches the battery
+
+        Returns:
+            BlockResult
+        """
+
+    capacity = battery_capacity * KWH
+
+    times, socs, leg_idx = [], [], []
+    t = 0.
+    soc = initial_soc
+    trip_energy = 0.
+    charged_energy = 0.
+
+    for i, leg in enumerate(legs):
+        leg = BlockLeg(*leg)
+
+        trace = library.trace(leg.route, leg.direction, leg.period, leg.bus_type)
+
+        trip_soc = soc_trace(soc, trace.cum_energy, capacity)
+        times.append(t + trace.time)
+        socs.append(trip_soc)
+        leg_idx.append(np.full(len(trip_soc), i))
+
+        t = t + trace.time[-1]
+        soc = trip_soc[-1]
+        trip_energy += trace.cum_energy[-1]
+
+        # Layover; charge at constant power until full.
+        charge_rate = leg.charger_power * charging_efficiency / capacity
+        layover_t, layover_soc = [t + leg.layover], [soc]
+        if charge_rate > 0 and leg.layover > 0:
+            time_to_full = max(1. - soc, 0.) / charge_rate
+            if time_to_full < leg.layover:
+                layover_t = [t + time_to_full, t + leg.layover]
+                layover_soc = [max(soc, 1.), max(soc, 1.)]
+            else:
+                layover_soc = [soc + charge_rate * leg.layover]
+            charged_energy += (layover_soc[-1] - soc) * capacity
+
+        times.append(np.array(layover_t))
+        socs.append(np.array(layover_soc))
+        leg_idx.append(np.full(len(layover_t), i))
+
+        t = layover_t[-1]
+        soc = layover_soc[-1]
+
+    time = np.concatenate(times)
+    soc_curve = np.concatenate(socs)
+
+    return BlockResult(
+        time=time,
+        soc=soc_curve,
+        leg=np.concatenate(leg_idx),
+        min_soc=soc_curve.min(),
+        final_soc=soc_curve[-1],
+        trip_energy=trip_energy,
+        charged_energy=charged_energy,
+        )
+
+
+def simulate_blocks(
+    blocks,
+    library,
+    battery_capacity,
+    initial_soc=1.0,
+    charging_efficiency=1.0,
+    min_soc_reserve=0.,
+    keep_curves=True,
+    ):
+    """ Run the battery through every block of a schedule.
+
+        Args:
+            blocks: dict of block id to list of legs (or a list of
+                blocks, numbered from 0)
+            library: TripLibrary shared by all blocks, so each distinct
+                trip is only computed once
+            battery_capacity, initial_soc, charging_efficiency: as for
+                simulate_block
+            min_soc_reserve: lowest state of charge a block may reach
+                and still count as 'feasible'
+            keep_curves: keep the BlockResult of every block
+
+        Returns:
+            summary: DataFrame with one row per block and columns
+                'block', 'legs', 'min_soc', 'final_soc', 'trip_energy'
+                [J], 'charged_energy' [J] and 'feasible'
+            results: dict of block id to BlockResult (empty if
+                keep_curves is False)
+        """
+
+    if not isinstance(blocks, dict):
+        blocks = dict(enumerate(blocks))
+
+    rows = []
+    results = {}
+    for block_id, legs in blocks.items():
+        result = simulate_block(
+            legs,
+            library,
+            battery_capacity,
+            initial_soc=initial_soc,
+            charging_efficiency=charging_efficiency,
+            )
+        rows.append({
+            'block': block_id,
+            'legs': len(legs),
+            'min_soc': result.min_soc,
+            'final_soc': result.final_soc,
+            'trip_energy': result.trip_energy,
+            'charged_energy': result.charged_energy,
+            'feasible': result.min_soc >= min_soc_reserve,
+            })
+        if keep_curves:
+            results[block_id] = result
+
+    summary = pd.DataFrame(rows, columns=[
+        'block', 'legs', 'min_soc', 'final_soc', 'trip_energy',
+        'charged_energy', 'feasible',
+        ])
+
+    return summary, results
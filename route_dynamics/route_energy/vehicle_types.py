@@ -0,0 +1,199 @@
+""" Route energy for every vehicle type of the fleet.
+
+    'vehicle_table' gives the longitudinal dynamics parameters of each
+    KCM bus type (route_riders.bus_mass), with the body of the bus
+    (frontal area, drag, rolling resistance and regen limit) estimated
+    from its mass class. The columns are named after the arguments of
+    'longi_dynam_model.longitudinal_forces', so a table can be passed
+    straight through to the force kernel as (num_vehicles, 1) arrays
+    and 'vehicle_energy' evaluates one route for all vehicle types at
+    once, with the route geometry and kinematics built a single time.
+    """
+from . import longi_dynam_model as ldm
+from .compact_trajectory import batch_energy
+from .route_geometry import RouteGeometry
+
+import numpy as np
+import pandas as pd
+
+
+# Body classes of the KCM fleet, by unloaded mass [kg]. The dimensions,
+# drag and regen limits are approximations for a typical bus of each
+# length; 'standard' is the 40 foot bus RouteTrajectory has always
+# modelled (2.6 m wide, 3.3 m high, drag 0.34).
+BODY_CLASSES = pd.DataFrame(
+    {
+        'max_mass': [12500., 17000., np.inf],
+        'bus_front_area': [2.55*3.2, 2.6*3.3, 2.6*3.3],
+        'drag_coeff': [0.34, 0.34, 0.40],
+        'fric_coeff': [0.01, 0.01, 0.01],
+        'charging_power_max': [1.0e5, 1.5e5, 2.0e5],
+        },
+    index=pd.Index(['short', 'standard', 'articulated'], name='body'),
+    )
+
+# Columns of a vehicle table; all but 'body' are model parameters.
+VEHICLE_COLUMNS = [
+    'body',
+    'mass',
+    'bus_front_area',
+    'drag_coeff',
+    'fric_coeff',
+    'charging_power_max',
+    ]
+
+# Vehicle table columns passed on to longitudinal_forces.
+FORCE_PARAMS = ['bus_front_area', 'drag_coeff', 'fric_coeff']
+
+
+def vehicle_table(bus_mass=None, body_classes=BODY_CLASSES):
+    """ Model parameters of each bus type.
+
+        Args:
+            bus_mass: dict of bus type to unloaded mass [kg], DEFAULT is
+                route_riders.bus_mass (KCM bus types)
+            body_classes: DataFrame like BODY_CLASSES; each bus type
+                takes the parameters of the first class whose
+                'max_mass' is at least its mass
+
+        Returns:
+            vehicles: DataFrame indexed by bus type with VEHICLE_COLUMNS
+        """
+
+    if bus_mass is None:
+        from ..route_riders import route_riders
+        bus_mass = route_riders.bus_mass
+
+    bus_types = list(bus_mass)
+    mass = np.array([bus_mass[bus_type] for bus_type in bus_types], dtype=float)
+
+    class_idx = np.searchsorted(body_classes['max_mass'].values, mass)
+    if np.any(class_idx == len(body_classes)):
+        raise ldm.IllegalArgumentError(
+            "bus mass above the 'max_mass' of every body class"
+            )
+
+    vehicles = body_classes.iloc[class_idx].reset_index()
+    vehicles['mass'] = mass
+    vehicles.index = pd.Index(bus_types, name='BusType')
+
+    return vehicles[VEHICLE_COLUMNS]
+
+
+def vehicle_energy(
+    geometry,
+    vehicles=None,
+    payload=None,
+    bus_speed_model='const_accel_between_stops_and_speed_lim',
+    a_m=1.0,
+    v_lim=15.0,
+    energy_integration='rectangle',
+    ):
+    """ Energy used on one route by each vehicle type.
+
+        The forces and power of all vehicles are evaluated together as
+        (num_vehicles, num_pts) arrays over the kinematics of the route.
+
+        Args:
+            geometry: RouteGeometry with bus stops assigned
+            vehicles: vehicle table, DEFAULT vehicle_table()
+            payload: None for empty buses, or the passenger mass leaving
+                each stop [kg] (as the 'mass_array' of RouteTrajectory,
+                without the bus), carried by every vehicle type
+            energy_integration: as for RouteTrajectory
+
+        Returns:
+            energy: array of shape (len(vehicles),), the same quantity
+                as RouteTrajectory.energy_from_route() [J]
+        """
+
+    if vehicles is None:
+        vehicles = vehicle_table()
+
+    mass = vehicles['mass'].values[:, np.newaxis]
+    if payload is not None:
+        mass = mass + ldm.mass_from_stops(
+            geometry.num_pts,
+            geometry.stop_nn_indicies,
+            np.asarray(payload, dtype=float),
+            0.,
+            )
+
+    return batch_energy(
+        geometry,
+        mass,
+        bus_speed_model=bus_speed_model,
+        a_m=a_m,
+        v_lim=v_lim,
+        charging_power_max=vehicles['charging_power_max'].values[:, np.newaxis],
+        integration=energy_integration,
+        **{
+            name: vehicles[name].values[:, np.newaxis]
+            for name in FORCE_PARAMS
+            }
+        )
+
+
+def route_vehicle_energy(
+    route_nums,
+    shp_filename,
+    elv_raster_filename,
+    vehicles=None,
+    stop_coords=None,
+    payload=None,
+    bus_speed_model='const_accel_between_stops_and_speed_lim',
+    a_m=1.0,
+    v_lim=15.0,
+    energy_integration='rectangle',
+    geometry_cache=None,
+    ):
+    """ Route x vehicle type energy matrix.
+
+        Args:
+            route_nums: routes to evaluate
+            shp_filename: route shapefile (or RouteStore)
+            elv_raster_filename: elevation raster (or sampler)
+            vehicles: vehicle table, DEFAULT vehicle_table()
+            stop_coords: None, or dict of route to the stop coordinates
+                of that route
+            payload: None, or dict of route to the passenger mass
+                leaving each of its stops [kg]
+            energy_integration: as for RouteTrajectory
+            geometry_cache: GeometryCache for the route geometry
+
+        Returns:
+            energy: DataFrame indexed by route with a column per bus
+                type [J]
+        """
+
+    if vehicles is None:
+        vehicles = vehicle_table()
+
+    stop_coords = stop_coords or {}
+    payload = payload or {}
+
+    energy = np.empty((len(route_nums), len(vehicles)))
+    for i, route_num in enumerate(route_nums):
+
+        geometry = RouteGeometry.from_files(
+            route_num,
+            shp_filename,
+            elv_raster_filename,
+            geometry_cache=geometry_cache,
+            ).with_stops(stop_coords.get(route_num))
+
+        energy[i] = vehicle_energy(
+            geometry,
+            vehicles,
+            payload=payload.get(route_num),
+            bus_speed_model=bus_speed_model,
+            a_m=a_m,
+            v_lim=v_lim,
+            energy_integration=energy_integration,
+            )
+
+    return pd.DataFrame(
+        energy,
+        index=pd.Index(list(route_nums), name='Route'),
+        columns=vehicles.index,
+        )
@@ -5,20 +5,30 @@ import geopandas as gpd
 import os
 from os import path
 import sys
-from shapely.geometry import mapping
+import tempfile
+import warnings
 
 #sys.path.append(path.abspath('..'))
-import route_dynamics.route_elevation.base as base
-#csv_path = os.path.join(__path__[0], 'data')
-#dat1 = pd.read_csv(os.path.join(csv_path, 'Trip183.csv')) # KCM Data
-dat1 = pd.read_csv("../data/Trip183.csv") # KCM Data
-dat2 = pd.read_csv("../data/Zon183Unsum.csv") # KCM Data
-
-# Removing all unneeded columns
-trip183 = dat1[['SignRt', 'InOut', 'KeyTrip', 'BusType', 'Seats', 
-					 'Period', 'AnnRides']]
-trip183unsum = dat2[['Route', 'Dir', 'Trip_ID', 'InOut', 'STOP_SEQ', 'STOP_ID',
-                     'Period', 'AveOn', 'AveOff', 'AveLd', 'Obs']]
+import route_dynamics.route_energy.longi_dynam_model as ldm
+from route_dynamics.route_energy.compact_trajectory import batch_energy
+from route_dynamics.route_energy.route_geometry import RouteGeometry
+
+# Location of the KCM data. Defaults to the repository 'data' directory
+# (or $ROUTE_DYNAMICS_DATA_DIR); change with configure().
+DEFAULT_DATA_DIR = os.environ.get(
+    'ROUTE_DYNAMICS_DATA_DIR',
+    path.join(path.dirname(path.abspath(__file__)), '..', '..', 'data'),
+    )
+DATA_DIR = DEFAULT_DATA_DIR
+trip_csv = path.join(DATA_DIR, 'Trip183.csv') # KCM Data
+zone_csv = path.join(DATA_DIR, 'Zon183Unsum.csv') # KCM Data
+routes_shp = path.join(DATA_DIR, 'six_routes.shp')
+stops_shp = path.join(
+    DATA_DIR, 'Transit_Stops_for_King_County_Metro__transitstop_point.shp')
+# Route -> stops index built from stops_shp, see StopIndex
+stop_index_file = path.join(DATA_DIR, 'route_stop_index.pkl')
+# Ridership tables read from trip_csv and zone_csv, see RidershipData
+ridership_cache_file = path.join(DATA_DIR, 'ridership_cache.pkl')
 
 # Dictionary created using data from King County Metro
 # Relates bus type to bus mass (many are approximations)
@@ -47,13 +57,413 @@ bus_mass = {
     96: 19051
         }
 
-# Creating a new dictionary relating Trip_ID to buss mass
-trip183 = trip183.replace({'BusType': bus_mass})
-trip_mass = trip183[['BusType', 'KeyTrip']]
-trip_dict = dict(zip(trip_mass.KeyTrip, trip_mass.BusType))
+# Ridership tables and stop index, loaded on first use by
+# ridership_data() and stop_index()
+_ridership = None
+_stop_index = None
 
-routes_shp = '../data/six_routes.shp'
-stops_shp = '../data/Transit_Stops_for_King_County_Metro__transitstop_point.shp'
+
+def configure(data_dir=None, trip=None, zone=None, routes=None, stops=None,
+              stop_index=None, ridership_cache=None):
+    """
+    Sets where the KCM data is read from, and drops any tables already
+    loaded so the next query reads the new files.
+
+    Inputs:
+    data_dir - directory holding the files under their usual names
+    trip, zone - paths of 'Trip183.csv' and 'Zon183Unsum.csv'
+    routes, stops - paths of the route and stop shapefiles
+    stop_index - where the route -> stops index is saved
+    ridership_cache - where the ridership tables are saved
+    (arguments left as None keep their current value, or follow
+    data_dir if it is given)
+
+    """
+    global DATA_DIR, trip_csv, zone_csv, routes_shp, stops_shp
+    global stop_index_file, ridership_cache_file, _ridership, _stop_index
+
+    if data_dir is not None:
+        DATA_DIR = data_dir
+        trip_csv = path.join(data_dir, 'Trip183.csv')
+        zone_csv = path.join(data_dir, 'Zon183Unsum.csv')
+        routes_shp = path.join(data_dir, 'six_routes.shp')
+        stops_shp = path.join(
+            data_dir, 'Transit_Stops_for_King_County_Metro__transitstop_point.shp')
+        stop_index_file = path.join(data_dir, 'route_stop_index.pkl')
+        ridership_cache_file = path.join(data_dir, 'ridership_cache.pkl')
+
+    trip_csv = trip or trip_csv
+    zone_csv = zone or zone_csv
+    routes_shp = routes or routes_shp
+    stops_shp = stops or stops_shp
+    stop_index_file = stop_index or stop_index_file
+    ridership_cache_file = ridership_cache or ridership_cache_file
+
+    _ridership = None
+    _stop_index = None
+
+
+def _load_saved(filename):
+    """
+    Dict saved by _save() to 'filename', or None if there is none or it
+    can't be read (e.g. cut short, or pickled by another pandas), so a
+    bad file is rebuilt rather than failing the caller.
+    """
+    if filename is None or not path.exists(filename):
+        return None
+
+    try:
+        saved = pd.read_pickle(filename)
+    except Exception:
+        return None
+
+    return saved if isinstance(saved, dict) else None
+
+
+def _save(contents, filename):
+    """
+    Pickles 'contents' to a temporary file next to 'filename' and
+    renames it into place, so other processes never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path.dirname(path.abspath(filename)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pd.to_pickle(contents, f)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _csv_signature(csv_files):
+    """
+    Size and modification time of each ridership CSV, used to tell if
+    saved ridership tables are stale.
+    """
+    signature = []
+    for csv_file in csv_files:
+        stat = os.stat(csv_file)
+        signature.append([stat.st_size, stat.st_mtime])
+    return signature
+
+
+class RidershipData(object):
+    """
+    The KCM trip and stop ridership tables, parsed from CSV once and
+    saved as pickled (columnar) DataFrames, so later runs skip the CSV
+    parsing. The stop table is sorted by (Route, InOut, Period, Trip_ID,
+    STOP_SEQ, STOP_ID) and indexed by (Route, InOut, Period), so a query
+    slices out its rows instead of scanning the table.
+    """
+
+    group_columns = ['Route', 'InOut', 'Period']
+
+    def __init__(self, dat1, dat2, source=None, source_signature=None):
+        """
+        Use RidershipData.build() or RidershipData.from_csv() rather than
+        calling directly.
+
+        Inputs:
+        dat1, dat2 - the trip and stop tables, as read from
+            'Trip183.csv' and 'Zon183Unsum.csv'
+        source - paths of the two CSVs the tables were read from
+        source_signature - _csv_signature() of the source
+        """
+        self.dat1 = dat1
+        self.dat2 = dat2
+        self.source = source
+        self.source_signature = source_signature
+
+        # Removing all unneeded columns
+        self.trip183 = self.dat1[['SignRt', 'InOut', 'KeyTrip', 'BusType',
+                                  'Seats', 'Period', 'AnnRides']]
+        self.trip183unsum = self.dat2[['Route', 'Dir', 'Trip_ID', 'InOut',
+                                       'STOP_SEQ', 'STOP_ID', 'Period',
+                                       'AveOn', 'AveOff', 'AveLd', 'Obs']]
+
+        # Creating a new dictionary relating Trip_ID to buss mass
+        trip_mass = self.trip183.replace({'BusType': bus_mass})
+        self.trip_dict = dict(zip(trip_mass.KeyTrip, trip_mass.BusType))
+
+        self._sorted = self.trip183unsum.sort_values(
+            by=self.group_columns + ['Trip_ID', 'STOP_SEQ', 'STOP_ID'],
+            kind='mergesort',
+            )
+
+        # (Route, InOut, Period) -> (first row, last row + 1); the groups
+        # are contiguous in the sorted table.
+        keys = self._sorted[self.group_columns]
+        starts = np.flatnonzero(
+            np.append(True, (keys.values[1:] != keys.values[:-1]).any(axis=1))
+            )
+        ends = np.append(starts[1:], len(keys))
+        self._index = {
+            tuple(keys.values[start]): (start, end)
+            for start, end in zip(starts, ends)
+            }
+
+    @classmethod
+    def build(cls, trip_csv, zone_csv):
+        """
+        Parses the trip and stop ridership CSVs.
+        """
+        csv_files = [trip_csv, zone_csv]
+
+        return cls(
+            pd.read_csv(trip_csv),
+            pd.read_csv(zone_csv),
+            source=[path.abspath(csv_file) for csv_file in csv_files],
+            source_signature=_csv_signature(csv_files),
+            )
+
+    @classmethod
+    def from_csv(cls, trip_csv, zone_csv, cache_file=None):
+        """
+        Tables of 'trip_csv' and 'zone_csv', read from 'cache_file' if
+        they were saved there from the same (unchanged) CSVs, otherwise
+        parsed and saved to 'cache_file'.
+
+        Inputs:
+        trip_csv, zone_csv - paths of 'Trip183.csv' and 'Zon183Unsum.csv'
+        cache_file - where the tables are saved (DEFAULT = None, not saved)
+
+        Outputs:
+        data - RidershipData
+        """
+        csv_files = [trip_csv, zone_csv]
+
+        saved = _load_saved(cache_file)
+        if saved is not None:
+            if (
+                saved.get('source') == [path.abspath(f) for f in csv_files]
+                and
+                saved.get('source_signature') == _csv_signature(csv_files)
+                and
+                'dat1' in saved and 'dat2' in saved
+                ):
+                return cls(
+                    saved['dat1'],
+                    saved['dat2'],
+                    source=saved['source'],
+                    source_signature=saved['source_signature'],
+                    )
+
+        data = cls.build(trip_csv, zone_csv)
+
+        if cache_file is not None:
+            try:
+                data.save(cache_file)
+            except OSError as err:
+                warnings.warn('Ridership tables not saved; {}'.format(err))
+
+        return data
+
+    def save(self, cache_file):
+        _save(
+            {
+                'source': self.source,
+                'source_signature': self.source_signature,
+                'dat1': self.dat1,
+                'dat2': self.dat2,
+                },
+            cache_file,
+            )
+
+    def query(self, period, direction, route):
+        """
+        Rows of the stop ridership table for one route, direction and
+        period, sorted by Trip_ID, STOP_SEQ and STOP_ID.
+        """
+        start, stop = self._index.get((route, direction, period), (0, 0))
+        return self._sorted.iloc[start:stop].copy()
+
+
+def ridership_data():
+    """
+    The RidershipData of the configured files, loaded (or parsed and
+    saved to ridership_cache_file) on first use.
+    """
+    global _ridership
+
+    if _ridership is None:
+        _ridership = RidershipData.from_csv(
+            trip_csv, zone_csv, ridership_cache_file)
+
+    return _ridership
+
+
+def _stops_signature(stops_shapefile):
+    """
+    Size and modification time of the stops layer files, used to tell if
+    a saved stop index is stale.
+    """
+    stem, _ = path.splitext(stops_shapefile)
+    signature = {}
+    for ext in ['.shp', '.dbf']:
+        if path.exists(stem + ext):
+            stat = os.stat(stem + ext)
+            signature[ext] = [stat.st_size, stat.st_mtime]
+    return signature
+
+
+class StopIndex(object):
+    """
+    Inverted index from route number to the stops serving it, built from
+    the 'ROUTE_LIST' column of the King County stops layer. Each route's
+    stops are held as one block of rows (in the order of the stops
+    layer), so a lookup slices out the block instead of scanning every
+    stop.
+    """
+
+    def __init__(self, stops, source=None, source_signature=None):
+        """
+        Use StopIndex.build() or StopIndex.from_shapefile() rather than
+        calling directly.
+
+        Inputs:
+        stops - DataFrame with columns 'route' (route number as in
+            ROUTE_LIST), 'STOP_ID', 'x' and 'y', sorted by route
+        source - path of the stops layer the index was made from
+        source_signature - _stops_signature() of the source
+        """
+        self.stops = stops
+        self.source = source
+        self.source_signature = source_signature
+
+        routes = stops['route'].values
+        starts = np.flatnonzero(np.append(True, routes[1:] != routes[:-1]))
+        ends = np.append(starts[1:], len(routes))
+        self._index = {
+            routes[start]: (start, end) for start, end in zip(starts, ends)
+            }
+
+    @classmethod
+    def build(cls, stops_shapefile):
+        """
+        Reads the stops layer once and inverts its ROUTE_LIST column.
+
+        Inputs:
+        stops_shapefile - King County Metro stops layer (.shp)
+
+        Outputs:
+        index - StopIndex
+        """
+        stops = gpd.read_file(stops_shapefile)
+
+        # One row per (stop, route) pair, in the order of the layer
+        route_lists = stops['ROUTE_LIST'].fillna(value=str(0)).astype(str)
+        pairs = pd.DataFrame({
+            'route': route_lists.str.split(' '),
+            'STOP_ID': stops['STOP_ID'].values,
+            'x': stops.geometry.x.values,
+            'y': stops.geometry.y.values,
+            }).explode('route')
+
+        pairs = pairs[pairs['route'] != '']
+        pairs = pairs.sort_values(by='route', kind='mergesort')
+        pairs = pairs.reset_index(drop=True)
+
+        return cls(
+            pairs,
+            source=path.abspath(stops_shapefile),
+            source_signature=_stops_signature(stops_shapefile),
+            )
+
+    @classmethod
+    def from_shapefile(cls, stops_shapefile, index_file=None):
+        """
+        Index for 'stops_shapefile', read from 'index_file' if it was
+        saved there from the same (unchanged) layer, otherwise built and
+        saved to 'index_file'.
+
+        Inputs:
+        stops_shapefile - King County Metro stops layer (.shp)
+        index_file - where the index is saved (DEFAULT = None, not saved)
+
+        Outputs:
+        index - StopIndex
+        """
+        saved = _load_saved(index_file)
+        if saved is not None:
+            if (
+                saved.get('source') == path.abspath(stops_shapefile)
+                and
+                saved.get('source_signature') == _stops_signature(stops_shapefile)
+                and
+                'stops' in saved
+                ):
+                return cls(
+                    saved['stops'],
+                    source=saved['source'],
+                    source_signature=saved['source_signature'],
+                    )
+
+        index = cls.build(stops_shapefile)
+
+        if index_file is not None:
+            try:
+                index.save(index_file)
+            except OSError as err:
+                warnings.warn('Stop index not saved; {}'.format(err))
+
+        return index
+
+    def save(self, index_file):
+        _save(
+            {
+                'source': self.source,
+                'source_signature': self.source_signature,
+                'stops': self.stops,
+                },
+            index_file,
+            )
+
+    @property
+    def route_nums(self):
+        """ Route numbers (as written in ROUTE_LIST) with stops. """
+        return list(self._index)
+
+    def route_stops(self, route_num):
+        """
+        Stops serving a route, in the order of the stops layer.
+
+        Inputs:
+        route_num - King County Metro Route Number
+
+        Outputs:
+        stops - DataFrame with columns 'STOP_ID' and 'coordinates'
+        """
+        start, end = self._index.get(str(route_num), (0, 0))
+        rows = self.stops.iloc[start:end]
+
+        return pd.DataFrame({
+            'STOP_ID': rows['STOP_ID'].values,
+            'coordinates': list(zip(rows['x'].values, rows['y'].values)),
+            })
+
+
+def stop_index():
+    """
+    The StopIndex of the configured stops layer, loaded (or built and
+    saved to stop_index_file) on first use.
+    """
+    global _stop_index
+
+    if _stop_index is None:
+        _stop_index = StopIndex.from_shapefile(stops_shp, stop_index_file)
+
+    return _stop_index
+
+
+def __getattr__(name):
+    # The tables used to be read at import; they are still available as
+    # module attributes, loaded when first asked for.
+    if name in ['dat1', 'dat2', 'trip183', 'trip183unsum', 'trip_dict']:
+        return getattr(ridership_data(), name)
+    raise AttributeError(
+        "module '{}' has no attribute '{}'".format(__name__, name))
 
 
 def route_ridership(period, direction, route):
@@ -77,12 +487,9 @@ def route_ridership(period, direction, route):
 
     """
 
-    df = trip183unsum
-    df = df.drop(df[(df.Period != period)].index)
-    df = df.drop(df[(df.InOut != direction)].index)
-    df = df.drop(df[(df.Route != route)].index)
+    data = ridership_data()
 
-    final_df = df.sort_values(by=['Trip_ID', 'STOP_SEQ', 'STOP_ID'])
+    final_df = data.query(period, direction, route)
     seq_id = final_df[['STOP_SEQ', 'STOP_ID']]
     seq_id2 = seq_id.drop_duplicates(subset=['STOP_SEQ'], keep='first')
     seq_id3 = seq_id2.sort_values(by='STOP_SEQ')
@@ -90,7 +497,7 @@ def route_ridership(period, direction, route):
     riders = final_df.pivot(index='STOP_SEQ', columns='Trip_ID', values='AveLd')
 
     keyfind = list(riders.columns)
-    mass_bus = [trip_dict[x] for x in keyfind]
+    mass_bus = [data.trip_dict[x] for x in keyfind]
     mode = mode_mass = max(set(mass_bus), key=mass_bus.count)
     rider_columns = list(riders.columns)
     kept_columns = []
@@ -126,38 +533,7 @@ def stop_coord(num, riders_num):
         ridership mass, organized by STOP_SEQ
 
     """
-    route_num = num
-
-    route = base.read_shape(routes_shp, route_num)
-    points = base.extract_point_df(route)
-    stops = gpd.read_file(stops_shp)
-    stops['ROUTE_LIST'].fillna(value=str(0), inplace=True)
-
-    stops_list = pd.DataFrame()
-    for i in range(0, len(stops)):
-
-        if str(route_num) in (stops['ROUTE_LIST'][i]):
-            for x in stops['ROUTE_LIST'][i].split(' '):
-                if str(route_num) == x:
-                    stops_list = stops_list.append(stops.iloc[i])
-                else:
-                    pass
-        else:
-            pass
-
-    stop_ids = stops_list['STOP_ID'].values
-
-    geometry = stops_list.geometry.values
-
-    xy = []
-    for i in range(len(geometry)):
-        dic = mapping(geometry[i])
-        coords = dic['coordinates']
-        xy.append(coords)
-        xy_df = pd.DataFrame(columns = ['STOP_ID','coordinates'])
-        xy_df['coordinates'] = xy
-
-    xy_df['STOP_ID'] = stops_list['STOP_ID'].values
+    xy_df = stop_index().route_stops(num)
 
     df = riders_num
     df_ind = df.reset_index()
@@ -169,3 +545,195 @@ def stop_coord(num, riders_num):
     df_combine = df_comb.sort_values(by='STOP_SEQ')
 
     return xy_df, df_combine
+
+
+def mean_trip_loads(period, direction, route):
+    """
+    Stops and mean passenger mass of a route, direction and period, as
+    route_ridership averages them (over the trips of the most common bus
+    type), in the form vehicle_block.TripLibrary takes as 'trip_loads'.
+
+    Inputs:
+    period - A block of time, options are 'AM', 'MID', 'PM', 'XEV', 'XNT'
+    direction - Inbound 'I' or Outbound 'O'
+    route - King County Metro Route Number
+
+    Outputs:
+    stop_coords - list of (lon, lat) of the stops with known coordinates,
+        in STOP_SEQ order
+    payload - array of the mean passenger mass leaving each of those
+        stops (kg)
+
+    """
+
+    _, riders_kept, _ = route_ridership(period, direction, route)
+    _, df_combine = stop_coord(route, riders_kept)
+    located = df_combine[df_combine['coordinates'].notnull()]
+
+    return list(located['coordinates']), np.nan_to_num(located['Mean'].values)
+
+
+def route_trip_energies(period, direction, route, rasterfile,
+                        shapefile=None,
+                        bus_speed_model='const_accel_between_stops_and_speed_lim',
+                        a_m=1.0, v_lim=15.0, charging_power_max=0.,
+                        energy_integration='rectangle', geometry=None):
+    """
+    Calculates the energy of every trip of a route, direction and period
+    in the KCM ridership data, each with its own bus type mass and
+    passenger loads.
+
+    The route geometry and the matching of stops to route points are
+    built once; the mass profiles and energies of all trips are then
+    computed together as (trips x route points) arrays.
+
+    Inputs:
+    period - A block of time, options are 'AM', 'MID', 'PM', 'XEV', 'XNT'
+    direction - Inbound 'I' or Outbound 'O'
+    route - King County Metro Route Number
+    rasterfile - elevation data file (.tif) or elevation sampler
+    shapefile - route geospatial data (.shp file) or RouteStore, DEFAULT
+        is the configured routes_shp
+    bus_speed_model, a_m, v_lim, charging_power_max, energy_integration -
+        as for RouteTrajectory
+    geometry - RouteGeometry of the route driven in 'direction', to use
+        instead of reading the route from shapefile and rasterfile
+
+    Outputs:
+    energy_df - A pandas DataFrame with one row per Trip_ID and columns
+        'Trip_ID', 'BusMass' (unloaded mass of the trip's bus type, kg),
+        'MeanLoad' (mean passengers over the stops) and 'Energy' (J)
+
+    """
+
+    final_df, riders_kept, mode_mass = route_ridership(period, direction, route)
+
+    # Passenger loads leaving each stop, stops (in STOP_SEQ order) by trips
+    loads = final_df.pivot(index='STOP_SEQ', columns='Trip_ID', values='AveLd')
+
+    # Stops with known coordinates; 'STOP_SEQ' of df_combine is the row
+    # of the stop in riders_kept, and so in 'loads'
+    xy_df, df_combine = stop_coord(route, riders_kept)
+    located = df_combine[df_combine['coordinates'].notnull()]
+    stop_coords = list(located['coordinates'])
+    loads = loads.iloc[located['STOP_SEQ'].values.astype(int)]
+
+    if geometry is None:
+        if shapefile is None:
+            shapefile = routes_shp
+        geometry = RouteGeometry.from_files(route, shapefile, rasterfile)
+
+    geometry = geometry.with_stops(stop_coords)
+
+    trip_ids = loads.columns.values
+    trip_dict = ridership_data().trip_dict
+    trip_bus_mass = np.array([trip_dict[trip] for trip in trip_ids], dtype=float)
+
+    # Stops a trip has no load for keep the load from the stop before.
+    payload = ldm.mass_from_stops(
+        geometry.num_pts,
+        geometry.stop_nn_indicies,
+        ldm.PASSENGER_MASS * loads.values.T,
+        0.,
+        )
+
+    energy = batch_energy(
+        geometry,
+        trip_bus_mass[:, np.newaxis] + payload,
+        bus_speed_model=bus_speed_model,
+        a_m=a_m,
+        v_lim=v_lim,
+        charging_power_max=charging_power_max,
+        integration=energy_integration,
+        )
+
+    energy_df = pd.DataFrame({
+        'Trip_ID': trip_ids,
+        'BusMass': trip_bus_mass,
+        'MeanLoad': np.nanmean(loads.values, axis=0),
+        'Energy': energy,
+        })
+
+    return energy_df
+
+
+PERIODS = ['AM', 'MID', 'PM', 'XEV', 'XNT']
+DIRECTIONS = ['O', 'I']
+
+
+def route_scenario_energies(route, rasterfile, shapefile=None,
+                            periods=PERIODS, directions=DIRECTIONS,
+                            shapefile_direction='O',
+                            bus_speed_model='const_accel_between_stops_and_speed_lim',
+                            a_m=1.0, v_lim=15.0, charging_power_max=0.,
+                            energy_integration='rectangle'):
+    """
+    Calculates the energy of every trip of a route for every period and
+    direction in the KCM ridership data.
+
+    The route is read and its elevation sampled once, for the direction
+    the route shapefile is drawn in; the other direction is the same
+    geometry reversed (RouteGeometry.reversed). Each scenario then only
+    matches its own stops and runs route_trip_energies on the shared
+    geometry.
+
+    Inputs:
+    route - King County Metro Route Number
+    rasterfile - elevation data file (.tif) or elevation sampler
+    shapefile - route geospatial data (.shp file) or RouteStore, DEFAULT
+        is the configured routes_shp
+    periods - periods to evaluate, DEFAULT all five
+    directions - directions to evaluate, DEFAULT 'O' and 'I'
+    shapefile_direction - direction the route is drawn in the shapefile
+    bus_speed_model, a_m, v_lim, charging_power_max, energy_integration -
+        as for RouteTrajectory
+
+    Outputs:
+    scenario_df - A pandas DataFrame with one row per trip and columns
+        'Route', 'Period', 'InOut', 'Trip_ID', 'BusMass', 'MeanLoad' and
+        'Energy' (J). Scenarios without ridership data have no rows.
+
+    """
+
+    if shapefile is None:
+        shapefile = routes_shp
+
+    drawn = RouteGeometry.from_files(route, shapefile, rasterfile)
+    geometries = {}
+
+    tables = []
+    for period in periods:
+        for direction in directions:
+
+            if ridership_data().query(period, direction, route).empty:
+                continue
+
+            if direction not in geometries:
+                if direction == shapefile_direction:
+                    geometries[direction] = drawn
+                else:
+                    geometries[direction] = drawn.reversed()
+
+            energy_df = route_trip_energies(
+                period,
+                direction,
+                route,
+                rasterfile,
+                bus_speed_model=bus_speed_model,
+                a_m=a_m,
+                v_lim=v_lim,
+                charging_power_max=charging_power_max,
+                energy_integration=energy_integration,
+                geometry=geometries[direction],
+                )
+            energy_df.insert(0, 'InOut', direction)
+            energy_df.insert(0, 'Period', period)
+            energy_df.insert(0, 'Route', route)
+            tables.append(energy_df)
+
+    columns = ['Route', 'Period', 'InOut', 'Trip_ID', 'BusMass',
+               'MeanLoad', 'Energy']
+    if not tables:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(tables, ignore_index=True)[columns]
@@ -28,6 +28,7 @@ class SimpleRouteTrajectory(ldm.RouteTrajectory):
         # charging_power_max=50000 # should be kW
         a_m=1.0,
         v_lim=15.0,
+        mass_alg='list_per_stop',
         ):
         """
             """
@@ -40,6 +41,7 @@ class SimpleRouteTrajectory(ldm.RouteTrajectory):
             mass_array,
             unloaded_bus_mass,
             charging_power_max,
+            mass_alg=mass_alg,
             )
 
         # The package implemented 'RouteTrajectory' class runs the
@@ -142,4 +144,24 @@ class SimpleRouteTrajectory(ldm.RouteTrajectory):
 
         route_df = self._add_cum_dist_to_df(route_cum_distance, route_df)
 
-        return route_df
\ No newline at end of file
+        return route_df
+
+
+# Straight 780 m route of 40 points with three stops, for the batch
+# energy tests.
+const_a_route_coords = [(0, 20.*i) for i in range(40)]
+const_a_stop_coords = [(0.5, 100.), (0, 400.), (1, 650.)]
+
+
+def simple_const_a_instance(**kwargs):
+    """ SimpleRouteTrajectory of the constant acceleration model on the
+        straight test route at a 2% grade; keyword arguments are passed
+        on to SimpleRouteTrajectory.
+        """
+    return SimpleRouteTrajectory(
+        route_coords=const_a_route_coords,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=const_a_stop_coords,
+        elevation_gradient_const=0.02,
+        **kwargs
+        )
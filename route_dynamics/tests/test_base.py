@@ -5,11 +5,13 @@
 import geopandas as gpd
 import numpy as np
 from shapely.geometry import LineString
+from geopy.distance import geodesic
 from os import path
 import sys
 sys.path.append(path.abspath('..'))
 
 from ..route_elevation import base
+from ..route_elevation import geodesic as rgd
 
 sys.path.append(path.abspath(path.join('..','..')))
 shapefile = 'data/six_routes.shp'
@@ -48,6 +50,55 @@ def test_distance_measure():
     return
 
 
+def test_distance_measure_matches_geopy():
+    """Test that the batch geodesic distances agree with geopy to below a millimetre"""
+    distance, cum_distance = base.distance_measure(route_shp)
+    coords = base.extract_point_array(route_shp)
+    geopy_distance = [
+        geodesic(coords[i][::-1], coords[i+1][::-1]).m
+        for i in range(len(coords) - 1)
+        ]
+    assert np.max(np.abs(distance - geopy_distance)) < 1e-3, 'Vincenty distances differ from geopy by more than 1 mm'
+    assert np.isclose(cum_distance[-1], np.sum(geopy_distance)), 'Cumulative distance is wrong'
+    return
+
+
+def test_flat_distance_error_bound():
+    """Test that the flat ellipsoid approximation stays within its documented bound for short segments"""
+    lat = np.array([47.6, 47.6, -33.9, 0.0])
+    lon = np.array([-122.3, -122.3, 151.2, 0.0])
+    lat2 = lat + np.array([0.005, 0.0, -0.004, 0.003])
+    lon2 = lon + np.array([0.0, 0.008, 0.006, 0.0])
+    flat = rgd.flat_ellipsoid(lat, lon, lat2, lon2)
+    exact = rgd.vincenty_inverse(lat, lon, lat2, lon2)
+    assert np.all(exact < 1000), 'Test segments should be shorter than 1 km'
+    assert np.max(np.abs(flat - exact)) < 1e-4, 'Flat approximation error should be below 0.1 mm under 1 km'
+    return
+
+
+def test_flat_distance_error_at_high_latitude():
+    """Test the documented flat ellipsoid error of 10 km segments up to 70 degrees and beyond"""
+    lat = np.array([47.6, 60.0, 70.0, 80.0])
+    lon = np.zeros(4)
+    # About 10 km north-east of each point
+    lat2 = lat + 0.0636
+    lon2 = 0.0636 / np.cos(np.radians(lat))
+    flat = rgd.flat_ellipsoid(lat, lon, lat2, lon2)
+    exact = rgd.vincenty_inverse(lat, lon, lat2, lon2)
+    error = np.abs(flat - exact)
+    assert np.all(exact < 1.1e4), 'Test segments should be about 10 km'
+    assert np.all(error[:3] < 0.01), 'Flat approximation error should be below 1 cm up to 70 degrees'
+    assert error[3] < 0.05, 'Flat approximation error should be below 5 cm at 80 degrees'
+    return
+
+
+def test_vincenty_coincident_points():
+    """Test that repeated route points have zero distance"""
+    distance = rgd.segment_distances([(-122.3, 47.6), (-122.3, 47.6)])
+    assert distance[0] == 0, 'Distance between identical points should be zero'
+    return
+
+
 # def test_gradient():
 #     """Test if the elevation data convert to meter metric and gradient data have the right length."""
 #     elevation_meters, route_gradient, route_cum_distance, route_distance = base.gradient(route_shp, rasterfile)
@@ -103,3 +154,20 @@ def test_distance_measure():
 #     for idx in range(len(metrics)):
 #         assert metrics[idx] >= 0, 'Values of ranking should greater than 0.'
 #     return
+
+
+def test_make_multi_lines_segments():
+    """Test that each row holds the segment from the previous point, with schema unchanged"""
+    linestring_route_df = base.extract_point_df(route_shp)
+    gradient = np.linspace(-0.1, 0.1, len(linestring_route_df))
+    gdf_route = base.make_multi_lines(linestring_route_df, gradient)
+
+    assert list(gdf_route.columns) == ['coordinates', 'gradient', 'geometry'], 'Schema of route GeoDataFrame changed'
+    assert gdf_route.geometry.values[0] is None, 'First point should have no line'
+    coords = linestring_route_df['coordinates']
+    for idx in [1, 100, 207]:
+        assert gdf_route.geometry.values[idx].equals(LineString([coords[idx-1], coords[idx]])), 'Line segment is wrong'
+
+    from_array = base.make_multi_lines(base.extract_point_array(route_shp), gradient)
+    assert from_array.to_json() == gdf_route.to_json(), 'Array input should give the same GeoDataFrame'
+    return
@@ -0,0 +1,36 @@
+""" Smoke test of the benchmark suite at small sizes """
+import numpy as np
+
+from benchmarks import run_benchmarks
+from benchmarks import synthetic
+
+
+def test_synthetic_route_stays_in_raster(tmp_path):
+    inputs = synthetic.make_inputs(str(tmp_path), 500)
+    west, south, east, north = synthetic.BOUNDS
+
+    assert inputs['coordinates'].shape == (500, 2)
+    assert np.all(inputs['coordinates'][:, 0] > west)
+    assert np.all(inputs['coordinates'][:, 1] < north)
+    assert len(inputs['stop_coords']) == 500 // 40
+
+
+def test_run_and_compare(tmp_path):
+    results = run_benchmarks.run(
+        sizes=[100, 400],
+        benchmarks=['distance_measure', 'find_knn', 'const_a_dynamics',
+            'calculate_mass', 'route_trajectory'],
+        repeat=1,
+        data_dir=str(tmp_path),
+        log=lambda line: None,
+        )
+
+    assert len(results['results']) == 10
+    assert all(record['best'] > 0 for record in results['results'])
+    assert set(results['growth']) == {
+        'distance_measure', 'find_knn', 'const_a_dynamics',
+        'calculate_mass', 'route_trajectory'}
+
+    rows, regressions = run_benchmarks.compare(results, results)
+    assert len(rows) == 10
+    assert regressions == []
@@ -0,0 +1,192 @@
+""" Tests for the array backed compact trajectory """
+from ..route_energy import longi_dynam_model as ldm
+from ..route_energy.compact_trajectory import CompactRouteTrajectory, batch_energy
+from ..route_energy.route_geometry import RouteGeometry
+from ..tests import simple_route as sro
+
+import numpy as np
+import pytest
+
+route_coords = [(0, 20.*i) for i in range(40)]
+stop_coords = [(0.5, 100.), (0, 400.), (1, 650.)]
+speed_models = [
+    'stopped_at_stops__15mph_between',
+    'constant_15mph',
+    'const_accel_between_stops_and_speed_lim',
+    ]
+
+
+@pytest.mark.parametrize('bus_speed_model', speed_models)
+def test_compact_matches_route_df(bus_speed_model):
+    """ Every column of the compact trajectory matches RouteTrajectory """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords=route_coords,
+        bus_speed_model=bus_speed_model,
+        stop_coords=stop_coords,
+        elevation_gradient_const=0.03,
+        mass_array=[14000, 15000, 13000],
+        charging_power_max=2e4,
+        )
+    compact = CompactRouteTrajectory.from_trajectory(instance)
+
+    for name in compact.columns:
+        if name == 'elevation':
+            continue
+        assert np.allclose(
+            getattr(compact, name),
+            instance.route_df[name].values.astype(float),
+            equal_nan=True,
+            ), "column '{}' differs".format(name)
+
+    assert np.isclose(compact.energy_from_route(), instance.energy_from_route())
+
+
+def test_compact_has_no_instance_dict():
+    """ Slots only, and float32 storage halves the per-point memory """
+    instance = sro.SimpleRouteTrajectory(route_coords=route_coords)
+    compact = CompactRouteTrajectory.from_trajectory(instance)
+    compact_32 = CompactRouteTrajectory.from_trajectory(instance, dtype=np.float32)
+
+    assert not hasattr(compact, '__dict__')
+    assert compact.velocity.flags['C_CONTIGUOUS']
+    assert compact_32.nbytes < 0.6 * compact.nbytes
+
+
+def test_to_geodataframe_matches_route_df():
+    """ The GeoDataFrame is rebuilt on demand with the same geometry """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords=route_coords,
+        stop_coords=stop_coords,
+        )
+    gdf = CompactRouteTrajectory.from_trajectory(instance).to_geodataframe()
+
+    assert set(instance.route_df.columns) <= set(gdf.columns)
+    assert gdf.geometry.values[0] is None
+    assert gdf.geometry.values[5].equals(instance.route_df.geometry.values[5])
+    assert np.allclose(gdf.power_output.values, instance.route_df.power_output.values, equal_nan=True)
+
+
+def test_unknown_speed_model_raises():
+    instance = sro.SimpleRouteTrajectory(route_coords=route_coords)
+    instance.bus_speed_model = 'warp_speed'
+
+    with pytest.raises(ldm.IllegalArgumentError):
+        CompactRouteTrajectory.from_trajectory(instance)
+
+
+@pytest.mark.parametrize('integration', ['rectangle', 'trapezoid'])
+@pytest.mark.parametrize('bus_speed_model', [
+    'constant_15mph',
+    'const_accel_between_stops_and_speed_lim',
+    ])
+def test_batch_energy_matches_per_trip(bus_speed_model, integration):
+    """ One (trips x points) evaluation gives each trip's own energy """
+    trips = [
+        (12927, [14000, 15000, 13000]),
+        (19051, [19051, 25000, 21000]),
+        (11000, [11000, 11000, 11000]),
+        ]
+
+    instances = [
+        sro.SimpleRouteTrajectory(
+            route_coords=route_coords,
+            bus_speed_model=bus_speed_model,
+            stop_coords=stop_coords,
+            elevation_gradient_const=0.03,
+            mass_array=mass_array,
+            unloaded_bus_mass=unloaded,
+            charging_power_max=2e4,
+            )
+        for unloaded, mass_array in trips
+        ]
+    geometry = RouteGeometry.from_trajectory(instances[0])
+    mass = np.array([
+        ldm.mass_from_stops(geometry.num_pts, geometry.stop_nn_indicies, mass_array, unloaded)
+        for unloaded, mass_array in trips
+        ])
+
+    energy = batch_energy(
+        geometry,
+        mass,
+        bus_speed_model=bus_speed_model,
+        charging_power_max=2e4,
+        integration=integration,
+        )
+
+    assert energy.shape == (3,)
+    assert np.allclose(energy, [
+        instance.energy_from_route(integration) for instance in instances])
+
+
+def test_compact_resampled_trace_matches_route_trajectory():
+    instance = sro.SimpleRouteTrajectory(
+        route_coords=route_coords,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=stop_coords,
+        elevation_gradient_const=0.03,
+        mass_array=[14000, 15000, 13000],
+        )
+    compact = CompactRouteTrajectory.from_trajectory(instance)
+
+    expected = instance.resampled_trace(dt=1.)
+    trace = compact.resampled_trace(dt=1.)
+
+    assert np.allclose(trace.values, expected.values)
+    assert len(list(compact.iter_resampled_trace(dt=1., chunk_size=10))) == \
+        -(-len(trace) // 10)
+
+
+def test_const_a_resampled_trace_with_stops(tmp_path):
+    """ Route 45 with stops; the constant acceleration time axis never
+        runs backwards, so both trajectories resample it
+        """
+    from ..route_elevation import base
+    from .test_elevation import write_synthetic_raster
+
+    shapefile = 'data/six_routes.shp'
+    rasterfile = write_synthetic_raster(
+        str(tmp_path / 'dtm.tif'),
+        base.read_shape(shapefile, 45),
+        nodata_band=False,
+        )
+    instance = ldm.RouteTrajectory(
+        45,
+        shapefile,
+        rasterfile,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords='random',
+        )
+    compact = CompactRouteTrajectory.from_trajectory(instance)
+
+    assert instance.route_df.is_bus_stop.sum() > 1
+    assert np.all(np.diff(compact.route_time) >= 0)
+
+    trace = instance.resampled_trace(dt=1.)
+    assert np.allclose(compact.resampled_trace(dt=1.).values, trace.values)
+    assert np.isclose(trace.time.values[-1], compact.route_time[-1], atol=1.)
+
+
+@pytest.mark.parametrize('mass_alg, mass_array', [
+    ('list_per_stop', [14000, 15000, 13000]),
+    ('list_per_segment', 13000 + 50.*np.arange(39)),
+    ('passenger_series', ([0., 20., 45.], [10, 30, 5])),
+    ])
+def test_from_trajectory_keeps_mass_alg(mass_alg, mass_array):
+    """ The compact copy has the trajectory's mass whatever the algorithm """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords=route_coords,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=stop_coords,
+        elevation_gradient_const=0.03,
+        mass_array=mass_array,
+        mass_alg=mass_alg,
+        )
+    compact = CompactRouteTrajectory.from_trajectory(instance)
+
+    assert np.array_equal(compact.mass, instance.route_df.mass.values)
+    assert np.allclose(
+        compact.power_output,
+        instance.route_df.power_output.values,
+        equal_nan=True,
+        )
+    assert np.isclose(compact.energy_from_route(), instance.energy_from_route())
@@ -2,17 +2,248 @@
     """
 from ..route_elevation import base as rbs
 from ..route_energy import longi_dynam_model as ldm
+from ..route_energy import constant_a as ca
 from ..tests import simple_route as sro
 
 import numpy as np
 import pandas as pd
 
 
-# def test_const_a_with_high_speed_limit():
-#     assert False, "Write the test dumbo"
+def _point_by_point_const_a_dynamics(route_df, a_m, v_lim):
+    """ The original O(n^2) loop implementation, kept as a reference for
+        the vectorized one (with the time steps after a stop and at the
+        first point corrected the same way).
+        """
+    # Calculate distances to next and last bus stop.
+    x_ns = np.zeros(len(route_df.index))
+    x_ls = np.zeros(len(route_df.index))
 
-# def test_const_a_with_low_speed_limit():
-#     assert False, "Write the test dumbo"
+    for i in range(len(x_ns)):
+        # set values to Nan if bus stop
+        if route_df.at[i, 'is_bus_stop']:
+            x_ns[i] = 0.
+            x_ls[i] = 0.
+            # move to next point
+            continue
+        else:
+            # Calculate 'x_ns';
+            # Iterate through remaining indicies to count distance to
+            # next stop.
+            for j in range(i+1, len(x_ns)):
+                # add distance to next point to 'x_ns'
+                x_ns[i] += route_df.at[j, 'distance_from_last_point']
+                if route_df.at[j, 'is_bus_stop']:
+                    break # done calulating 'x_ns' at this point
+                # elif not bus stop: move to nest point, add distance
 
-# def test_all_times_are_positive():
-#     assert False, "Write the test dumbo"
\ No newline at end of file
+            # Calculate 'x_ls';
+            # Iterate through previous indicies to cout distance to
+            # last stop.
+            for j in range(i, 0, -1):
+                # Inclusive start to range because distances are
+                # backward difference. Dont need to include 'j=0'
+                # because the first point has no backward difference.
+                if route_df.at[j, 'is_bus_stop']:
+                    break # done calulating x_ls at this point
+                x_ls[i] += route_df.at[j, 'distance_from_last_point']
+
+
+    # Distance to the next stop from the previous point; a stop is its
+    # own next stop, so after a stop use the stop-to-stop distance.
+    x_ns_prev = np.roll(x_ns, 1)
+    for i in range(1, len(x_ns)):
+        if route_df.at[i-1, 'is_bus_stop']:
+            x_ns_prev[i] = x_ns[i] + x_ls[i]
+
+    # Define cutoff distance for acceleration and deceleration
+    x_a = v_lim**2. / (2*a_m)
+
+    x = route_df.cum_distance.values
+    v = np.zeros(len(route_df.index))
+    a = np.zeros(len(route_df.index))
+
+    t = np.zeros(len(route_df.index))
+
+    for i in range(len(x_ns)):
+        # If close to last bus stop but far from next
+        if (
+            x_ls[i] <= x_a
+            and
+            x_ns[i] > x_a
+            and
+            not route_df.at[i, 'is_bus_stop']
+            ):
+
+            a[i] = a_m
+            v[i] = np.sqrt(2*x_ls[i]*a_m)
+
+            if i > 0:
+                # add time to clock
+                t[i] += t[i-1]
+
+                delta_t = np.sqrt(2/a_m)*(
+                    np.sqrt(x_ls[i]) - np.sqrt(x_ls[i-1])
+                    )
+                t[i] += delta_t
+
+
+        # or if close to next stop and far from last
+        elif (
+            x_ls[i] > x_a
+            and
+            x_ns[i] <= x_a
+            and
+            not route_df.at[i, 'is_bus_stop']
+            ):
+
+            a[i] = -a_m
+            v[i] = np.sqrt(2*x_ns[i]*a_m)
+
+            # add time to clock
+            t[i] += t[i-1]
+
+            delta_t = np.sqrt(2/a_m)*(
+                - np.sqrt(x_ns[i]) + np.sqrt(x_ns_prev[i])
+                )
+            t[i] += delta_t
+
+        # or far from both last and next stop, go speed limit
+        elif (
+            x_ls[i] > x_a
+            and
+            x_ns[i] > x_a
+            and
+            not route_df.at[i, 'is_bus_stop']
+            ):
+            a[i] = 0
+            v[i] = v_lim
+
+            # add time to clock
+            t[i] += t[i-1]
+
+            delta_t = (x_ls[i] - x_ls[i-1])/v_lim
+            t[i] += delta_t
+
+        # But if too close to both last and next bus stops,
+        elif (
+            x_ls[i] <= x_a
+            and
+            x_ns[i] <= x_a
+            and
+            not route_df.at[i, 'is_bus_stop']
+            ):
+
+            # add time to clock
+            t[i] += t[i-1]
+
+            if x_ls[i] < x_ns[i]:
+
+                a[i] = a_m
+                v[i] = np.sqrt(2*x_ls[i]*a_m)
+
+                delta_t = np.sqrt(2/a_m)*(
+                    np.sqrt(x_ls[i]) - np.sqrt(x_ls[i-1])
+                    )
+
+            elif x_ls[i] >= x_ns[i]:
+
+                a[i] = -a_m
+                v[i] = np.sqrt(2*x_ns[i]*a_m)
+
+                delta_t = np.sqrt(2/a_m)*(
+                    - np.sqrt(x_ns[i]) + np.sqrt(x_ns_prev[i])
+                    )
+
+            # tick tock
+            t[i] += delta_t
+
+        elif route_df.at[i, 'is_bus_stop']:
+            # still want to progress time as if decellerating
+            t[i] += t[i-1]
+
+            delta_t = np.sqrt(2/a_m)*(
+                - np.sqrt(x_ns[i]) + np.sqrt(x_ns_prev[i])
+                )
+            t[i] += delta_t
+
+        # the clock starts at the first point
+        if i == 0:
+            t[i] = 0.
+
+    return a, v, x_ls, x_ns, t
+
+
+def _random_route_df(num_pts, stop_probability, seed):
+    rng = np.random.RandomState(seed)
+    distance = rng.uniform(0.5, 40., num_pts)
+    distance[0] = np.nan
+    is_bus_stop = rng.random_sample(num_pts) < stop_probability
+    return pd.DataFrame({
+        'distance_from_last_point': distance,
+        'is_bus_stop': is_bus_stop,
+        'cum_distance': np.append(0, np.cumsum(distance[1:])),
+        })
+
+
+def test_vectorized_matches_point_by_point():
+    """ The vectorized model returns the same (a, v, x_ls, x_ns, t) as the
+        loop implementation.
+        """
+    cases = [
+        (300, 0.05, 1.0, 15.0),
+        (300, 0.3, 1.0, 15.0),
+        (200, 0.0, 0.5, 10.0),
+        (150, 0.02, 2.0, 3.0),
+        ]
+    for seed, (num_pts, stop_probability, a_m, v_lim) in enumerate(cases):
+        route_df = _random_route_df(num_pts, stop_probability, seed)
+        # Stops at either end of the route.
+        if seed % 2:
+            route_df.at[0, 'is_bus_stop'] = True
+            route_df.at[num_pts-1, 'is_bus_stop'] = True
+
+        expected = _point_by_point_const_a_dynamics(route_df, a_m, v_lim)
+        result = ca.const_a_dynamics(route_df, a_m, v_lim)
+
+        for name, res, exp in zip(['a', 'v', 'x_ls', 'x_ns', 't'], result, expected):
+            assert np.allclose(res, exp, rtol=1e-12, atol=1e-9, equal_nan=True), (
+                "'{}' differs from point-by-point model for case {}".format(name, seed)
+                )
+
+
+def test_kinematics_broadcast_over_parameters():
+    """ Arrays of 'a_m' and 'v_lim' give one row per parameter pair """
+    route_df = _random_route_df(100, 0.1, 7)
+    x_ls, x_ns = ca.stop_distances(
+        route_df.distance_from_last_point.values,
+        route_df.is_bus_stop.values,
+        )
+    a_m = np.array([0.5, 1.0, 1.5])[:, None]
+    v_lim = np.array([10., 15., 20.])[:, None]
+
+    a, v, t = ca.const_a_kinematics(x_ls, x_ns, route_df.is_bus_stop.values, a_m, v_lim)
+
+    assert a.shape == v.shape == t.shape == (3, 100)
+    for i in range(3):
+        a_i, v_i, _, _, t_i = ca.const_a_dynamics(route_df, a_m[i, 0], v_lim[i, 0])
+        assert np.array_equal(a[i], a_i) and np.array_equal(v[i], v_i)
+        assert np.array_equal(t[i], t_i)
+
+
+def test_speed_within_limit_and_zero_at_stops():
+    """ Bus never exceeds the speed limit and is stopped at stops """
+    route_df = _random_route_df(500, 0.05, 11)
+    _, v, _, _, _ = ca.const_a_dynamics(route_df, 1.0, 15.0)
+
+    assert np.all(v <= 15.0)
+    assert np.all(v[route_df.is_bus_stop.values] == 0)
+
+
+def test_time_never_runs_backwards():
+    """ Decelerating into a stop right after another one takes time """
+    for seed in range(5):
+        route_df = _random_route_df(300, 0.3, seed)
+        _, _, _, _, t = ca.const_a_dynamics(route_df, 1.0, 15.0)
+
+        assert t[0] == 0.
+        assert np.all(np.diff(t) >= 0)
@@ -0,0 +1,146 @@
+""" Tests for the elevation samplers, run against a small synthetic
+    raster covering route 45 since the real DTM is not shipped.
+"""
+import numpy as np
+import pytest
+import rasterio
+import rasterstats
+from affine import Affine
+
+from ..route_elevation import base
+from ..route_elevation import elevation
+
+shapefile = 'data/six_routes.shp'
+route_num = 45
+
+
+def write_synthetic_raster(filename, route_shp, nodata=-9999., nodata_band=True):
+    """ Write a tiled GeoTIFF of smooth 'elevation' around the route,
+        optionally with a band of nodata cells across it.
+        """
+    west, south, east, north = route_shp.total_bounds
+    res = 0.0005
+    width = int((east - west) / res) + 20
+    height = int((north - south) / res) + 20
+    transform = Affine(res, 0, west - 10*res, 0, -res, north + 10*res)
+
+    rows, cols = np.mgrid[0:height, 0:width]
+    data = (100 + 30*np.sin(rows/7.) + 20*np.cos(cols/5.)).astype('float32')
+    if nodata_band:
+        data[height//2:height//2 + 3, :] = nodata
+
+    with rasterio.open(
+        filename, 'w', driver='GTiff', height=height, width=width,
+        count=1, dtype='float32', crs='EPSG:4326', transform=transform,
+        nodata=nodata, tiled=True, blockxsize=16, blockysize=16,
+        ) as dst:
+        dst.write(data, 1)
+
+    return filename
+
+
+@pytest.fixture(scope='module')
+def route_shp():
+    return base.read_shape(shapefile, route_num)
+
+
+@pytest.fixture(scope='module')
+def rasterfile(tmp_path_factory, route_shp):
+    filename = str(tmp_path_factory.mktemp('raster') / 'synthetic_dtm.tif')
+    return write_synthetic_raster(filename, route_shp)
+
+
+@pytest.fixture(scope='module')
+def complete_rasterfile(tmp_path_factory, route_shp):
+    filename = str(tmp_path_factory.mktemp('raster') / 'complete_dtm.tif')
+    return write_synthetic_raster(filename, route_shp, nodata_band=False)
+
+
+def test_sampler_matches_rasterstats(route_shp, rasterfile):
+    """Test that bilinear sampling gives the same values as rasterstats"""
+    expected = np.asarray(
+        rasterstats.point_query(route_shp, rasterfile),
+        dtype=float,
+        )
+
+    with elevation.ElevationSampler(rasterfile) as sampler:
+        sampled = np.asarray(sampler.point_query(route_shp))
+
+    assert sampled.shape == expected.shape, 'Sampler output shape differs from rasterstats'
+    assert np.allclose(sampled, expected, equal_nan=True), 'Sampled elevations differ from rasterstats'
+
+
+def test_sampler_nearest_matches_rasterstats(route_shp, rasterfile):
+    """Test that nearest sampling gives the same values as rasterstats"""
+    expected = np.asarray(
+        rasterstats.point_query(route_shp, rasterfile, interpolate='nearest'),
+        dtype=float,
+        )
+
+    with elevation.ElevationSampler(rasterfile, interpolate='nearest') as sampler:
+        sampled = np.asarray(sampler.point_query(route_shp))
+
+    assert np.allclose(sampled, expected, equal_nan=True), 'Nearest elevations differ from rasterstats'
+
+
+def test_gradient_accepts_sampler(route_shp, complete_rasterfile):
+    """Test that base.gradient gives the same result with a sampler or a filename"""
+    with elevation.ElevationSampler(complete_rasterfile) as sampler:
+        from_sampler = base.gradient(route_shp, sampler)
+    from_file = base.gradient(route_shp, complete_rasterfile)
+
+    for a, b in zip(from_sampler, from_file):
+        assert np.allclose(a, b, equal_nan=True), 'gradient output changed with sampler'
+
+
+def test_block_cache_reuse(route_shp, rasterfile):
+    """Test that a second query is served entirely from the block cache"""
+    coords = base.extract_point_array(route_shp)
+
+    with elevation.ElevationSampler(rasterfile) as sampler:
+        first = sampler.sample(coords)
+        misses = sampler.cache_misses
+        second = sampler.sample_routes([coords, coords[::-1]])
+
+        assert sampler.cache_misses == misses, 'Cached blocks were read again'
+    assert np.allclose(second[0], first, equal_nan=True)
+    assert np.allclose(second[1], first[::-1], equal_nan=True)
+
+
+def test_points_outside_raster_are_nan(rasterfile):
+    """Test that points beyond the raster extent have no data"""
+    with elevation.ElevationSampler(rasterfile) as sampler:
+        values = sampler.sample([(0., 0.), (-180., 89.)])
+
+    assert np.all(np.isnan(values))
+
+
+def test_memmap_sampler_matches_raster(route_shp, rasterfile, tmp_path):
+    """Test that the memory-mapped grid samples the same as the GeoTIFF"""
+    grid_path = elevation.convert_to_memmap(
+        rasterfile,
+        str(tmp_path / 'synthetic_dtm'),
+        rows_per_chunk=7,
+        )
+
+    for interpolate in ['bilinear', 'nearest']:
+        with elevation.ElevationSampler(rasterfile, interpolate=interpolate) as sampler:
+            expected = np.asarray(sampler.point_query(route_shp))
+        with elevation.MemmapElevationSampler(grid_path, interpolate=interpolate) as sampler:
+            sampled = np.asarray(sampler.point_query(route_shp))
+
+        assert np.array_equal(sampled, expected, equal_nan=True), (
+            'Memmap {} sampling differs from raster'.format(interpolate)
+            )
+
+
+def test_memmap_sampler_pickles_by_path(rasterfile, tmp_path):
+    """Test that a pickled sampler reopens the same grid"""
+    import pickle
+
+    grid_path = elevation.convert_to_memmap(rasterfile, str(tmp_path / 'grid.npy'))
+    sampler = elevation.MemmapElevationSampler(grid_path)
+    clone = pickle.loads(pickle.dumps(sampler))
+
+    assert isinstance(clone.grid, np.memmap)
+    assert clone.transform == sampler.transform
@@ -0,0 +1,118 @@
+""" Tests for the on-disk route geometry cache """
+import os
+
+import numpy as np
+import pytest
+
+from ..route_elevation import base
+from ..route_elevation import elevation
+from ..route_elevation import geometry_cache
+from ..route_elevation import route_store
+from ..route_energy import longi_dynam_model as ldm
+from .test_elevation import write_synthetic_raster
+
+shapefile = 'data/six_routes.shp'
+route_num = 45
+
+
+@pytest.fixture(scope='module')
+def rasterfile(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('raster') / 'synthetic_dtm.tif')
+    route_shp = base.read_shape(shapefile, route_num)
+    return write_synthetic_raster(filename, route_shp, nodata_band=False)
+
+
+def test_cached_trajectory_matches_uncached(tmp_path, rasterfile):
+    """Test that a RouteTrajectory built from the cache matches one built
+    from the files, on both the miss and the hit"""
+    cache = geometry_cache.GeometryCache(str(tmp_path))
+    uncached = ldm.RouteTrajectory(route_num, shapefile, rasterfile)
+
+    for _ in range(2):
+        cached = ldm.RouteTrajectory(
+            route_num, shapefile, rasterfile, geometry_cache=cache)
+        for column in ['gradient', 'distance_from_last_point', 'elevation',
+            'cum_distance', 'power_output']:
+            assert np.allclose(
+                cached.route_df[column].values.astype(float),
+                uncached.route_df[column].values.astype(float),
+                equal_nan=True,
+                ), column
+        assert cached.route_df.geometry.equals(uncached.route_df.geometry)
+
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_hit_skips_parsing_and_sampling(tmp_path, rasterfile, monkeypatch):
+    """Test that a cache hit reads neither the shapefile nor the raster"""
+    cache = geometry_cache.GeometryCache(str(tmp_path))
+    cache.route_arrays(route_num, shapefile, rasterfile)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('route rebuilt on a cache hit')
+    monkeypatch.setattr(base, 'read_shape', fail)
+    monkeypatch.setattr(base, 'gradient', fail)
+
+    arrays = geometry_cache.GeometryCache(str(tmp_path)).route_arrays(
+        route_num, shapefile, rasterfile)
+    assert arrays['coordinates'].shape == (208, 2)
+
+
+def test_key_follows_contents(tmp_path, rasterfile):
+    """Test that the key changes with the raster contents, route and
+    sampler settings, but not with how the inputs are passed"""
+    cache = geometry_cache.GeometryCache(str(tmp_path / 'cache'))
+    key = cache.key(route_num, shapefile, rasterfile)
+
+    assert cache.key(7, shapefile, rasterfile) != key
+
+    store = route_store.RouteStore.from_shapefile(shapefile)
+    assert cache.key(route_num, store, rasterfile) == key
+
+    with elevation.ElevationSampler(rasterfile) as sampler:
+        sampler_key = cache.key(route_num, shapefile, sampler)
+    with elevation.ElevationSampler(rasterfile, interpolate='nearest') as sampler:
+        assert cache.key(route_num, shapefile, sampler) != sampler_key
+
+    # Same bytes under another name hash the same; different bytes do not
+    copy = str(tmp_path / 'copy.tif')
+    with open(rasterfile, 'rb') as src, open(copy, 'wb') as dst:
+        dst.write(src.read())
+    assert cache.key(route_num, shapefile, copy) == key
+
+    other = write_synthetic_raster(
+        str(tmp_path / 'other.tif'), store.load_route(route_num))
+    assert cache.key(route_num, shapefile, other) != key
+
+
+def test_eviction_keeps_cache_under_max_bytes(tmp_path, rasterfile):
+    """Test that least recently used entries are evicted"""
+    cache = geometry_cache.GeometryCache(str(tmp_path))
+    cache.route_arrays(route_num, shapefile, rasterfile)
+    entry_size = cache.nbytes
+
+    cache.max_bytes = int(2.5 * entry_size)
+    arrays = cache.load(cache.key(route_num, shapefile, rasterfile))
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.save(key, arrays)
+        # make the order of use unambiguous
+        os.utime(cache._path(key), (1e9 + i, 1e9 + i))
+
+    assert len(cache.entries()) <= 2
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.load('c') is not None
+
+
+def test_geometry_from_cache(tmp_path, rasterfile):
+    """Test that RouteGeometry.from_files reads the same geometry from
+    the cache"""
+    from ..route_energy.route_geometry import RouteGeometry
+
+    cache = geometry_cache.GeometryCache(str(tmp_path))
+    direct = RouteGeometry.from_files(route_num, shapefile, rasterfile)
+    cached = RouteGeometry.from_files(
+        route_num, shapefile, rasterfile, geometry_cache=cache)
+
+    assert np.array_equal(cached.coordinates, direct.coordinates)
+    assert np.allclose(cached.gradient, direct.gradient)
+    assert np.allclose(cached.elevation, direct.elevation)
@@ -66,3 +66,45 @@ def test_euclidean_distance():
         )
 
     assert dist == np.linalg.norm(random_point), "say something"
+
+
+def test_find_knn_matches_brute_force():
+    """ KD-tree neighbors agree with a brute force search over all pairs """
+    rng = np.random.RandomState(42)
+    candidate_pts = rng.random_sample((500, 2))
+    test_pts = rng.random_sample((40, 2))
+
+    nn_indicies, nn = knn.find_knn(3, candidate_pts, test_pts)
+
+    brute_force = np.argsort(
+        np.linalg.norm(test_pts[:, None, :] - candidate_pts[None, :, :], axis=-1),
+        axis=1,
+        )[:, :3]
+
+    assert nn_indicies.shape == (40, 3)
+    assert np.array_equal(nn_indicies, brute_force)
+    assert np.array_equal(nn, candidate_pts[brute_force])
+
+
+def test_find_knn_reuses_index():
+    """ A prebuilt index gives the same neighbors as building one """
+    route_coords = [(0, i) for i in range(10)]
+    index = knn.NeighborIndex(route_coords)
+    stops = [(0.542, 6.05), (3.542, 1.98)]
+
+    nn_indicies, _ = knn.find_knn(1, route_coords, stops, index=index)
+
+    assert list(nn_indicies.ravel()) == [6, 2]
+
+
+def test_haversine_metric():
+    """ Haversine distances are great circle distances in meters """
+    seattle = (-122.3321, 47.6062)
+    candidates = [(-122.3035, 47.6553), (-122.2015, 47.6101), seattle]
+    index = knn.NeighborIndex(candidates, metric='haversine')
+
+    indicies, distances = index.query([(-122.3030, 47.6550)], k=1)
+
+    assert indicies[0, 0] == 0
+    # about 45 m between the two points near UW
+    assert 30 < distances[0, 0] < 60
@@ -6,6 +6,7 @@ from ..tests import simple_route as sro
 
 import numpy as np
 import pandas as pd
+import pytest
 
 # # Load files for tests.
 # shapefile_name = '../data/six_routes.shp'
@@ -197,3 +198,299 @@ class TestRouteTrajectory(object):
     # - heavy bus vs light bus
     #
 
+
+
+def _looped_mass_from_stops(num_pts, stop_nn_indicies, mass_array, unloaded_bus_mass):
+    """ The original per point fill of calculate_mass """
+    full_mass_column = np.full(num_pts, np.nan)
+    for i in range(len(mass_array)):
+        full_mass_column[stop_nn_indicies[i]] = mass_array[i]
+    full_mass_column[0] = unloaded_bus_mass
+    full_mass_column[-1] = unloaded_bus_mass
+    for i in range(1, num_pts):
+        if np.isnan(full_mass_column[i]):
+            full_mass_column[i] = full_mass_column[i-1]
+    return full_mass_column
+
+
+def test_mass_from_stops_matches_loop():
+    """ Vectorized fill matches the point by point fill, for one trip and
+        for a (trips x stops) array
+        """
+    rng = np.random.default_rng(3)
+    num_pts = 500
+    stop_idx = np.sort(rng.choice(np.arange(1, num_pts - 1), 30, replace=False))
+    trips = rng.uniform(13000, 20000, (4, 30))
+
+    mass = ldm.mass_from_stops(num_pts, stop_idx, trips, 12927)
+
+    assert mass.shape == (4, num_pts)
+    for trip, trip_mass in zip(trips, mass):
+        assert np.array_equal(
+            trip_mass,
+            _looped_mass_from_stops(num_pts, stop_idx, trip, 12927),
+            )
+        assert np.array_equal(
+            ldm.mass_from_stops(num_pts, stop_idx, trip, 12927),
+            trip_mass,
+            )
+
+
+def test_calculate_mass_per_stop_in_trajectory():
+    instance = sro.SimpleRouteTrajectory(
+        route_coords='default',
+        bus_speed_model='stopped_at_stops__15mph_between',
+        stop_coords=[(0, 2), (0, 6)],
+        mass_array=[14000, 15000],
+        )
+
+    assert np.array_equal(
+        instance.route_df.mass.values,
+        [12927, 12927, 14000, 14000, 14000, 14000, 15000, 15000, 15000, 12927],
+        )
+
+
+def test_route_point_index_follows_route_points():
+    """ Stops are matched against the current route points, even when a
+        new route has as many points as the old one
+        """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords='default',
+        bus_speed_model='stopped_at_stops__15mph_between',
+        stop_coords=[(0, 2), (0, 6)],
+        )
+    index = instance.route_point_index
+
+    same_df = instance.route_df[['coordinates']].copy()
+    instance._add_stops_to_df([(0, 3)], same_df)
+    assert instance.route_point_index is index
+
+    moved_df = same_df.assign(
+        coordinates=[(x, 9 - y) for x, y in same_df.coordinates])
+    instance._add_stops_to_df([(0, 3)], moved_df)
+    assert instance.route_point_index is not index
+    assert list(instance.stop_nn_indicies.ravel()) == [6]
+
+
+def test_mass_validation_raises():
+    with pytest.raises(ldm.IllegalArgumentError):
+        ldm.mass_from_stops(10, [2, 6], [14000], 12927)
+    with pytest.raises(ldm.IllegalArgumentError):
+        ldm.mass_from_stops(10, [2, 6], [14000, 12000], 12927)
+    with pytest.raises(ldm.IllegalArgumentError):
+        ldm.mass_from_segments(10, np.full(10, 14000.), 12927)
+    with pytest.raises(ldm.IllegalArgumentError):
+        ldm.mass_from_passenger_series(np.arange(5.), [0., 0.], [1, 2], 12927)
+    with pytest.raises(ldm.IllegalArgumentError):
+        sro.SimpleRouteTrajectory(
+            route_coords='default',
+            stop_coords=None,
+            mass_array=[14000, 15000],
+            )
+
+
+def test_mass_per_segment_and_passenger_series():
+    segments = np.arange(9) * 100. + 13000
+    assert np.array_equal(
+        ldm.mass_from_segments(10, segments, 12927),
+        np.append(12927, segments),
+        )
+
+    route_time = np.array([0., 5., 10., 15., 20., 25.])
+    passengers = pd.Series([10, 30, 5], index=[0., 12., 20.])
+    mass = ldm.mass_from_passenger_series(
+        route_time,
+        passengers.index.values,
+        passengers.values,
+        12927,
+        passenger_mass=70.,
+        )
+    assert np.array_equal(
+        mass,
+        12927 + 70.*np.array([10, 10, 10, 30, 5, 5]),
+        )
+
+
+def test_passenger_series_in_trajectory():
+    """ 'passenger_series' reads counts at the route times """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords='default',
+        bus_speed_model='constant_15mph',
+        stop_coords=None,
+        )
+    instance.mass_alg = 'passenger_series'
+    instance.mass_array = pd.Series([0, 20], index=[0., 30.])
+
+    mass = instance.calculate_mass(
+        alg='passenger_series',
+        route_df=instance.route_df,
+        )
+
+    route_time = np.append(0, np.cumsum(instance.route_df.delta_time.values[1:]))
+    assert np.array_equal(
+        mass,
+        np.where(route_time >= 30, 12927 + 20*ldm.PASSENGER_MASS, 12927),
+        )
+
+
+def test_regen_clamp_and_cumulative_energy():
+    """ Regen is capped at 'charging_power_max', the cumulative energy
+        ends at energy_from_route, and traction + regen = net
+        """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords=[(0, 20.*i) for i in range(40)],
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=[(0, 100.), (0, 400.), (0, 650.)],
+        elevation_gradient_const=-0.05,
+        charging_power_max=2e4,
+        )
+    rdf = instance.route_df
+
+    looped = np.copy(instance.raw_batt_power_exert)
+    for i in range(len(looped)):
+        if looped[i] < -instance.charging_power_max:
+            looped[i] = -instance.charging_power_max
+
+    assert np.array_equal(rdf.power_output.values, looped)
+    assert np.any(rdf.power_output.values == -2e4)
+    assert np.isclose(rdf.cum_energy.values[-1], instance.energy_from_route())
+    assert instance.regen_energy < 0 < instance.traction_energy
+    assert np.isclose(
+        instance.traction_energy + instance.regen_energy,
+        instance.energy_from_route(),
+        )
+
+
+def test_trapezoid_integration():
+    """ Trapezoid rule is exact for power linear in time, the rectangle
+        rule is not
+        """
+    delta_time = np.append(0, np.full(10, 2.))
+    power = np.cumsum(delta_time) * 3.
+    exact = 3. * 20.**2 / 2
+
+    trapezoid, traction, regen = ldm.energy_totals(power, delta_time, 'trapezoid')
+    rectangle, _, _ = ldm.energy_totals(power, delta_time, 'rectangle')
+
+    assert np.isclose(trapezoid, exact)
+    assert not np.isclose(rectangle, exact)
+    assert (traction, regen) == (trapezoid, 0.)
+    assert np.isclose(
+        np.cumsum(ldm.energy_increments(power, delta_time, 'trapezoid'))[-1],
+        exact,
+        )
+
+    with pytest.raises(ldm.IllegalArgumentError):
+        ldm.energy_increments(power, delta_time, 'simpson')
+
+
+@pytest.mark.parametrize('integration', ['rectangle', 'trapezoid'])
+def test_energy_totals_integrate_once(integration, monkeypatch):
+    """ One energy_increments call; traction and regen add up to net
+        even where the power changes sign within a segment
+        """
+    delta_time = np.append(0, np.full(6, 2.))
+    power = np.array([np.nan, 5., -3., 4., -6., -1., 2.])
+
+    calls = []
+    increments = ldm.energy_increments
+
+    def counting_increments(*args):
+        calls.append(args)
+        return increments(*args)
+    monkeypatch.setattr(ldm, 'energy_increments', counting_increments)
+
+    net, traction, regen = ldm.energy_totals(power, delta_time, integration)
+
+    assert len(calls) == 1
+    assert regen < 0 < traction
+    assert np.isclose(traction + regen, net)
+    assert np.isclose(net, np.sum(increments(power, delta_time, integration)))
+
+
+def test_resample_trace():
+    """ Linear columns interpolate, held columns step, chunks join up """
+    route_time = np.array([0., 1.5, 1.5, 4., 7.])
+    columns = {
+        'power_output': [np.nan, 3., 5., 10., 4.],
+        'mass': [100., 200., 300., 300., 100.],
+        }
+
+    trace = ldm.resample_trace(route_time, columns, dt=0.5)
+    chunks = list(ldm.iter_resampled_trace(route_time, columns, dt=0.5, chunk_size=4))
+
+    assert np.allclose(trace.time, np.arange(0, 7.5, 0.5))
+    assert np.allclose(trace.power_output[:4], [0., 1., 2., 5.])
+    assert np.isclose(trace.power_output[5], 7.)
+    assert np.isclose(trace.power_output[8], 10.)
+    assert list(trace.mass[:5]) == [100., 100., 100., 300., 300.]
+    assert trace.mass.values[-1] == 100.
+    assert [len(chunk) for chunk in chunks] == [4, 4, 4, 3]
+    assert pd.concat(chunks, ignore_index=True).equals(trace)
+
+    with pytest.raises(ldm.IllegalArgumentError):
+        ldm.resample_trace(route_time[::-1], columns)
+
+
+def test_route_trajectory_resampled_trace():
+    instance = sro.SimpleRouteTrajectory(
+        route_coords=[(0, 20.*i) for i in range(40)],
+        stop_coords=[(0.5, 100.), (0, 400.), (1, 650.)],
+        elevation_gradient_const=0.02,
+        mass_array=[14000, 15000, 13000],
+        )
+    rdf = instance.route_df
+    route_time = np.append(0, np.cumsum(rdf.delta_time.values[1:]))
+
+    trace = instance.resampled_trace(dt=0.1)
+
+    assert list(trace.columns) == ['time'] + list(ldm.TRACE_COLUMNS)
+    assert np.isclose(trace.time.values[-1], route_time[-1], atol=0.1)
+    assert np.allclose(trace.gradient, 0.02)
+    assert set(trace.mass) <= set(rdf.mass)
+    # Energy of the 10 Hz trace is close to the route energy
+    assert np.isclose(
+        np.sum(trace.power_output.values[1:]) * 0.1,
+        ldm.energy_totals(rdf.power_output.values, rdf.delta_time.values,
+            'trapezoid')[0],
+        rtol=0.02,
+        )
+
+    chunks = instance.iter_resampled_trace(dt=0.1, chunk_size=100)
+    assert pd.concat(chunks, ignore_index=True).equals(trace)
+
+
+def test_finite_diff_time_is_distance_over_speed():
+    """ At a constant 15 mph the trace ends after distance / speed """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords='default',
+        bus_speed_model='constant_15mph',
+        )
+    rdf = instance.route_df
+
+    trace = instance.resampled_trace(dt=0.01)
+
+    assert np.allclose(rdf.delta_time.values[1:], 1 / 6.7056)
+    assert np.isclose(
+        trace.time.values[-1], rdf.cum_distance.values[-1] / 6.7056, atol=0.01)
+
+
+def test_stopped_model_time_steps():
+    """ Segments from and to a stop take distance over half the speed,
+        segments between two stops take no time
+        """
+    instance = sro.SimpleRouteTrajectory(
+        route_coords='default',
+        bus_speed_model='stopped_at_stops__15mph_between',
+        stop_coords=[(0, 4), (0, 5)],
+        )
+    rdf = instance.route_df
+
+    half = 1 / (6.7056 / 2)
+    full = 1 / 6.7056
+    assert np.allclose(
+        rdf.delta_time.values[1:],
+        [half, full, full, half, 0., half, full, full, half],
+        )
+    assert np.isclose(rdf.acceleration.values[5], 0.)
+    assert np.isclose(rdf.acceleration.values[1], 6.7056 / half)
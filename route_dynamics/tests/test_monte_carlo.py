@@ -0,0 +1,89 @@
+""" Tests for the Monte Carlo route energy """
+from ..route_energy import longi_dynam_model as ldm
+from ..route_energy import monte_carlo as mc
+from ..route_energy.route_geometry import RouteGeometry
+from ..tests import simple_route as sro
+
+import numpy as np
+import pytest
+
+payload = [1000., 2500., 800.]
+
+
+@pytest.fixture(scope='module')
+def geometry():
+    return RouteGeometry.from_trajectory(sro.simple_const_a_instance())
+
+
+def test_samples_match_route_trajectory(geometry):
+    """ Each sample's energy equals a RouteTrajectory with those inputs """
+    samples = mc.draw_samples(np.random.default_rng(3), 4)
+
+    energy = mc.sample_energy(
+        geometry, samples, 12927, payload=payload, charging_power_max=5e4)
+
+    for i, sample in samples.iterrows():
+        instance = sro.simple_const_a_instance(
+            a_m=sample.a_m,
+            mass_array=12927 + sample.load_factor * np.array(payload),
+            unloaded_bus_mass=12927,
+            charging_power_max=5e4,
+            )
+        rdf = instance.route_df
+        grav_force, roll_fric, aero_drag, inertia = ldm.longitudinal_forces(
+            rdf.velocity.values,
+            rdf.acceleration.values,
+            rdf.gradient.values,
+            rdf.mass.values,
+            fric_coeff=sample.fric_coeff,
+            air_density=sample.air_density,
+            v_wind=sample.v_wind,
+            )
+        power = np.maximum(
+            (inertia - grav_force - roll_fric - aero_drag) * rdf.velocity.values,
+            -5e4,
+            )
+
+        assert np.isclose(energy[i], np.sum(power[1:] * rdf.delta_time.values[1:]))
+
+
+def test_chunking_and_processes_give_same_energies(geometry):
+    single = mc.monte_carlo_energy(geometry, 500, payload=payload, seed=42)
+    chunked = mc.monte_carlo_energy(
+        geometry, 500, payload=payload, seed=42, max_chunk_elements=40*64)
+    pooled = mc.monte_carlo_energy(
+        geometry, 500, payload=payload, seed=42, max_chunk_elements=40*64,
+        processes=2)
+
+    assert len(single.energy) == len(single.samples) == 500
+    assert np.array_equal(chunked.energy, pooled.energy)
+    assert chunked.samples.equals(pooled.samples)
+    # Different chunking draws different (but equally distributed) samples
+    assert abs(chunked.percentiles[50] / single.percentiles[50] - 1) < 0.05
+
+
+def test_percentiles(geometry):
+    result = mc.monte_carlo_energy(
+        sro.simple_const_a_instance(), 200, seed=0, percentiles=(10, 50, 90))
+
+    assert list(result.percentiles.index) == [10, 50, 90]
+    assert np.isclose(result.percentiles[50], np.median(result.energy))
+    assert result.percentiles.is_monotonic_increasing
+
+
+def test_fixed_inputs_reproduce_nominal_energy(geometry):
+    """ Inputs missing from 'distributions' take the model defaults """
+    instance = sro.simple_const_a_instance(
+        mass_array=12927 + np.array(payload), unloaded_bus_mass=12927)
+
+    result = mc.monte_carlo_energy(
+        geometry, 3, payload=payload, distributions={}, seed=0)
+
+    assert np.allclose(result.energy, instance.energy_from_route())
+    assert list(result.samples.columns) == []
+
+
+def test_num_samples_validated(geometry):
+    for num_samples in [0, -5]:
+        with pytest.raises(ldm.IllegalArgumentError):
+            mc.monte_carlo_energy(geometry, num_samples)
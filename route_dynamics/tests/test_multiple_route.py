@@ -3,12 +3,15 @@
 """
 import matplotlib
 import matplotlib.pyplot as plt
+import numpy as np
+import pytest
 from os import path
 import sys
 sys.path.append(path.abspath('..'))
 
 from ..route_elevation import base
 from ..route_elevation import multiple_route
+from ..tests.test_elevation import write_synthetic_raster
 
 shapefile = '../data/six_routes.shp'
 rasterfile = '../data/seattle_dtm.tif'
@@ -27,3 +30,112 @@ rasterfile = '../data/seattle_dtm.tif'
 
 
 #     return
+
+
+@pytest.fixture(scope='module')
+def six_route_raster(tmp_path_factory):
+    """ Synthetic raster covering all six routes in 'data/six_routes.shp' """
+    import geopandas as gpd
+    filename = str(tmp_path_factory.mktemp('raster') / 'six_routes_dtm.tif')
+    return write_synthetic_raster(
+        filename,
+        gpd.read_file('data/six_routes.shp'),
+        nodata_band=False,
+        )
+
+
+def test_routes_metrics_parallel_matches_serial(six_route_raster):
+    """
+       Test that the process pool returns the serial results in input order
+    """
+    route_list = [75, 45, 7, 40]
+    data_shapefile = 'data/six_routes.shp'
+
+    serial = multiple_route.routes_metrics(route_list, data_shapefile, six_route_raster)
+    parallel = multiple_route.routes_metrics(route_list, data_shapefile, six_route_raster, n_workers=2)
+
+    assert list(parallel['Bus Num']) == route_list
+    assert parallel['Error'].isnull().all()
+    assert np.allclose(
+        parallel[['M1', 'M2', 'M3', 'M4']].values,
+        serial[['M1', 'M2', 'M3', 'M4']].values,
+        )
+
+
+@pytest.mark.parametrize('n_workers', [None, 2])
+def test_routes_metrics_reports_errors_per_route(six_route_raster, n_workers):
+    """
+       Test that a failing route is reported without stopping the batch,
+       the same way serially and with worker processes
+    """
+    with pytest.warns(UserWarning):
+        data = multiple_route.routes_metrics(
+            [45, 9999, 7],
+            'data/six_routes.shp',
+            six_route_raster,
+            n_workers=n_workers,
+            )
+
+    assert data['Error'].isnull().tolist() == [True, False, True]
+    assert data.loc[1, 'Error'].startswith('KeyError')
+    assert np.isnan(data.loc[1, 'M1'])
+    assert not np.isnan(data.loc[2, 'M1'])
+
+
+def test_routes_metrics_workers_share_parent_store(six_route_raster, monkeypatch):
+    """
+       Test that the shapefile is parsed once, by the parent, and the
+       workers open the store from its directory
+    """
+    parsed = []
+    split = multiple_route.RouteStore._split
+
+    def counting_split(shapefile):
+        parsed.append(shapefile)
+        return split(shapefile)
+
+    monkeypatch.setattr(
+        multiple_route.RouteStore, '_split', staticmethod(counting_split))
+
+    initargs = []
+    executor = multiple_route.ProcessPoolExecutor
+
+    def recording_executor(*args, **kwargs):
+        initargs.append(kwargs['initargs'])
+        return executor(*args, **kwargs)
+
+    monkeypatch.setattr(multiple_route, 'ProcessPoolExecutor', recording_executor)
+
+    data = multiple_route.routes_metrics(
+        [45, 7], 'data/six_routes.shp', six_route_raster, n_workers=2)
+
+    assert data['Error'].isnull().all()
+    assert len(parsed) == 1
+    assert isinstance(initargs[0][0], str)
+
+
+def test_routes_metrics_serial_is_reentrant(six_route_raster):
+    """
+       Test that serial runs leave the worker globals alone and can run
+       concurrently
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    data_shapefile = 'data/six_routes.shp'
+
+    expected = multiple_route.routes_metrics([45, 7], data_shapefile, six_route_raster)
+    assert multiple_route._worker_routes is None
+    assert multiple_route._worker_sampler is None
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(
+            lambda routes: multiple_route.routes_metrics(
+                routes, data_shapefile, six_route_raster),
+            [[45, 7]] * 8,
+            ))
+
+    for data in results:
+        assert np.allclose(
+            data[['M1', 'M2', 'M3', 'M4']].values,
+            expected[['M1', 'M2', 'M3', 'M4']].values,
+            )
@@ -0,0 +1,152 @@
+""" Tests for the route geometry / parameter sweep batch energy """
+from ..route_elevation import base
+from ..route_energy import longi_dynam_model as ldm
+from ..route_energy import parameter_sweep as ps
+from ..route_energy.route_geometry import RouteGeometry
+from ..tests import simple_route as sro
+from ..tests.test_elevation import write_synthetic_raster
+
+import numpy as np
+import pytest
+
+shapefile = 'data/six_routes.shp'
+
+
+def test_sweep_matches_route_trajectory():
+    """ Every grid point equals the energy of the matching RouteTrajectory """
+    a_m = [0.5, 1.2]
+    v_lim = [8., 15.]
+    unloaded_bus_mass = [12000, 12927]
+    mass_arrays = [[14000, 15000, 13000], [13000, 13000, 13000]]
+    charging_power_max = [0., 5e4]
+
+    geometry = RouteGeometry.from_trajectory(sro.simple_const_a_instance())
+
+    energy = ps.parameter_sweep(
+        geometry,
+        a_m=a_m,
+        v_lim=v_lim,
+        unloaded_bus_mass=unloaded_bus_mass,
+        mass_arrays=mass_arrays,
+        charging_power_max=charging_power_max,
+        max_chunk_elements=100,
+        )
+
+    assert energy.shape == (2, 2, 2, 2, 2)
+
+    for idx in [(0, 0, 0, 0, 0), (1, 0, 1, 1, 1), (0, 1, 1, 0, 1), (1, 1, 0, 1, 0)]:
+        i_a, i_v, i_u, i_m, i_c = idx
+        instance = sro.simple_const_a_instance(
+            a_m=a_m[i_a],
+            v_lim=v_lim[i_v],
+            unloaded_bus_mass=unloaded_bus_mass[i_u],
+            mass_array=mass_arrays[i_m],
+            charging_power_max=charging_power_max[i_c],
+            )
+        assert np.isclose(energy[idx], instance.energy_from_route(), rtol=1e-12)
+
+
+def test_unloaded_sweep_matches_default_mass():
+    """ No mass arrays means the unloaded bus everywhere """
+    instance = sro.simple_const_a_instance()
+    geometry = RouteGeometry.from_trajectory(instance)
+
+    energy = ps.parameter_sweep(geometry)
+
+    assert energy.shape == (1, 1, 1, 1, 1)
+    assert np.isclose(energy.item(), instance.energy_from_route(), rtol=1e-12)
+
+
+def test_sweep_integration():
+    """ The sweep integrates the power as RouteTrajectory was asked to """
+    instance = sro.simple_const_a_instance()
+    geometry = RouteGeometry.from_trajectory(instance)
+
+    energy = ps.parameter_sweep(geometry, energy_integration='trapezoid')
+
+    assert np.isclose(
+        energy.item(), instance.energy_from_route('trapezoid'), rtol=1e-12)
+    assert not np.isclose(energy.item(), ps.parameter_sweep(geometry).item())
+
+
+def test_mass_array_length_checked():
+    geometry = RouteGeometry.from_trajectory(sro.simple_const_a_instance())
+
+    with pytest.raises(ldm.IllegalArgumentError):
+        ps.parameter_sweep(geometry, mass_arrays=[[14000, 15000]])
+
+
+def test_geometry_from_files_matches_route_trajectory(tmp_path):
+    """ Geometry built straight from the files matches RouteTrajectory """
+    rasterfile = write_synthetic_raster(
+        str(tmp_path / 'dtm.tif'),
+        base.read_shape(shapefile, 45),
+        nodata_band=False,
+        )
+    route_points = base.extract_point_array(base.read_shape(shapefile, 45))
+    stops = [tuple(route_points[i]) for i in [10, 60, 150]]
+
+    instance = ldm.RouteTrajectory(
+        45,
+        shapefile,
+        rasterfile,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=stops,
+        )
+    geometry = RouteGeometry.from_files(45, shapefile, rasterfile, stop_coords=stops)
+
+    assert np.array_equal(geometry.is_bus_stop, instance.route_df.is_bus_stop.values)
+    assert np.allclose(geometry.elevation, instance.route_df.elevation.values)
+    assert np.isclose(
+        ps.parameter_sweep(geometry).item(),
+        instance.energy_from_route(),
+        rtol=1e-12,
+        )
+
+
+def write_reversed_route(filename, route_num):
+    """ Shapefile of one route of six_routes.shp drawn the other way """
+    route_shp = base.read_shape(shapefile, route_num).copy()
+    route_shp['geometry'] = route_shp.geometry.reverse()
+    route_shp.to_file(filename)
+    return filename
+
+
+def test_reversed_geometry_matches_reversed_route(tmp_path):
+    """ Reversing the arrays gives the geometry of the route read the
+        other way, and reversing twice gives the route back
+        """
+    rasterfile = write_synthetic_raster(
+        str(tmp_path / 'dtm.tif'),
+        base.read_shape(shapefile, 45),
+        nodata_band=False,
+        )
+    reversed_shp = write_reversed_route(str(tmp_path / 'reversed.shp'), 45)
+    route_points = base.extract_point_array(base.read_shape(shapefile, 45))
+    stops = [tuple(route_points[i]) for i in [10, 60, 150]]
+
+    geometry = RouteGeometry.from_files(45, shapefile, rasterfile)
+    expected = RouteGeometry.from_files(45, reversed_shp, rasterfile, stop_coords=stops)
+    reverse = geometry.reversed().with_stops(stops)
+
+    assert np.array_equal(reverse.coordinates, expected.coordinates)
+    assert np.allclose(reverse.elevation, expected.elevation)
+    assert np.allclose(reverse.gradient, expected.gradient)
+    assert np.allclose(
+        reverse.distance_from_last_point,
+        expected.distance_from_last_point,
+        equal_nan=True,
+        )
+    assert np.allclose(reverse.cum_distance, expected.cum_distance)
+    assert np.array_equal(reverse.stop_nn_indicies, expected.stop_nn_indicies)
+    assert np.isclose(
+        ps.parameter_sweep(reverse).item(),
+        ps.parameter_sweep(expected).item(),
+        )
+
+    twice = geometry.reversed().reversed()
+    assert np.array_equal(twice.gradient, geometry.gradient)
+    assert np.array_equal(
+        twice.with_stops(stops).stop_nn_indicies,
+        geometry.with_stops(stops).stop_nn_indicies,
+        )
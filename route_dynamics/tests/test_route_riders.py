@@ -0,0 +1,288 @@
+""" Tests for the ridership tables, on small synthetic KCM style files
+    since the real ridership data is not shipped.
+"""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from ..route_elevation import base
+from ..route_riders import route_riders as ride
+
+shapefile = 'data/six_routes.shp'
+
+
+def write_ridership_csvs(data_dir, seed=0):
+    """ Trip183.csv and Zon183Unsum.csv for routes 45 and 7, both
+        directions and three periods, rows shuffled.
+        """
+    rng = np.random.default_rng(seed)
+    trips, stops = [], []
+    trip_id = 1000
+
+    for route in [45, 7]:
+        for in_out in ['I', 'O']:
+            for period in ['AM', 'MID', 'PM']:
+                for _ in range(3):
+                    trip_id += 1
+                    trips.append({
+                        'SignRt': route, 'InOut': in_out, 'KeyTrip': trip_id,
+                        'BusType': rng.choice([70, 26, 11]), 'Seats': 40,
+                        'Period': period, 'AnnRides': 100,
+                        })
+                    for seq in range(1, 9):
+                        stops.append({
+                            'Route': route, 'Dir': 'N', 'Trip_ID': trip_id,
+                            'InOut': in_out, 'STOP_SEQ': seq,
+                            'STOP_ID': 100*route + seq, 'Period': period,
+                            'AveOn': 1., 'AveOff': 1.,
+                            'AveLd': rng.uniform(0, 40), 'Obs': 1,
+                            })
+
+    stops = pd.DataFrame(stops).sample(frac=1, random_state=seed)
+    pd.DataFrame(trips).to_csv(str(data_dir / 'Trip183.csv'), index=False)
+    stops.to_csv(str(data_dir / 'Zon183Unsum.csv'), index=False)
+
+
+def write_stops_shapefile(data_dir):
+    """ Stops layer with 8 stops along each of routes 45 and 7 (STOP_ID
+        100*route + STOP_SEQ, as in write_ridership_csvs), some shared
+        with other routes, plus stops of other routes and with no
+        ROUTE_LIST.
+        """
+    rows = []
+    for route in [45, 7]:
+        coords = base.extract_point_array(base.read_shape(shapefile, route))
+        for seq in range(1, 9):
+            x, y = coords[seq * (len(coords) - 1) // 9]
+            rows.append({
+                'STOP_ID': 100*route + seq,
+                'ROUTE_LIST': '{} 450'.format(route) if seq % 2 else str(route),
+                'geometry': Point(x, y),
+                })
+    rows.append({'STOP_ID': 1, 'ROUTE_LIST': '450 745', 'geometry': Point(-122.3, 47.6)})
+    rows.append({'STOP_ID': 2, 'ROUTE_LIST': None, 'geometry': Point(-122.3, 47.6)})
+
+    filename = str(data_dir / ride.path.basename(ride.stops_shp))
+    gpd.GeoDataFrame(rows, crs='EPSG:4326').to_file(filename)
+    return filename
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    write_ridership_csvs(tmp_path)
+    write_stops_shapefile(tmp_path)
+    ride.configure(data_dir=str(tmp_path))
+    yield tmp_path
+    ride.configure(data_dir=ride.DEFAULT_DATA_DIR)
+
+
+def test_query_matches_full_scan(data_dir):
+    """ Indexed query returns the rows the old filter and sort did """
+    table = ride.trip183unsum
+
+    for key in [('PM', 'O', 45), ('AM', 'I', 7), ('MID', 'O', 7)]:
+        period, direction, route = key
+        scan = table[
+            (table.Period == period)
+            & (table.InOut == direction)
+            & (table.Route == route)
+            ].sort_values(by=['Trip_ID', 'STOP_SEQ', 'STOP_ID'])
+
+        final_df, riders_kept, mode_mass = ride.route_ridership(*key)
+
+        assert final_df.equals(scan)
+        assert len(riders_kept) == 8
+        assert mode_mass in ride.bus_mass.values()
+
+    assert ride.ridership_data().query('XNT', 'O', 45).empty
+
+
+def test_tables_load_once_and_reload_on_configure(data_dir, tmp_path_factory):
+    data = ride.ridership_data()
+    assert ride.ridership_data() is data
+    assert ride.trip_dict is data.trip_dict
+
+    other_dir = tmp_path_factory.mktemp('other')
+    write_ridership_csvs(other_dir, seed=1)
+    ride.configure(data_dir=str(other_dir))
+
+    assert ride.ridership_data() is not data
+
+
+def test_ridership_saved_and_reused(data_dir, monkeypatch):
+    data = ride.ridership_data()
+    assert ride.path.exists(ride.ridership_cache_file)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('ridership CSV parsed again')
+    monkeypatch.setattr(ride.pd, 'read_csv', fail)
+
+    reloaded = ride.RidershipData.from_csv(
+        ride.trip_csv, ride.zone_csv, ride.ridership_cache_file)
+    assert reloaded.trip_dict == data.trip_dict
+    assert reloaded.query('PM', 'O', 45).equals(data.query('PM', 'O', 45))
+
+    # An edited CSV is parsed again
+    monkeypatch.undo()
+    write_ridership_csvs(data_dir, seed=1)
+    stat = ride.os.stat(ride.zone_csv)
+    ride.os.utime(ride.zone_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    rebuilt = ride.RidershipData.from_csv(
+        ride.trip_csv, ride.zone_csv, ride.ridership_cache_file)
+    assert not rebuilt.dat2.equals(data.dat2)
+
+
+@pytest.mark.parametrize('contents', [b'', b'\x80\x04not a pickle', None])
+def test_bad_ridership_cache_is_rebuilt(data_dir, contents):
+    """ A cut short, unreadable or foreign cache file is a miss """
+    if contents is None:
+        pd.to_pickle(['not', 'a', 'cache'], ride.ridership_cache_file)
+    else:
+        with open(ride.ridership_cache_file, 'wb') as f:
+            f.write(contents)
+
+    data = ride.ridership_data()
+
+    assert len(data.trip_dict) == 36
+    saved = pd.read_pickle(ride.ridership_cache_file)
+    assert saved['dat2'].equals(data.dat2)
+    assert not [
+        name for name in ride.os.listdir(str(data_dir)) if name.endswith('.tmp')]
+
+
+def test_unknown_attribute_raises():
+    with pytest.raises(AttributeError):
+        ride.not_a_table
+
+
+def test_stop_index_matches_scan(data_dir):
+    """ Indexed lookup returns the stops the ROUTE_LIST scan found """
+    stops = gpd.read_file(ride.stops_shp)
+    route_lists = stops['ROUTE_LIST'].fillna('0')
+
+    for route in [45, 7, 450, 745, 9]:
+        rows = [
+            i for i in range(len(stops))
+            for token in route_lists[i].split(' ') if token == str(route)
+            ]
+        found = ride.stop_index().route_stops(route)
+
+        assert list(found['STOP_ID']) == list(stops['STOP_ID'].values[rows])
+        assert list(found['coordinates']) == [
+            (point.x, point.y) for point in stops.geometry.values[rows]]
+
+
+def test_stop_index_saved_and_reused(data_dir, monkeypatch):
+    index = ride.stop_index()
+    assert ride.path.exists(ride.stop_index_file)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('stops layer read again')
+    monkeypatch.setattr(ride.gpd, 'read_file', fail)
+
+    reloaded = ride.StopIndex.from_shapefile(ride.stops_shp, ride.stop_index_file)
+    assert reloaded.route_nums == index.route_nums
+
+
+def test_bad_stop_index_is_rebuilt(data_dir):
+    """ A cut short stop index file is rebuilt and replaced """
+    with open(ride.stop_index_file, 'wb') as f:
+        f.write(b'\x80\x04')
+
+    index = ride.stop_index()
+
+    assert len(index.route_stops(45)) == 8
+    reloaded = ride.StopIndex.from_shapefile(ride.stops_shp, ride.stop_index_file)
+    assert reloaded.stops.equals(index.stops)
+
+
+def test_stop_coord(data_dir):
+    _, riders_kept, _ = ride.route_ridership('PM', 'O', 45)
+    xy_df, df_combine = ride.stop_coord(45, riders_kept)
+
+    assert list(xy_df.columns) == ['STOP_ID', 'coordinates']
+    assert list(df_combine['STOP_ID']) == [4500 + seq for seq in range(1, 9)]
+    assert df_combine['coordinates'].notnull().all()
+
+
+def test_route_trip_energies(data_dir):
+    """ Per-trip energies match a RouteTrajectory per trip """
+    from ..route_energy import longi_dynam_model as ldm
+    from .test_elevation import write_synthetic_raster
+
+    rasterfile = write_synthetic_raster(
+        str(data_dir / 'dtm.tif'),
+        base.read_shape(shapefile, 45),
+        nodata_band=False,
+        )
+
+    energy_df = ride.route_trip_energies('AM', 'I', 45, rasterfile, shapefile)
+
+    final_df, riders_kept, _ = ride.route_ridership('AM', 'I', 45)
+    _, df_combine = ride.stop_coord(45, riders_kept)
+    stop_coords = list(df_combine['coordinates'])
+
+    assert list(energy_df.columns) == ['Trip_ID', 'BusMass', 'MeanLoad', 'Energy']
+    assert len(energy_df) == 3
+
+    for _, trip in energy_df.iterrows():
+        loads = final_df[final_df.Trip_ID == trip.Trip_ID].AveLd.values
+        trajectory = ldm.RouteTrajectory(
+            45,
+            shapefile,
+            rasterfile,
+            bus_speed_model='const_accel_between_stops_and_speed_lim',
+            stop_coords=stop_coords,
+            mass_array=trip.BusMass + ldm.PASSENGER_MASS*loads,
+            unloaded_bus_mass=trip.BusMass,
+            )
+        assert np.isclose(trip.Energy, trajectory.energy_from_route())
+
+
+def test_route_scenario_energies(data_dir):
+    """ Every period and direction with data, inbound from the reversed
+        outbound geometry
+        """
+    from ..route_energy.route_geometry import RouteGeometry
+    from .test_elevation import write_synthetic_raster
+    from .test_parameter_sweep import write_reversed_route
+
+    rasterfile = write_synthetic_raster(
+        str(data_dir / 'dtm.tif'),
+        base.read_shape(shapefile, 45),
+        nodata_band=False,
+        )
+    reversed_shp = write_reversed_route(str(data_dir / 'reversed.shp'), 45)
+
+    scenario_df = ride.route_scenario_energies(45, rasterfile, shapefile)
+
+    assert list(scenario_df.columns) == [
+        'Route', 'Period', 'InOut', 'Trip_ID', 'BusMass', 'MeanLoad', 'Energy']
+    # the synthetic data has no 'XEV' or 'XNT' trips
+    assert len(scenario_df) == 3 * 2 * 3
+    assert set(scenario_df.Period) == {'AM', 'MID', 'PM'}
+
+    outbound = ride.route_trip_energies('PM', 'O', 45, rasterfile, shapefile)
+    inbound = ride.route_trip_energies(
+        'PM', 'I', 45, rasterfile,
+        geometry=RouteGeometry.from_files(45, reversed_shp, rasterfile),
+        )
+    for direction, expected in [('O', outbound), ('I', inbound)]:
+        rows = scenario_df[
+            (scenario_df.Period == 'PM') & (scenario_df.InOut == direction)]
+        assert np.array_equal(rows.Trip_ID.values, expected.Trip_ID.values)
+        assert np.allclose(rows.Energy.values, expected.Energy.values)
+
+
+def test_mean_trip_loads(data_dir):
+    """ Stops and mean passenger mass in the form TripLibrary takes """
+    _, riders_kept, _ = ride.route_ridership('MID', 'I', 7)
+
+    stop_coords, payload = ride.mean_trip_loads('MID', 'I', 7)
+
+    assert len(stop_coords) == len(payload) == 8
+    assert np.allclose(payload, riders_kept['Mean'].values)
+    assert stop_coords == list(ride.stop_coord(7, riders_kept)[1]['coordinates'])
@@ -0,0 +1,87 @@
+""" Tests for the per-route partitioned route store """
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from ..route_elevation import base
+from ..route_elevation import route_store
+
+shapefile = 'data/six_routes.shp'
+route_list = [48, 50, 75, 7, 45, 40]
+
+
+def test_store_matches_read_shape(tmp_path):
+    """Test that routes loaded from a store on disk match read_shape"""
+    store = route_store.RouteStore.build(shapefile, str(tmp_path / 'store'))
+
+    assert sorted(store.route_nums) == sorted(route_list)
+
+    for route_num in [45, 7]:
+        from_store = store.load_route(route_num)
+        from_file = base.read_shape(shapefile, route_num)
+        assert from_store['ROUTE_NUM'].values[0] == route_num
+        assert from_store.geometry.values[0].equals(from_file.geometry.values[0])
+
+
+def test_read_shape_accepts_store():
+    """Test that read_shape and the downstream functions accept a store"""
+    store = route_store.RouteStore.from_shapefile(shapefile)
+    route_shp = base.read_shape(store, 45)
+
+    assert base.extract_point_df(route_shp).shape == (208, 1)
+    distance, _ = base.distance_measure(route_shp)
+    assert np.allclose(distance, base.distance_measure(base.read_shape(shapefile, 45))[0])
+
+
+def test_bulk_load_keeps_order(tmp_path):
+    """Test that the bulk loader returns routes in the order requested"""
+    store = route_store.RouteStore.from_shapefile(shapefile, str(tmp_path))
+    routes = store.load_routes([75, 7, 45])
+
+    assert list(routes) == [75, 7, 45]
+    assert all(
+        routes[route_num]['ROUTE_NUM'].values[0] == route_num
+        for route_num in routes
+        )
+
+
+def test_store_reopened_from_disk(tmp_path):
+    """Test that an up to date store is reopened rather than rebuilt"""
+    store_dir = str(tmp_path / 'store')
+    route_store.RouteStore.from_shapefile(shapefile, store_dir)
+    index_mtime = (tmp_path / 'store' / route_store.INDEX_FILENAME).stat().st_mtime_ns
+
+    store = route_store.RouteStore.from_shapefile(shapefile, store_dir)
+
+    assert (tmp_path / 'store' / route_store.INDEX_FILENAME).stat().st_mtime_ns == index_mtime
+    assert 45 in store
+
+
+def test_missing_route_raises():
+    store = route_store.RouteStore.from_shapefile(shapefile)
+    with pytest.raises(KeyError):
+        store.load_route(9999)
+
+
+
+def test_store_rebuilt_after_attribute_edit(tmp_path):
+    """Test that editing only the .dbf (route attributes) rebuilds the store"""
+    for ext in ['.shp', '.shx', '.dbf', '.prj']:
+        if os.path.exists('data/six_routes' + ext):
+            shutil.copy('data/six_routes' + ext, str(tmp_path / ('routes' + ext)))
+    copied = str(tmp_path / 'routes.shp')
+    store_dir = str(tmp_path / 'store')
+
+    route_store.RouteStore.from_shapefile(copied, store_dir)
+    index_file = tmp_path / 'store' / route_store.INDEX_FILENAME
+    index_mtime = index_file.stat().st_mtime_ns
+
+    dbf = str(tmp_path / 'routes.dbf')
+    stat = os.stat(dbf)
+    os.utime(dbf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    route_store.RouteStore.from_shapefile(copied, store_dir)
+
+    assert index_file.stat().st_mtime_ns != index_mtime
@@ -0,0 +1,91 @@
+""" Tests for the Sobol sensitivity of the route energy """
+from ..route_energy.compact_trajectory import batch_energy
+from ..route_energy import sensitivity as sa
+from ..route_energy.route_geometry import RouteGeometry
+from ..tests import simple_route as sro
+from ..tests.test_elevation import write_synthetic_raster
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+shapefile = 'data/six_routes.shp'
+
+
+@pytest.fixture(scope='module')
+def geometry():
+    return RouteGeometry.from_trajectory(sro.simple_const_a_instance())
+
+
+def test_saltelli_matrices():
+    bounds = {'x': (0., 1.), 'y': (10., 20.), 'z': (-1., 1.)}
+    A, B, AB = sa.saltelli_samples(bounds, 64, seed=0)
+
+    assert A.shape == B.shape == (64, 3)
+    assert AB.shape == (3, 64, 3)
+    assert np.all(B[:, 1] >= 10.) and np.all(B[:, 1] <= 20.)
+    for i in range(3):
+        assert np.array_equal(AB[i][:, i], B[:, i])
+        others = [j for j in range(3) if j != i]
+        assert np.array_equal(AB[i][:, others], A[:, others])
+
+
+def test_indices_of_additive_function():
+    """ f = x + 2y on the unit square; S1 = ST = (1/5, 4/5) """
+    A, B, AB = sa.saltelli_samples({'x': (0, 1), 'y': (0, 1)}, 4096, seed=1)
+
+    def f(X):
+        return X[..., 0] + 2*X[..., 1]
+
+    S1, ST = sa.sobol_indices(f(A), f(B), f(AB))
+
+    assert np.allclose(S1, [0.2, 0.8], atol=0.02)
+    assert np.allclose(ST, [0.2, 0.8], atol=0.02)
+
+
+def test_input_energy_matches_sweep(geometry):
+    inputs = pd.DataFrame({
+        'grade_scale': [1., 1., 1.],
+        'mass': [12927., 15000., 20000.],
+        'v_lim': [15., 10., 12.],
+        'a_m': [1., 0.5, 1.2],
+        'charging_power_max': [0., 5e4, 1e5],
+        })
+
+    energy = sa.input_energy(geometry, inputs, max_chunk_elements=80)
+
+    for i, row in inputs.iterrows():
+        expected = batch_energy(
+            geometry, row.mass, a_m=row.a_m, v_lim=row.v_lim,
+            charging_power_max=row.charging_power_max)
+        assert np.isclose(energy[i], expected)
+
+    steeper = sa.input_energy(geometry, inputs.assign(grade_scale=2.))
+    assert np.all(steeper > energy)
+
+
+def test_route_sensitivity(geometry):
+    indices = sa.route_sensitivity(geometry, num_base=512, seed=0)
+
+    assert list(indices.index) == list(sa.DEFAULT_BOUNDS)
+    assert np.all(indices.ST >= -0.05)
+    assert np.all(indices.ST >= indices.S1 - 0.05)
+    # Climbing a 2% grade, the mass is what matters most
+    assert indices.ST.idxmax() == 'mass'
+
+
+def test_network_sensitivity_same_with_processes(tmp_path):
+    rasterfile = write_synthetic_raster(
+        str(tmp_path / 'dtm.tif'),
+        gpd.read_file(shapefile),
+        nodata_band=False,
+        )
+    args = ([45, 7], shapefile, rasterfile)
+
+    serial = sa.network_sensitivity(*args, num_base=64, seed=3)
+    pooled = sa.network_sensitivity(*args, num_base=64, seed=3, processes=2)
+
+    assert list(serial.columns) == ['Route', 'input', 'S1', 'ST']
+    assert len(serial) == 2 * len(sa.DEFAULT_BOUNDS)
+    assert serial.equals(pooled)
@@ -3,13 +3,16 @@ since they need the 1Gb rasterfile
 """
 
 import folium
+import os
 import matplotlib.pyplot as plt
+import pytest
 from os import path
 import sys
 sys.path.append(path.abspath('..'))
 
 from ..route_elevation import base
 from ..route_elevation import single_route
+from ..tests.test_elevation import write_synthetic_raster
 
 shapefile = '../data/six_routes.shp'
 rasterfile = '../data/seattle_dtm.tif'
@@ -87,3 +90,70 @@ rasterfile = '../data/seattle_dtm.tif'
 
 #     return
 
+
+
+@pytest.fixture
+def synthetic_raster(tmp_path):
+    """ Synthetic raster standing in for the 1Gb DTM """
+    return write_synthetic_raster(
+        str(tmp_path / 'dtm.tif'),
+        base.read_shape('data/six_routes.shp', 45),
+        nodata_band=False,
+        )
+
+
+def test_route_context_computes_gradient_once(synthetic_raster, monkeypatch):
+    """
+    Map, profile, dataframe and metrics of one route share a single build.
+    """
+    single_route.clear_route_contexts()
+    data_shapefile = 'data/six_routes.shp'
+
+    calls = {'read_shape': 0, 'gradient': 0}
+    read_shape, gradient = base.read_shape, base.gradient
+
+    def counting_read_shape(*args):
+        calls['read_shape'] += 1
+        return read_shape(*args)
+
+    def counting_gradient(*args):
+        calls['gradient'] += 1
+        return gradient(*args)
+
+    monkeypatch.setattr(base, 'read_shape', counting_read_shape)
+    monkeypatch.setattr(base, 'gradient', counting_gradient)
+
+    map_display = single_route.route_analysis_map(45, data_shapefile, synthetic_raster)
+    single_route.route_analysis_profile(45, data_shapefile, synthetic_raster)
+    gdf_route = single_route.route_analysis_df(45, data_shapefile, synthetic_raster)
+    display_metrics = single_route.route_analysis_metrics(45, data_shapefile, synthetic_raster)
+    plt.close('all')
+
+    assert calls == {'read_shape': 1, 'gradient': 1}
+    assert type(map_display) == folium.folium.Map
+    assert len(gdf_route) == 208
+    assert type(display_metrics) == str
+
+
+def test_route_context_per_route(synthetic_raster):
+    """
+    Different routes get different contexts, the same route the same one.
+    """
+    single_route.clear_route_contexts()
+    context_45 = single_route.RouteContext.get(45, 'data/six_routes.shp', synthetic_raster)
+
+    assert single_route.RouteContext.get(45, 'data/six_routes.shp', synthetic_raster) is context_45
+    assert single_route.RouteContext.get(7, 'data/six_routes.shp', synthetic_raster) is not context_45
+
+
+def test_route_context_rebuilt_after_file_edit(synthetic_raster):
+    """
+    Editing the raster (or a shapefile part) gives a new context.
+    """
+    single_route.clear_route_contexts()
+    context = single_route.RouteContext.get(45, 'data/six_routes.shp', synthetic_raster)
+
+    stat = os.stat(synthetic_raster)
+    os.utime(synthetic_raster, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert single_route.RouteContext.get(45, 'data/six_routes.shp', synthetic_raster) is not context
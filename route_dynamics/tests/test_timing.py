@@ -0,0 +1,104 @@
+""" Tests for the stage timing hooks """
+import numpy as np
+import pytest
+
+from .. import timing
+from ..route_elevation import base
+from ..route_energy import longi_dynam_model as ldm
+from .test_elevation import write_synthetic_raster
+
+shapefile = 'data/six_routes.shp'
+route_num = 45
+
+
+@pytest.fixture(scope='module')
+def rasterfile(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('raster') / 'synthetic_dtm.tif')
+    route_shp = base.read_shape(shapefile, route_num)
+    return write_synthetic_raster(filename, route_shp, nodata_band=False)
+
+
+def test_stages_count_calls_and_nest():
+    """Test that calls accumulate and outer stages include inner ones"""
+    timer = timing.StageTimer()
+
+    @timing.timed('inner')
+    def inner():
+        return sum(range(10000))
+
+    with timer.activate():
+        with timing.stage('outer'):
+            inner()
+            inner()
+
+    timings = timer.timings
+    assert list(timings) == ['inner', 'outer']
+    assert timings['inner']['calls'] == 2
+    assert timings['outer']['calls'] == 1
+    assert timings['outer']['wall_time'] >= timings['inner']['wall_time'] > 0
+    assert timings['outer']['peak_memory'] is None
+
+
+def test_no_active_timer_records_nothing():
+    timer = timing.StageTimer()
+    with timing.stage('untimed'):
+        pass
+    assert timing.active_timer() is None
+    assert timer.timings == {}
+
+
+@pytest.mark.parametrize('has_reset_peak', [True, False])
+def test_peak_memory_and_callback(has_reset_peak, monkeypatch):
+    """Test that nested peaks are attributed to both stages and that the
+    callback sees every stage, also without tracemalloc.reset_peak"""
+    if not has_reset_peak:
+        monkeypatch.delattr(timing.tracemalloc, 'reset_peak', raising=False)
+    calls = []
+    timer = timing.StageTimer(
+        trace_memory=True,
+        callback=lambda *args: calls.append(args),
+        )
+
+    with timer.activate():
+        with timing.stage('outer'):
+            with timing.stage('allocate'):
+                block = np.ones(2**20)
+            del block
+            with timing.stage('small'):
+                pass
+
+    timings = timer.timings
+    assert timings['allocate']['peak_memory'] >= 8 * 2**20
+    assert timings['outer']['peak_memory'] >= timings['allocate']['peak_memory']
+    assert timings['small']['peak_memory'] < 2**20
+    assert [name for name, _, _ in calls] == ['allocate', 'small', 'outer']
+
+
+def test_route_trajectory_timings(rasterfile):
+    """Test that a RouteTrajectory build reports each pipeline stage"""
+    calls = []
+    stop_coords = list(base.extract_point_array(
+        base.read_shape(shapefile, route_num))[::20])
+
+    trajectory = ldm.RouteTrajectory(
+        route_num,
+        shapefile,
+        rasterfile,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=stop_coords,
+        mass_array=[13000]*len(stop_coords),
+        timing_callback=lambda name, *args: calls.append(name),
+        )
+
+    for stage in [
+        'read_shape', 'point_query', 'distance_measure', 'knn',
+        'const_a_dynamics', 'calculate_mass', 'forces', 'power',
+        'build_route_coordinate_df', 'dynamics', 'total',
+        ]:
+        assert trajectory.timings[stage]['calls'] == 1, stage
+
+    assert calls[-1] == 'total'
+    assert trajectory.timings['total']['wall_time'] >= (
+        trajectory.timings['build_route_coordinate_df']['wall_time']
+        + trajectory.timings['dynamics']['wall_time']
+        )
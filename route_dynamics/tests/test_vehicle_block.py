@@ -0,0 +1,155 @@
+""" Tests for the vehicle block state of charge simulation """
+from ..route_elevation import base
+from ..route_energy import vehicle_block as vb
+from ..route_energy.compact_trajectory import CompactRouteTrajectory
+from ..route_energy.route_geometry import RouteGeometry
+from .test_elevation import write_synthetic_raster
+
+import numpy as np
+import pytest
+
+shapefile = 'data/six_routes.shp'
+bus_mass = {'40ft': 12927., '60ft': 19600.}
+
+
+@pytest.fixture(scope='module')
+def library(tmp_path_factory):
+    rasterfile = write_synthetic_raster(
+        str(tmp_path_factory.mktemp('raster') / 'dtm.tif'),
+        base.read_shape(shapefile, 45),
+        nodata_band=False,
+        )
+    return vb.TripLibrary(shapefile, rasterfile, bus_mass=bus_mass)
+
+
+def test_soc_trace_stops_at_full():
+    """ Regen past a full battery is lost, later use counts from full """
+    cum_energy = np.array([0., -2., -5., -3., 1., -1.])
+
+    soc = vb.soc_trace(0.97, cum_energy, 100.)
+
+    assert np.allclose(soc, [0.97, 0.99, 1., 0.98, 0.94, 0.96])
+
+
+def test_single_leg_matches_trajectory(library):
+    geometry = RouteGeometry.from_files(45, shapefile, library.elv_raster_filename)
+    trajectory = CompactRouteTrajectory(
+        geometry,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        unloaded_bus_mass=bus_mass['40ft'],
+        )
+    leg = vb.BlockLeg(45, 'O', 'AM', '40ft', 0., 0.)
+
+    result = vb.simulate_block([leg], library, battery_capacity=300.)
+    soc = vb.soc_trace(1., trajectory.cum_energy, 300. * vb.KWH)
+
+    assert np.isclose(result.trip_energy, trajectory.energy_from_route())
+    assert np.isclose(result.min_soc, soc.min())
+    assert np.isclose(result.final_soc, soc[-1])
+    assert np.array_equal(result.time[:-1], trajectory.route_time)
+
+
+def test_inbound_is_reversed_outbound(library):
+    outbound = library.geometry(45, 'O')
+    inbound = library.geometry(45, 'I')
+
+    assert np.array_equal(inbound.coordinates, outbound.coordinates[::-1])
+    assert library.geometry(45, 'I') is inbound
+
+
+def test_layover_charging(library):
+    """ Charging is linear in time and stops at full """
+    trip_energy = library.trace(45, 'O', 'AM', '60ft').cum_energy[-1]
+    capacity = 300. * vb.KWH
+    power = trip_energy / 600.
+
+    short = vb.simulate_block(
+        [(45, 'O', 'AM', '60ft', 300., power)], library, 300., initial_soc=0.5)
+    long = vb.simulate_block(
+        [(45, 'O', 'AM', '60ft', 2400., power)], library, 300., initial_soc=0.9)
+
+    trip_end = 0.5 - library.trace(45, 'O', 'AM', '60ft').cum_energy[-1] / capacity
+    assert np.isclose(short.final_soc, trip_end + 0.5 * trip_energy / capacity)
+    assert np.isclose(short.charged_energy, 0.5 * trip_energy)
+
+    assert long.final_soc == 1.
+    assert long.soc[-2] == 1.
+    assert long.time[-2] < long.time[-1]
+    assert np.isclose(long.charged_energy, (1. - long.soc[-3]) * capacity)
+
+
+def test_trips_are_computed_once(library):
+    legs = [
+        (45, 'O', 'PM', '40ft', 600., 0.),
+        (45, 'I', 'PM', '40ft', 600., 1.5e5),
+        ] * 3
+    computed = len(library)
+
+    summary, results = vb.simulate_blocks(
+        {'a': legs, 'b': legs[:2], 'c': legs[2:]},
+        library,
+        battery_capacity=300.,
+        min_soc_reserve=0.2,
+        )
+
+    assert len(library) == computed + 2
+    assert list(summary['block']) == ['a', 'b', 'c']
+    assert list(summary['legs']) == [6, 2, 4]
+    assert summary['feasible'].all()
+    assert set(results['a'].leg) == set(range(6))
+    assert np.isclose(results['a'].min_soc, summary['min_soc'][0])
+    assert np.isclose(results['b'].trip_energy * 2, results['c'].trip_energy)
+
+    _, results = vb.simulate_blocks([legs], library, 300., keep_curves=False)
+    assert results == {}
+
+
+def test_trip_loads(library):
+    """ Loads add mass at the stops given by 'trip_loads' """
+    coords = library.geometry(45, 'O').coordinates
+    stop_coords = [tuple(coords[i]) for i in [0, 50, 100, 150]]
+
+    def trip_loads(period, direction, route):
+        assert (period, direction, route) == ('AM', 'O', 45)
+        return stop_coords, np.array([800., 1600., 400., 0.])
+
+    loaded = vb.TripLibrary(
+        library.shp_filename,
+        library.elv_raster_filename,
+        bus_mass=bus_mass,
+        trip_loads=trip_loads,
+        )
+    trajectory = CompactRouteTrajectory(
+        library.geometry(45, 'O').with_stops(stop_coords),
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        mass_array=bus_mass['40ft'] + np.array([800., 1600., 400., 0.]),
+        unloaded_bus_mass=bus_mass['40ft'],
+        )
+
+    trace = loaded.trace(45, 'O', 'AM', '40ft')
+
+    assert np.allclose(trace.cum_energy, trajectory.cum_energy, equal_nan=True)
+
+
+def test_block_time_never_runs_backwards(library):
+    """ Trips with closely spaced stops chain into one increasing clock """
+    coords = library.geometry(45, 'O').coordinates
+    stop_coords = [tuple(coords[i]) for i in range(0, len(coords), 3)]
+
+    def trip_loads(period, direction, route):
+        return stop_coords, np.full(len(stop_coords), 800.)
+
+    loaded = vb.TripLibrary(
+        library.shp_filename,
+        library.elv_raster_filename,
+        bus_mass=bus_mass,
+        trip_loads=trip_loads,
+        )
+    legs = [(45, 'O', 'AM', '40ft', 300., 1e5), (45, 'I', 'AM', '60ft', 0., 0.)]
+
+    result = vb.simulate_block(legs * 2, loaded, battery_capacity=300.)
+
+    assert np.all(np.diff(result.time) >= 0)
+    trace = loaded.trace(45, 'O', 'AM', '40ft')
+    assert trace.time[0] == 0.
+    assert np.isclose(result.time[result.leg == 1][0], trace.time[-1] + 300.)
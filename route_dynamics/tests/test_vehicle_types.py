@@ -0,0 +1,86 @@
+""" Tests for the vehicle parameter table and route x vehicle energies """
+from ..route_energy import longi_dynam_model as ldm
+from ..route_energy import vehicle_types as vt
+from ..route_energy.compact_trajectory import batch_energy
+from ..route_energy.route_geometry import RouteGeometry
+from ..route_riders import route_riders
+from ..tests import simple_route as sro
+from ..tests.test_elevation import write_synthetic_raster
+
+import geopandas as gpd
+import numpy as np
+import pytest
+
+shapefile = 'data/six_routes.shp'
+
+route_coords = [(0, 20.*i) for i in range(40)]
+stop_coords = [(0.5, 100.), (0, 400.), (1, 650.)]
+
+
+def test_vehicle_table_covers_kcm_bus_types():
+    vehicles = vt.vehicle_table()
+
+    assert list(vehicles.index) == list(route_riders.bus_mass)
+    assert list(vehicles.columns) == vt.VEHICLE_COLUMNS
+    assert np.array_equal(
+        vehicles['mass'].values, list(route_riders.bus_mass.values()))
+    assert vehicles.loc[70, 'body'] == 'standard'
+    assert vehicles.loc[11, 'body'] == 'short'
+    assert vehicles.loc[26, 'body'] == 'articulated'
+
+    with pytest.raises(ldm.IllegalArgumentError):
+        vt.vehicle_table({1: 13000.}, vt.BODY_CLASSES.iloc[:1])
+
+
+def test_standard_bus_matches_route_trajectory():
+    """ The 40 foot body is the one RouteTrajectory models """
+    vehicles = vt.vehicle_table({70: 12927.})
+    mass_array = [14000, 15000, 13000]
+
+    instance = sro.SimpleRouteTrajectory(
+        route_coords=route_coords,
+        bus_speed_model='const_accel_between_stops_and_speed_lim',
+        stop_coords=stop_coords,
+        elevation_gradient_const=0.02,
+        mass_array=mass_array,
+        unloaded_bus_mass=12927,
+        charging_power_max=vehicles.loc[70, 'charging_power_max'],
+        )
+    geometry = RouteGeometry.from_trajectory(instance)
+
+    energy = vt.vehicle_energy(
+        geometry, vehicles, payload=np.array(mass_array) - 12927.)
+
+    assert energy.shape == (1,)
+    assert np.isclose(energy[0], instance.energy_from_route())
+
+
+def test_route_vehicle_matrix_matches_per_vehicle(tmp_path):
+    """ Each entry equals batch_energy run for that vehicle alone """
+    rasterfile = write_synthetic_raster(
+        str(tmp_path / 'dtm.tif'),
+        gpd.read_file(shapefile),
+        nodata_band=False,
+        )
+    vehicles = vt.vehicle_table()
+
+    matrix = vt.route_vehicle_energy([45, 7], shapefile, rasterfile, vehicles)
+
+    assert matrix.shape == (2, len(vehicles))
+    assert list(matrix.index) == [45, 7]
+
+    geometry = RouteGeometry.from_files(7, shapefile, rasterfile).with_stops(None)
+    for bus_type in [11, 43, 96]:
+        vehicle = vehicles.loc[bus_type]
+        expected = batch_energy(
+            geometry,
+            vehicle['mass'] * np.ones((1, geometry.num_pts)),
+            charging_power_max=vehicle['charging_power_max'],
+            bus_front_area=vehicle['bus_front_area'],
+            drag_coeff=vehicle['drag_coeff'],
+            fric_coeff=vehicle['fric_coeff'],
+            )
+        assert np.isclose(matrix.loc[7, bus_type], expected[0])
+
+    # Heavier buses of the same body use more energy
+    assert matrix.loc[45, 43] > matrix.loc[45, 70]
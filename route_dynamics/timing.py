@@ -0,0 +1,212 @@
+""" Stage level timing of the route pipelines.
+
+    Functions along the RouteTrajectory build (reading the shapefile,
+    sampling the raster, geodesic distances, stop matching, the speed
+    model, mass and forces) mark themselves as stages with 'timed' or
+    'stage'. While a 'StageTimer' is active they record wall time, call
+    counts and, optionally, tracemalloc peak memory into it; with no
+    active timer they cost one attribute lookup.
+
+    RouteTrajectory activates a timer for its own build and keeps the
+    results as its 'timings' attribute. To time anything else;
+
+        timer = StageTimer(trace_memory=True, callback=send_to_metrics)
+        with timer.activate():
+            base.gradient(route_shp, rasterfile)
+        timer.timings
+    """
+import functools
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# Timers active in the current thread, innermost last.
+_local = threading.local()
+
+
+def _active_timers():
+    if not hasattr(_local, 'timers'):
+        _local.timers = []
+    return _local.timers
+
+
+def active_timer():
+    """ The innermost active StageTimer of this thread, or None. """
+
+    timers = _active_timers()
+    return timers[-1] if timers else None
+
+
+def _reset_peak():
+    """ Resets the tracemalloc peak to the memory in use. Returns the
+        amount the traced memory counters were moved down by: 0, or on
+        Python < 3.9 (no reset_peak) the memory in use, since clearing
+        the traces restarts the counters at zero.
+        """
+
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+        return 0
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.clear_traces()
+    return current
+
+
+class StageTimer(object):
+    """ Wall time, call counts and peak memory per named stage.
+
+        Stages may nest; each stage's time includes the stages it calls.
+        """
+
+    def __init__(self, trace_memory=False, callback=None):
+        """
+            Args:
+                trace_memory: also record the tracemalloc peak of each
+                    stage, in bytes above the memory in use when the
+                    stage started. Starts tracemalloc while the timer is
+                    active if it is not already running.
+                callback: called as callback(stage, wall_time,
+                    peak_memory) at the end of every stage, e.g. to
+                    send the numbers to a metrics system. 'peak_memory'
+                    is None unless 'trace_memory' is set.
+            """
+
+        self.trace_memory = trace_memory
+        self.callback = callback
+
+        self._stages = OrderedDict()
+        # (start memory, peak above start seen so far) of the open stages.
+        self._memory_stack = []
+
+    def reset(self):
+        self._stages.clear()
+
+    @property
+    def timings(self):
+        """ Dict of stage name to {'calls', 'wall_time', 'peak_memory'},
+            in the order the stages first ran. Times are in seconds,
+            memory in bytes (None when not traced).
+            """
+
+        return OrderedDict(
+            (name, dict(record)) for name, record in self._stages.items()
+            )
+
+    @contextmanager
+    def activate(self):
+        """ Records the stages run inside the 'with' block. """
+
+        started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+
+        timers = _active_timers()
+        timers.append(self)
+        try:
+            yield self
+        finally:
+            timers.remove(self)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def _enter_memory(self):
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            # Keep the enclosing stage's peak before resetting it.
+            start, outer_peak = self._memory_stack[-1]
+            self._memory_stack[-1] = (start, max(outer_peak, peak - start))
+
+        offset = _reset_peak()
+        if offset:
+            # The counters restarted at zero; move the open stages' start
+            # memory down with them.
+            self._memory_stack = [
+                (start - offset, stage_peak)
+                for start, stage_peak in self._memory_stack
+                ]
+        self._memory_stack.append((current - offset, 0))
+
+    def _exit_memory(self):
+
+        _, peak = tracemalloc.get_traced_memory()
+        start, stage_peak = self._memory_stack.pop()
+        stage_peak = max(stage_peak, peak - start)
+        if self._memory_stack:
+            outer_start, outer_peak = self._memory_stack[-1]
+            self._memory_stack[-1] = (
+                outer_start,
+                max(outer_peak, start - outer_start + stage_peak),
+                )
+
+        return stage_peak
+
+    @contextmanager
+    def stage(self, name):
+        """ Times the 'with' block as stage 'name'. """
+
+        trace_memory = self.trace_memory and tracemalloc.is_tracing()
+        if trace_memory:
+            self._enter_memory()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+            peak_memory = self._exit_memory() if trace_memory else None
+            self._record(name, wall_time, peak_memory)
+
+    def _record(self, name, wall_time, peak_memory):
+
+        record = self._stages.setdefault(
+            name,
+            {'calls': 0, 'wall_time': 0., 'peak_memory': None},
+            )
+        record['calls'] += 1
+        record['wall_time'] += wall_time
+        if peak_memory is not None:
+            record['peak_memory'] = max(record['peak_memory'] or 0, peak_memory)
+
+        if self.callback is not None:
+            self.callback(name, wall_time, peak_memory)
+
+
+@contextmanager
+def _untimed():
+    yield
+
+
+def stage(name):
+    """ Context manager timing its block as stage 'name' in the active
+        timer, if there is one.
+        """
+
+    timer = active_timer()
+    if timer is None:
+        return _untimed()
+
+    return timer.stage(name)
+
+
+def timed(name):
+    """ Decorator timing every call of a function as stage 'name'. """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = active_timer()
+            if timer is None:
+                return func(*args, **kwargs)
+            with timer.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
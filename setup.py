@@ -7,5 +7,6 @@ setup(
         author_email='123@uw.edu',  
         url='https://github.com/EricaEgg/Route_Dynamics',     
         packages=['route_dynamics'],
+        python_requires='>=3.7',
         package_dir={"project" : 'route_dynamics'}
 )